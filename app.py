@@ -8,6 +8,7 @@ from datetime import datetime, timedelta, date
 import os
 import json
 import uuid
+from collections import namedtuple
 from functools import wraps
 from flask_migrate import Migrate
 from models import Cours, db, User, Eleve, Evenement, Annonce, Inscription, Contact, ResultatAdmission, Newsletter
@@ -20,7 +21,7 @@ from modules.presence import presence_blueprint
 from modules.notes import notes_blueprint
 from modules.finances import finances_blueprint
 from modules.rapports import rapports_blueprint
-from modules.calendrier import calendrier_blueprint
+from modules.calendrier import calendrier_blueprint, a_venir
 from modules.communication import communication_blueprint
 from modules.inscriptions import inscriptions_blueprint
 from modules.news import news_blueprint
@@ -30,23 +31,42 @@ from modules.admin import admin_blueprint
 from modules.articles import articles_bp
 from modules.resultats_admission import resultats_admission_bp
 from modules.doleances import doleances_blueprint
+from modules.jobs import jobs_blueprint, jobs_cli
+from modules.parents import parents_blueprint
+from modules.archivage_annuel import annee_cli
+from modules.export_analytique import export_cli
+from modules.syndication import syndication_bp, flux_cli
+from modules.audit import audit_bp
+from modules.emploi_du_temps import emploi_du_temps_bp, emploi_cli
+
+from modules.database import init_database, check_engine_settings
+from modules import user_cache
+from modules.page_cache import cached_page, fragment
+from modules.assets import init_assets
+from modules.rate_limit import init_rate_limit
+from modules.newsletter import lire_jeton, desabonner
 
 # Configuration
 from config import Config
 
 app = Flask(__name__)
 app.config.from_object(Config)
+# {% break %} is used by presence/rapport_resultats.html
+app.jinja_env.add_extension('jinja2.ext.loopcontrols')
 migrate = Migrate(app, db)
 
 # Initialize extensions
-db.init_app(app)
+init_database(app, db)
+check_engine_settings(app, db)
 bcrypt = Bcrypt(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'auth.login'
+init_assets(app)
+init_rate_limit(app)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.load_user(user_id)
 
 # Register blueprints
 app.register_blueprint(auth_blueprint)
@@ -66,9 +86,15 @@ app.register_blueprint(admin_blueprint)
 app.register_blueprint(articles_bp)
 app.register_blueprint(resultats_admission_bp)
 app.register_blueprint(doleances_blueprint)
+app.register_blueprint(jobs_blueprint)
+app.register_blueprint(parents_blueprint)
+app.register_blueprint(syndication_bp)
+app.register_blueprint(audit_bp)
+app.register_blueprint(emploi_du_temps_bp)
 
 # Home route
 @app.route('/')
+@cached_page(tags=('accueil',))
 def accueil():
     # Get some stats for the homepage using SQLAlchemy
     
@@ -76,9 +102,7 @@ def accueil():
     total_eleves = Eleve.query.filter_by(actif=True).count()
     
     # Get upcoming events
-    from datetime import date
-    today = date.today()
-    evenements = Evenement.query.filter(Evenement.date >= today).order_by(Evenement.date).limit(5).all()
+    evenements = a_venir(5)
     
     # Get recent announcements
     annonces = Annonce.query.order_by(Annonce.date_creation.desc()).limit(5).all()
@@ -86,14 +110,17 @@ def accueil():
     return render_template('website/accueil.html', total_eleves=total_eleves, upcoming_events=evenements, recent_announcements=annonces)
 
 @app.route('/a-propos')
+@cached_page()
 def a_propos():
     return render_template('website/a-propos.html')
 
 @app.route('/programmes')
+@cached_page()
 def programmes():
     return render_template('website/programmes.html')
 
 @app.route('/equipe')
+@cached_page()
 def equipe():
     return render_template('website/team.html')
 
@@ -139,6 +166,7 @@ def admission():
 
 
 @app.route('/evenements')
+@cached_page(tags=('evenements',))
 def evenements():
     from models import Article
     categorie = request.args.get('categorie')
@@ -151,10 +179,12 @@ def evenements():
     return render_template('website/events.html', articles=articles, categorie_active=categorie)
 
 @app.route('/gallery')
+@cached_page()
 def gallery():
     return render_template('website/gallery.html')
 
 @app.route('/temoignages')
+@cached_page()
 def temoignages():
     return render_template('website/temoignages.html')
 
@@ -163,6 +193,7 @@ def payment():
     return render_template('website/payment.html')
 
 @app.route('/credits')
+@cached_page()
 def credits():
     return render_template('credits.html')
 
@@ -219,6 +250,9 @@ def newsletter_subscribe():
                 # Reactivate subscription
                 existing.actif = True
                 existing.date_inscription = datetime.now()
+                existing.date_desabonnement = None
+                existing.motif_desactivation = None
+                existing.nombre_echecs = 0
                 db.session.commit()
                 return jsonify({'success': True, 'message': 'Votre abonnement a été réactivé avec succès!'})
         
@@ -233,6 +267,24 @@ def newsletter_subscribe():
         db.session.rollback()
         return jsonify({'success': False, 'message': f'Une erreur est survenue: {str(e)}'}), 500
 
+@app.route('/newsletter/desabonnement/<jeton>', methods=['GET', 'POST'])
+def newsletter_desabonnement(jeton):
+    """Unsubscribe link of the newsletter emails (POST: one-click from the mail client)"""
+    abonne_id = lire_jeton(jeton)
+    abonne = db.session.get(Newsletter, abonne_id) if abonne_id else None
+    if abonne is None:
+        if request.method == 'POST' and 'List-Unsubscribe' in request.form:
+            return '', 404
+        return render_template('website/newsletter_desabonnement.html', abonne=None), 404
+
+    if request.method == 'POST':
+        desabonner(abonne.id)
+        if 'List-Unsubscribe' in request.form:
+            return '', 204
+        return render_template('website/newsletter_desabonnement.html', abonne=abonne, desabonne=True)
+
+    return render_template('website/newsletter_desabonnement.html', abonne=abonne, desabonne=not abonne.actif)
+
 
 
 
@@ -401,16 +453,11 @@ def api_cours():
         print("DEBUG: Invalid class_id provided")
         return jsonify([])
     
-    from models import Enseignement, Cours, db
+    from modules import reference_data
     
-    # Query the database to get courses for the selected class
+    # Courses for the selected class come from the reference data cache
     try:
-        # Join Enseignement and Cours tables to get courses for the selected class
-        courses = db.session.query(Cours).join(
-            Enseignement, Cours.id == Enseignement.cours_id
-        ).filter(
-            Enseignement.classe_id == classe_id_int
-        ).order_by(Cours.nom).all()
+        courses = reference_data.cours_de_classe(classe_id_int)
         
         print(f"DEBUG: Found {len(courses)} courses for class {classe_id}")
         
@@ -441,67 +488,25 @@ def server_error(e):
     return render_template('erreurs/500.html'), 500
 
 # Context processor for common data
+# Lightweight copy of an announcement for the ticker of base.html (cached across requests)
+AnnonceTicker = namedtuple('AnnonceTicker', 'id titre important date_creation')
+
+def _annonces_ticker():
+    annonces = Annonce.query.filter(
+        Annonce.public == 1,
+        (Annonce.date_expiration.is_(None)) | (Annonce.date_expiration >= date.today())
+    ).order_by(Annonce.important.desc(), Annonce.date_creation.desc()).limit(10).all()
+    return tuple(AnnonceTicker(a.id, a.titre, a.important, a.date_creation) for a in annonces)
+
 @app.context_processor
 def inject_data():
     current_year = datetime.now().year
     school_name = "École Presbytérale Saint Joseph de L'Asile"
     
-    # Get recent public announcements for the ticker
+    # Recent public announcements for the ticker
     annonces = None
     try:
-        print("DEBUG: Fetching announcements for ticker")
-        # Check if the important field exists in the Annonce model
-        has_important_field = hasattr(Annonce, 'important')
-        print(f"DEBUG: has_important_field = {has_important_field}")
-        
-        # Count total announcements in the database
-        total_annonces = Annonce.query.count()
-        print(f"DEBUG: Total announcements in database: {total_annonces}")
-        
-        # Count public announcements
-        public_count = Annonce.query.filter(Annonce.public == 1).count()
-        print(f"DEBUG: Public announcements count: {public_count}")
-        
-        # Base query for public announcements that are not expired
-        # Using is_() instead of == for None comparison as recommended by SQLAlchemy
-        base_query = Annonce.query.filter(
-            Annonce.public == 1,
-            (Annonce.date_expiration.is_(None)) | (Annonce.date_expiration >= date.today())
-        )
-        
-        # Check SQL generated
-        print(f"DEBUG: SQL Query: {str(base_query)}")
-        
-        # Order by importance if the field exists, otherwise just by date
-        if has_important_field:
-            # Using SQLite integer for boolean (1 for True, 0 for False)
-            annonces = base_query.order_by(Annonce.important.desc(), Annonce.date_creation.desc()).limit(10).all()
-        else:
-            annonces = base_query.order_by(Annonce.date_creation.desc()).limit(10).all()
-            
-        print(f"DEBUG: Found {len(annonces) if annonces else 0} announcements for ticker")
-        if annonces:
-            for i, a in enumerate(annonces):
-                # Show raw SQLite values (0/1) for boolean fields
-                print(f"DEBUG: Announcement {i+1}: id={a.id}, title={a.titre}, public={a.public} (raw: {int(a.public)}), important={a.important if has_important_field else 'N/A'} (raw: {int(a.important) if has_important_field else 'N/A'})")
-        else:
-            print("DEBUG: No announcements found. This could be due to:")  
-            print("  1. No announcements in the database")
-            print("  2. No public announcements (public=1)")
-            print("  3. All announcements are expired")
-            print("  4. Boolean value mismatch between Python (True/False) and SQLite (1/0)")
-            print("DEBUG: Try running a direct query on the database to check raw values:")  
-            print("  SELECT id, titre, public, important, date_expiration FROM annonces;")
-            print("DEBUG: If public=1 announcements exist but aren't showing, check date_expiration values.")
-            print(f"DEBUG: Today's date for comparison: {date.today()}")
-            
-            # Try a simpler query just to see if any public announcements exist
-            simple_query = Annonce.query.filter(Annonce.public == 1).all()
-            print(f"DEBUG: Simple query (just public=1) found {len(simple_query)} announcements")
-            if simple_query:
-                for i, a in enumerate(simple_query):
-                    print(f"DEBUG: Simple query result {i+1}: id={a.id}, title={a.titre}, date_expiration={a.date_expiration}")
-                print("DEBUG: If announcements appear here but not in the ticker, the date_expiration filter is excluding them")
+        annonces = fragment('annonces_ticker', _annonces_ticker, tags=('annonces',))
     except Exception as e:
         print(f"Error fetching announcements for context: {str(e)}")
     
@@ -520,6 +525,18 @@ def nl2br_filter(s):
         return ''
     return s.replace('\n', '<br>\n')
 
+@app.cli.command('db-check')
+def db_check():
+    """Affiche les paramètres effectifs du moteur de base de données"""
+    for name, value in check_engine_settings(app, db).items():
+        print(f"{name}: {value}")
+
+app.cli.add_command(jobs_cli)
+app.cli.add_command(annee_cli)
+app.cli.add_command(export_cli)
+app.cli.add_command(flux_cli)
+app.cli.add_command(emploi_cli)
+
 # Note: before_first_request is deprecated in newer Flask versions
 # We'll use app.app_context() and create tables directly when the app starts
 
@@ -16,6 +16,82 @@ class Config:
         'sqlite:///' + os.path.join(os.path.dirname(os.path.abspath(__file__)), 'epsjl.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Database engine profile (see modules/database.py)
+    # 'production': WAL journal, tuned pragmas and pool sizing - 'default': SQLAlchemy defaults
+    DB_ENGINE_PROFILE = os.environ.get('DB_ENGINE_PROFILE') or 'production'
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS') or 15000)
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 256 * 1024 * 1024)  # 256MB
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB') or 64 * 1024)  # 64MB per connection
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 5)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 10)
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT') or 30)
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE') or 1800)
+    
+    # Shared cache files (version counters, precomputed blobs) - see modules/cache.py
+    CACHE_DIR = os.environ.get('CACHE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'cache')
+    
+    # Seconds a logged-in user's identity is reused without a query (see modules/user_cache.py)
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL') or 30)
+    
+    # Maximum age in seconds of a cached parent dashboard (see modules/parents.py)
+    PARENT_DASHBOARD_TTL = int(os.environ.get('PARENT_DASHBOARD_TTL') or 600)
+    
+    # One SQLite file per closed school year (see modules/archivage_annuel.py, `flask annee cloturer`)
+    ARCHIVES_ANNUELLES_DIR = os.environ.get('ARCHIVES_ANNUELLES_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'archives_annuelles')
+    
+    # Public page cache (see modules/page_cache.py)
+    PAGE_CACHE_ENABLED = os.environ.get('PAGE_CACHE_ENABLED', '1') not in ('0', 'false', 'False')
+    PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL') or 300)
+    PAGE_CACHE_BROWSER_TTL = int(os.environ.get('PAGE_CACHE_BROWSER_TTL') or 60)
+    PAGE_CACHE_MAX_ENTRIES = int(os.environ.get('PAGE_CACHE_MAX_ENTRIES') or 500)
+    
+    # Background jobs (see modules/jobs.py, run with `flask jobs worker`)
+    JOB_RESULTS_DIR = os.environ.get('JOB_RESULTS_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'jobs')
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL') or 2)
+    JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS') or 600)
+    JOB_RETRY_DELAY = int(os.environ.get('JOB_RETRY_DELAY') or 30)
+    JOB_MAX_TENTATIVES = int(os.environ.get('JOB_MAX_TENTATIVES') or 3)
+    
+    # Newsletter campaigns (see modules/newsletter.py)
+    # SITE_URL builds the absolute unsubscribe links of emails sent by the workers
+    SITE_URL = os.environ.get('SITE_URL') or 'http://localhost:5000'
+    NEWSLETTER_SMTP_CONNEXIONS = int(os.environ.get('NEWSLETTER_SMTP_CONNEXIONS') or 3)
+    NEWSLETTER_DEBIT = float(os.environ.get('NEWSLETTER_DEBIT', 10))  # messages per second overall, 0 = unlimited
+    NEWSLETTER_MESSAGES_PAR_CONNEXION = int(os.environ.get('NEWSLETTER_MESSAGES_PAR_CONNEXION') or 100)
+    NEWSLETTER_MAX_ECHECS = int(os.environ.get('NEWSLETTER_MAX_ECHECS') or 3)
+    
+    # News ticker feed (see modules/news_feed.py)
+    # Push (long-poll / Server-Sent Events) keeps a worker thread per client: threaded or gevent workers only
+    NEWS_PUSH_ENABLED = os.environ.get('NEWS_PUSH_ENABLED', '0') not in ('0', 'false', 'False')
+    NEWS_LONG_POLL_TIMEOUT = int(os.environ.get('NEWS_LONG_POLL_TIMEOUT') or 25)
+    NEWS_STREAM_DURATION = int(os.environ.get('NEWS_STREAM_DURATION') or 300)
+    NEWS_PUSH_INTERVAL = float(os.environ.get('NEWS_PUSH_INTERVAL') or 1)
+    
+    # Rate limiting of the public forms (see modules/rate_limit.py)
+    # 'shared': buckets in CACHE_DIR, common to all workers of the host - 'memory': per process
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') not in ('0', 'false', 'False')
+    RATE_LIMIT_STORAGE = os.environ.get('RATE_LIMIT_STORAGE') or 'shared'
+    # endpoint: (limit per IP, limit for all clients)
+    RATE_LIMITS = {
+        'contact': ('5/hour', '120/hour'),
+        'newsletter_subscribe': ('5/hour', '300/hour'),
+        'admission': ('3/hour', '60/hour'),
+        'doleances.formulaire': ('5/hour', '60/hour'),
+        'inscriptions.formulaire': ('3/hour', '60/hour'),
+        # Lookups are served from memory: no global cap, it would lock everyone out on publication day
+        'resultats_admission.consulter': ('20/10 minutes', None),
+    }
+    
+    # Timetable (see modules/emploi_du_temps.py): days of the week taught and their slots, 'HH:MM-HH:MM'
+    EMPLOI_DU_TEMPS_JOURS = int(os.environ.get('EMPLOI_DU_TEMPS_JOURS') or 5)  # 5 = Monday to Friday
+    EMPLOI_DU_TEMPS_CRENEAUX = (os.environ.get('EMPLOI_DU_TEMPS_CRENEAUX') or
+                                '07:30-08:20,08:20-09:10,09:10-10:00,10:20-11:10,11:10-12:00,'
+                                '12:00-12:50,13:30-14:20,14:20-15:10').split(',')
+    
+    # Audit log (see modules/audit.py): buffered entries are written every AUDIT_DELAI seconds, 0 = at commit
+    AUDIT_DELAI = float(os.environ.get('AUDIT_DELAI', 2))
+    AUDIT_TAILLE_LOT = int(os.environ.get('AUDIT_TAILLE_LOT') or 200)
+    
     # Session settings
     PERMANENT_SESSION_LIFETIME = timedelta(days=1)
     
@@ -0,0 +1,49 @@
+"""Add indexed lookup key to admission results
+
+Revision ID: 2e6a8c4f1d39
+Revises: 9c1d3f5a7b20
+Create Date: 2026-10-20 09:14:27.630915
+
+"""
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2e6a8c4f1d39'
+down_revision = '9c1d3f5a7b20'
+branch_labels = None
+depends_on = None
+
+
+def _cle(nom_complet, date_naissance):
+    # Same rule as models.cle_recherche_admission at the time of this revision
+    texte = unicodedata.normalize('NFKD', nom_complet or '')
+    texte = ''.join(c for c in texte if not unicodedata.combining(c)).casefold()
+    texte = ''.join(c if c.isalnum() else ' ' for c in texte)
+    if date_naissance is not None and not isinstance(date_naissance, str):
+        date_naissance = date_naissance.isoformat()
+    return f"{' '.join(texte.split())}|{(date_naissance or '')[:10]}"
+
+
+def upgrade():
+    with op.batch_alter_table('resultats_admission', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('cle_recherche', sa.String(length=220), nullable=True))
+        batch_op.create_index(batch_op.f('ix_resultats_admission_cle_recherche'), ['cle_recherche'], unique=False)
+
+    conn = op.get_bind()
+    resultats = sa.table('resultats_admission', sa.column('id', sa.Integer), sa.column('nom_complet', sa.String),
+                         sa.column('date_naissance', sa.Date), sa.column('cle_recherche', sa.String))
+    valeurs = [{'_id': i, 'cle': _cle(nom, naissance)} for i, nom, naissance in
+               conn.execute(sa.select(resultats.c.id, resultats.c.nom_complet, resultats.c.date_naissance))]
+    if valeurs:
+        conn.execute(resultats.update().where(resultats.c.id == sa.bindparam('_id'))
+                     .values(cle_recherche=sa.bindparam('cle')), valeurs)
+
+
+def downgrade():
+    with op.batch_alter_table('resultats_admission', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_resultats_admission_cle_recherche'))
+        batch_op.drop_column('cle_recherche')
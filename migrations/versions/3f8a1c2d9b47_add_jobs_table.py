@@ -0,0 +1,50 @@
+"""Add jobs table
+
+Revision ID: 3f8a1c2d9b47
+Revises: c269b7c6131a
+Create Date: 2026-10-19 19:05:12.118402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8a1c2d9b47'
+down_revision = 'c269b7c6131a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('type', sa.String(length=100), nullable=False),
+        sa.Column('statut', sa.String(length=20), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=True),
+        sa.Column('resultat', sa.Text(), nullable=True),
+        sa.Column('fichier_resultat', sa.String(length=255), nullable=True),
+        sa.Column('erreur', sa.Text(), nullable=True),
+        sa.Column('progression', sa.Integer(), nullable=True),
+        sa.Column('message', sa.String(length=255), nullable=True),
+        sa.Column('tentatives', sa.Integer(), nullable=True),
+        sa.Column('max_tentatives', sa.Integer(), nullable=True),
+        sa.Column('worker', sa.String(length=100), nullable=True),
+        sa.Column('executer_apres', sa.DateTime(), nullable=True),
+        sa.Column('date_creation', sa.DateTime(), nullable=True),
+        sa.Column('date_debut', sa.DateTime(), nullable=True),
+        sa.Column('date_heartbeat', sa.DateTime(), nullable=True),
+        sa.Column('date_fin', sa.DateTime(), nullable=True),
+        sa.Column('cree_par', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['cree_par'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        batch_op.create_index('ix_jobs_statut_executer_apres', ['statut', 'executer_apres'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        batch_op.drop_index('ix_jobs_statut_executer_apres')
+
+    op.drop_table('jobs')
@@ -0,0 +1,43 @@
+"""Add recurrence rules to events
+
+Revision ID: 4d8b1e6f2a95
+Revises: 7a4e2c9b1f60
+Create Date: 2026-10-19 18:52:07.316402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d8b1e6f2a95'
+down_revision = '7a4e2c9b1f60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('evenements', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('recurrence', sa.String(length=20), nullable=True))
+        batch_op.add_column(sa.Column('intervalle', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('recurrence_jusqu_au', sa.Date(), nullable=True))
+        batch_op.add_column(sa.Column('recurrence_nombre', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('recurrence_exceptions', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('date_fin', sa.Date(), nullable=True))
+
+    # Existing events are single dates: their period is that date
+    op.execute('UPDATE evenements SET date_fin = date, intervalle = 1')
+
+    with op.batch_alter_table('evenements', schema=None) as batch_op:
+        batch_op.create_index('ix_evenements_periode', ['date_fin', 'date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('evenements', schema=None) as batch_op:
+        batch_op.drop_index('ix_evenements_periode')
+        batch_op.drop_column('date_fin')
+        batch_op.drop_column('recurrence_exceptions')
+        batch_op.drop_column('recurrence_nombre')
+        batch_op.drop_column('recurrence_jusqu_au')
+        batch_op.drop_column('intervalle')
+        batch_op.drop_column('recurrence')
@@ -0,0 +1,44 @@
+"""Add student timeline indexes
+
+Revision ID: 5b7c9e2f4a18
+Revises: 8d2e4b6a1f53
+Create Date: 2026-10-19 22:31:08.402177
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7c9e2f4a18'
+down_revision = '8d2e4b6a1f53'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('presences', schema=None) as batch_op:
+        batch_op.create_index('ix_presences_eleve_date', ['eleve_id', 'date', 'id'], unique=False)
+
+    with op.batch_alter_table('notes', schema=None) as batch_op:
+        batch_op.create_index('ix_notes_eleve_date', ['eleve_id', 'date', 'id'], unique=False)
+
+    with op.batch_alter_table('paiements', schema=None) as batch_op:
+        batch_op.create_index('ix_paiements_eleve_date', ['eleve_id', 'date', 'id'], unique=False)
+
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.create_index('ix_documents_eleve_date_creation', ['eleve_id', 'date_creation', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.drop_index('ix_documents_eleve_date_creation')
+
+    with op.batch_alter_table('paiements', schema=None) as batch_op:
+        batch_op.drop_index('ix_paiements_eleve_date')
+
+    with op.batch_alter_table('notes', schema=None) as batch_op:
+        batch_op.drop_index('ix_notes_eleve_date')
+
+    with op.batch_alter_table('presences', schema=None) as batch_op:
+        batch_op.drop_index('ix_presences_eleve_date')
@@ -0,0 +1,54 @@
+"""Store the rendered HTML, excerpt and reading time of articles and announcements
+
+Revision ID: 7a4e2c9b1f60
+Revises: 2e6a8c4f1d39
+Create Date: 2026-10-20 14:02:51.408263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# The renderer is too large to copy here: rows are rendered with the current rules
+from modules.rendu_contenu import rendre_contenu
+
+
+# revision identifiers, used by Alembic.
+revision = '7a4e2c9b1f60'
+down_revision = '2e6a8c4f1d39'
+branch_labels = None
+depends_on = None
+
+TABLES = ('articles', 'annonces')
+
+
+def upgrade():
+    for nom in TABLES:
+        with op.batch_alter_table(nom, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('contenu_html', sa.Text(), nullable=True))
+            batch_op.add_column(sa.Column('extrait', sa.String(length=300), nullable=True))
+            batch_op.add_column(sa.Column('temps_lecture', sa.Integer(), nullable=True))
+            batch_op.add_column(sa.Column('contenu_hash', sa.String(length=64), nullable=True))
+
+    conn = op.get_bind()
+    for nom in TABLES:
+        table = sa.table(nom, sa.column('id', sa.Integer), sa.column('contenu', sa.Text),
+                         sa.column('contenu_html', sa.Text), sa.column('extrait', sa.String),
+                         sa.column('temps_lecture', sa.Integer), sa.column('contenu_hash', sa.String))
+        valeurs = []
+        for i, contenu in conn.execute(sa.select(table.c.id, table.c.contenu)):
+            rendu = rendre_contenu(contenu)
+            valeurs.append({'_id': i, 'html': rendu.html, 'ext': rendu.extrait,
+                            'temps': rendu.temps_lecture, 'hash': rendu.empreinte})
+        if valeurs:
+            conn.execute(table.update().where(table.c.id == sa.bindparam('_id')).values(
+                contenu_html=sa.bindparam('html'), extrait=sa.bindparam('ext'),
+                temps_lecture=sa.bindparam('temps'), contenu_hash=sa.bindparam('hash')), valeurs)
+
+
+def downgrade():
+    for nom in TABLES:
+        with op.batch_alter_table(nom, schema=None) as batch_op:
+            batch_op.drop_column('contenu_hash')
+            batch_op.drop_column('temps_lecture')
+            batch_op.drop_column('extrait')
+            batch_op.drop_column('contenu_html')
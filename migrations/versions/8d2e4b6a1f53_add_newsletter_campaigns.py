@@ -0,0 +1,67 @@
+"""Add newsletter campaigns and delivery tracking
+
+Revision ID: 8d2e4b6a1f53
+Revises: 3f8a1c2d9b47
+Create Date: 2026-10-19 21:42:37.560914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2e4b6a1f53'
+down_revision = '3f8a1c2d9b47'
+branch_labels = None
+depends_on = None
+
+# SQLite rebuilds the table to add the foreign key: the reflected unnamed
+# constraints (unique email) need a name for the copy
+naming_convention = {
+    'uq': 'uq_%(table_name)s_%(column_0_name)s',
+    'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s',
+}
+
+
+def upgrade():
+    op.create_table('campagnes_newsletter',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('sujet', sa.String(length=200), nullable=False),
+        sa.Column('contenu', sa.Text(), nullable=False),
+        sa.Column('statut', sa.String(length=20), nullable=True),
+        sa.Column('nombre_destinataires', sa.Integer(), nullable=True),
+        sa.Column('nombre_envoyes', sa.Integer(), nullable=True),
+        sa.Column('nombre_echecs', sa.Integer(), nullable=True),
+        sa.Column('date_creation', sa.DateTime(), nullable=True),
+        sa.Column('date_envoi', sa.DateTime(), nullable=True),
+        sa.Column('date_fin', sa.DateTime(), nullable=True),
+        sa.Column('job_id', sa.Integer(), nullable=True),
+        sa.Column('cree_par', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['cree_par'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['job_id'], ['jobs.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('newsletters', schema=None, naming_convention=naming_convention) as batch_op:
+        batch_op.add_column(sa.Column('statut_envoi', sa.String(length=20), nullable=True))
+        batch_op.add_column(sa.Column('dernier_envoi', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('derniere_campagne_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('nombre_echecs', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('derniere_erreur', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('date_desabonnement', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('motif_desactivation', sa.String(length=20), nullable=True))
+        batch_op.create_foreign_key('fk_newsletters_derniere_campagne', 'campagnes_newsletter',
+                                    ['derniere_campagne_id'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('newsletters', schema=None, naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint('fk_newsletters_derniere_campagne', type_='foreignkey')
+        batch_op.drop_column('motif_desactivation')
+        batch_op.drop_column('date_desabonnement')
+        batch_op.drop_column('derniere_erreur')
+        batch_op.drop_column('nombre_echecs')
+        batch_op.drop_column('derniere_campagne_id')
+        batch_op.drop_column('dernier_envoi')
+        batch_op.drop_column('statut_envoi')
+
+    op.drop_table('campagnes_newsletter')
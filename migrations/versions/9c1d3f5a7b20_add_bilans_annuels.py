@@ -0,0 +1,42 @@
+"""Add yearly student summaries
+
+Revision ID: 9c1d3f5a7b20
+Revises: 5b7c9e2f4a18
+Create Date: 2026-10-19 23:12:44.518306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c1d3f5a7b20'
+down_revision = '5b7c9e2f4a18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('bilans_annuels',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('eleve_id', sa.Integer(), nullable=False),
+    sa.Column('annee_scolaire', sa.String(length=9), nullable=False),
+    sa.Column('nombre_notes', sa.Integer(), nullable=True),
+    sa.Column('moyenne_t1', sa.Float(), nullable=True),
+    sa.Column('moyenne_t2', sa.Float(), nullable=True),
+    sa.Column('moyenne_t3', sa.Float(), nullable=True),
+    sa.Column('moyenne_annuelle', sa.Float(), nullable=True),
+    sa.Column('nombre_presences', sa.Integer(), nullable=True),
+    sa.Column('nombre_absences', sa.Integer(), nullable=True),
+    sa.Column('nombre_retards', sa.Integer(), nullable=True),
+    sa.Column('nombre_paiements', sa.Integer(), nullable=True),
+    sa.Column('total_paye', sa.Float(), nullable=True),
+    sa.Column('date_cloture', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['eleve_id'], ['eleves.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('eleve_id', 'annee_scolaire', name='uq_bilans_annuels_eleve_annee')
+    )
+
+
+def downgrade():
+    op.drop_table('bilans_annuels')
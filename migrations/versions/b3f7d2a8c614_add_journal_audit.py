@@ -0,0 +1,55 @@
+"""Add the append-only audit log
+
+Revision ID: b3f7d2a8c614
+Revises: 4d8b1e6f2a95
+Create Date: 2026-10-19 20:14:41.207583
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f7d2a8c614'
+down_revision = '4d8b1e6f2a95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('journal_audit',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.DateTime(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('utilisateur', sa.String(length=100), nullable=True),
+    sa.Column('action', sa.String(length=20), nullable=False),
+    sa.Column('entite', sa.String(length=50), nullable=False),
+    sa.Column('entite_id', sa.Integer(), nullable=True),
+    sa.Column('changements', sa.Text(), nullable=True),
+    sa.Column('source', sa.String(length=100), nullable=True),
+    sa.Column('adresse_ip', sa.String(length=45), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('journal_audit', schema=None) as batch_op:
+        batch_op.create_index('ix_journal_audit_date', ['date', 'id'], unique=False)
+        batch_op.create_index('ix_journal_audit_user_date', ['user_id', 'date', 'id'], unique=False)
+        batch_op.create_index('ix_journal_audit_entite_date', ['entite', 'entite_id', 'date', 'id'], unique=False)
+
+    # Append-only, also for statements that do not go through the ORM
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("CREATE TRIGGER journal_audit_sans_modification BEFORE UPDATE ON journal_audit "
+                   "BEGIN SELECT RAISE(ABORT, 'journal_audit est en ajout seul'); END")
+        op.execute("CREATE TRIGGER journal_audit_sans_suppression BEFORE DELETE ON journal_audit "
+                   "BEGIN SELECT RAISE(ABORT, 'journal_audit est en ajout seul'); END")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS journal_audit_sans_suppression')
+        op.execute('DROP TRIGGER IF EXISTS journal_audit_sans_modification')
+    with op.batch_alter_table('journal_audit', schema=None) as batch_op:
+        batch_op.drop_index('ix_journal_audit_entite_date')
+        batch_op.drop_index('ix_journal_audit_user_date')
+        batch_op.drop_index('ix_journal_audit_date')
+
+    op.drop_table('journal_audit')
@@ -0,0 +1,62 @@
+"""Add weekly hours, teacher unavailability and generated timetable
+
+Revision ID: e5a1c8d3b972
+Revises: b3f7d2a8c614
+Create Date: 2026-10-19 22:05:12.480391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a1c8d3b972'
+down_revision = 'b3f7d2a8c614'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('enseignements', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('heures_hebdo', sa.Integer(), nullable=True))
+    op.execute('UPDATE enseignements SET heures_hebdo = 0')
+
+    op.create_table('indisponibilites_professeurs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('professeur_id', sa.Integer(), nullable=False),
+    sa.Column('jour', sa.Integer(), nullable=False),
+    sa.Column('creneau', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['professeur_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('professeur_id', 'jour', 'creneau', name='uq_indisponibilites_professeur_creneau')
+    )
+    op.create_table('seances',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('enseignement_id', sa.Integer(), nullable=False),
+    sa.Column('classe_id', sa.Integer(), nullable=False),
+    sa.Column('cours_id', sa.Integer(), nullable=False),
+    sa.Column('professeur_id', sa.Integer(), nullable=False),
+    sa.Column('annee_scolaire', sa.String(length=9), nullable=False),
+    sa.Column('jour', sa.Integer(), nullable=False),
+    sa.Column('creneau', sa.Integer(), nullable=False),
+    sa.Column('salle', sa.String(length=20), nullable=True),
+    sa.ForeignKeyConstraint(['enseignement_id'], ['enseignements.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['classe_id'], ['classes.id'], ),
+    sa.ForeignKeyConstraint(['cours_id'], ['cours.id'], ),
+    sa.ForeignKeyConstraint(['professeur_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('classe_id', 'jour', 'creneau', name='uq_seances_classe_creneau'),
+    sa.UniqueConstraint('professeur_id', 'annee_scolaire', 'jour', 'creneau', name='uq_seances_professeur_creneau')
+    )
+    with op.batch_alter_table('seances', schema=None) as batch_op:
+        batch_op.create_index('ix_seances_enseignement', ['enseignement_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('seances', schema=None) as batch_op:
+        batch_op.drop_index('ix_seances_enseignement')
+
+    op.drop_table('seances')
+    op.drop_table('indisponibilites_professeurs')
+    with op.batch_alter_table('enseignements', schema=None) as batch_op:
+        batch_op.drop_column('heures_hebdo')
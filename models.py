@@ -1,6 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
+import unicodedata
+from sqlalchemy import event
+from modules.rendu_contenu import rendre_contenu, empreinte_contenu
+from modules.recurrence import derniere_occurrence
 
 # Initialize SQLAlchemy
 db = SQLAlchemy()
@@ -88,6 +92,7 @@ class Enseignement(db.Model):
     classe_id = db.Column(db.Integer, db.ForeignKey('classes.id'), nullable=False)
     professeur_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     annee_scolaire = db.Column(db.String(9), nullable=False)
+    heures_hebdo = db.Column(db.Integer, default=0)  # heures par semaine, placées par modules/emploi_du_temps.py
     
     # Relationships
     classe = db.relationship('Classe', backref=db.backref('enseignements', lazy=True))
@@ -111,6 +116,11 @@ class Presence(db.Model):
     eleve = db.relationship('Eleve', backref=db.backref('presences', lazy=True))
     cours = db.relationship('Cours', backref=db.backref('presences', lazy=True))
     
+    # Historique d'un élève (modules/timeline.py)
+    __table_args__ = (
+        db.Index('ix_presences_eleve_date', 'eleve_id', 'date', 'id'),
+    )
+    
     def __repr__(self):
         return f'<Presence {self.eleve.matricule} - {self.date} - {self.statut}>'
 
@@ -132,6 +142,10 @@ class Note(db.Model):
     eleve = db.relationship('Eleve', backref=db.backref('notes', lazy=True))
     cours = db.relationship('Cours', backref=db.backref('notes', lazy=True))
     
+    __table_args__ = (
+        db.Index('ix_notes_eleve_date', 'eleve_id', 'date', 'id'),
+    )
+    
     def __repr__(self):
         return f'<Note {self.eleve.matricule} - {self.cours.code} - {self.valeur}/{self.sur}>'
 
@@ -154,6 +168,10 @@ class Paiement(db.Model):
     recepteur = db.relationship('User', backref=db.backref('paiements_recus', lazy=True))
     frais = db.relationship('Frais', backref=db.backref('paiements', lazy=True))
     
+    __table_args__ = (
+        db.Index('ix_paiements_eleve_date', 'eleve_id', 'date', 'id'),
+    )
+    
     def __repr__(self):
         return f'<Paiement {self.eleve.matricule} - {self.montant} - {self.frais.type if self.frais else "N/A"}>'
 
@@ -170,6 +188,17 @@ class Evenement(db.Model):
     lieu = db.Column(db.String(100))
     type = db.Column(db.String(50))  # réunion, fête, examen, etc.
     cree_par = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # Répétition (voir modules/recurrence.py): une seule ligne pour toute la série
+    recurrence = db.Column(db.String(20))  # None, hebdomadaire, mensuelle
+    intervalle = db.Column(db.Integer, default=1)
+    recurrence_jusqu_au = db.Column(db.Date)
+    recurrence_nombre = db.Column(db.Integer)
+    recurrence_exceptions = db.Column(db.Text)  # dates ISO séparées par des virgules
+    date_fin = db.Column(db.Date)  # dernière occurrence possible, calculée à l'enregistrement
+    
+    __table_args__ = (
+        db.Index('ix_evenements_periode', 'date_fin', 'date'),
+    )
     
     # Relationships
     createur = db.relationship('User', backref=db.backref('evenements', lazy=True))
@@ -188,8 +217,11 @@ class Annonce(db.Model):
     date_expiration = db.Column(db.Date)
     public = db.Column(db.Boolean, default=True)
     important = db.Column(db.Boolean, default=False)
-    
-
+    # Rendu du contenu, calculé à l'enregistrement (voir modules/rendu_contenu.py)
+    contenu_html = db.Column(db.Text)
+    extrait = db.Column(db.String(300))
+    temps_lecture = db.Column(db.Integer)
+    contenu_hash = db.Column(db.String(64))
     
     def __repr__(self):
         return f'<Annonce {self.titre}>'
@@ -211,6 +243,10 @@ class Document(db.Model):
     createur = db.relationship('User', backref=db.backref('documents', lazy=True))
     eleve = db.relationship('Eleve', backref=db.backref('documents', lazy=True))
     
+    __table_args__ = (
+        db.Index('ix_documents_eleve_date_creation', 'eleve_id', 'date_creation', 'id'),
+    )
+    
     def __repr__(self):
         return f'<Document {self.titre}>'
 
@@ -341,6 +377,11 @@ class Article(db.Model):
     date_creation = db.Column(db.DateTime, default=datetime.now)
     date_modification = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
     vues = db.Column(db.Integer, default=0)
+    # Rendu du contenu, calculé à l'enregistrement (voir modules/rendu_contenu.py)
+    contenu_html = db.Column(db.Text)
+    extrait = db.Column(db.String(300))
+    temps_lecture = db.Column(db.Integer)
+    contenu_hash = db.Column(db.String(64))
     
     # Relationships
     auteur = db.relationship('User', backref=db.backref('articles', lazy=True))
@@ -377,6 +418,8 @@ class ResultatAdmission(db.Model):
     date_soumission = db.Column(db.DateTime, default=datetime.now)
     publie = db.Column(db.Boolean, default=False)
     notes_admin = db.Column(db.Text)
+    # Nom sans accents ni casse + date de naissance, tenu à jour à chaque écriture (voir cle_recherche_admission)
+    cle_recherche = db.Column(db.String(220), index=True)
     
     def __repr__(self):
         return f'<ResultatAdmission {self.nom_complet} - {self.type_examen}>'
@@ -393,6 +436,37 @@ class ResultatAdmission(db.Model):
             'publie': self.publie
         }
 
+def cle_recherche_admission(nom_complet, date_naissance):
+    """'  Jean-Pierre  DUPONT ', 2010-05-04 -> 'jean pierre dupont|2010-05-04' (accents, casse, tirets et espaces ignorés)"""
+    texte = unicodedata.normalize('NFKD', nom_complet or '')
+    texte = ''.join(c for c in texte if not unicodedata.combining(c)).casefold()
+    texte = ''.join(c if c.isalnum() else ' ' for c in texte)
+    return f"{' '.join(texte.split())}|{date_naissance.isoformat() if date_naissance else ''}"
+
+@event.listens_for(ResultatAdmission, 'before_insert')
+@event.listens_for(ResultatAdmission, 'before_update')
+def _maj_cle_recherche(mapper, connection, resultat):
+    resultat.cle_recherche = cle_recherche_admission(resultat.nom_complet, resultat.date_naissance)
+
+@event.listens_for(Evenement, 'before_insert')
+@event.listens_for(Evenement, 'before_update')
+def _maj_date_fin(mapper, connection, evenement):
+    if evenement.recurrence and not evenement.recurrence_jusqu_au and not evenement.recurrence_nombre:
+        evenement.recurrence_jusqu_au = derniere_occurrence(evenement.date, evenement.recurrence)
+    evenement.date_fin = derniere_occurrence(evenement.date, evenement.recurrence, evenement.intervalle,
+                                             evenement.recurrence_jusqu_au, evenement.recurrence_nombre)
+
+@event.listens_for(Article, 'before_insert')
+@event.listens_for(Article, 'before_update')
+@event.listens_for(Annonce, 'before_insert')
+@event.listens_for(Annonce, 'before_update')
+def _rendre_contenu(mapper, connection, cible):
+    # Rendered again only when the text changed (not for a view counter or a flag)
+    if cible.contenu_html is None or cible.contenu_hash != empreinte_contenu(cible.contenu):
+        rendu = rendre_contenu(cible.contenu)
+        cible.contenu_html, cible.extrait = rendu.html, rendu.extrait
+        cible.temps_lecture, cible.contenu_hash = rendu.temps_lecture, rendu.empreinte
+
 
 
 # Archive Dossier model (pour la gestion des dossiers d'archives)
@@ -472,6 +546,14 @@ class Newsletter(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     date_inscription = db.Column(db.DateTime, default=datetime.now)
     actif = db.Column(db.Boolean, default=True)
+    # Suivi des envois (voir modules/newsletter.py)
+    statut_envoi = db.Column(db.String(20))  # envoye, echec, rebond
+    dernier_envoi = db.Column(db.DateTime)
+    derniere_campagne_id = db.Column(db.Integer, db.ForeignKey('campagnes_newsletter.id'))
+    nombre_echecs = db.Column(db.Integer, default=0)
+    derniere_erreur = db.Column(db.String(255))
+    date_desabonnement = db.Column(db.DateTime)
+    motif_desactivation = db.Column(db.String(20))  # desabonnement, rebond, admin
     
     def __repr__(self):
         return f'<Newsletter {self.email}>'
@@ -481,9 +563,35 @@ class Newsletter(db.Model):
             'id': self.id,
             'email': self.email,
             'date_inscription': self.date_inscription.strftime('%Y-%m-%d %H:%M') if self.date_inscription else None,
-            'actif': self.actif
+            'actif': self.actif,
+            'statut_envoi': self.statut_envoi,
+            'dernier_envoi': self.dernier_envoi.strftime('%Y-%m-%d %H:%M') if self.dernier_envoi else None,
+            'motif_desactivation': self.motif_desactivation
         }
 
+# CampagneNewsletter model (un envoi de la newsletter à tous les abonnés actifs)
+class CampagneNewsletter(db.Model):
+    __tablename__ = 'campagnes_newsletter'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    sujet = db.Column(db.String(200), nullable=False)
+    contenu = db.Column(db.Text, nullable=False)
+    statut = db.Column(db.String(20), default='brouillon')  # brouillon, en_cours, terminee, echec
+    nombre_destinataires = db.Column(db.Integer, default=0)
+    nombre_envoyes = db.Column(db.Integer, default=0)
+    nombre_echecs = db.Column(db.Integer, default=0)
+    date_creation = db.Column(db.DateTime, default=datetime.now)
+    date_envoi = db.Column(db.DateTime)
+    date_fin = db.Column(db.DateTime)
+    job_id = db.Column(db.Integer, db.ForeignKey('jobs.id'))
+    cree_par = db.Column(db.Integer, db.ForeignKey('users.id'))
+    
+    # Relationship
+    createur = db.relationship('User', backref=db.backref('campagnes_newsletter', lazy=True))
+    
+    def __repr__(self):
+        return f'<CampagneNewsletter {self.id}: {self.sujet}>'
+
 # Doleance model (pour les doléances/plaintes)
 class Doleance(db.Model):
     __tablename__ = 'doleances'
@@ -523,3 +631,150 @@ class Doleance(db.Model):
             'date_traitement': self.date_traitement.strftime('%Y-%m-%d %H:%M') if self.date_traitement else None,
             'reponse_admin': self.reponse_admin
         }
+
+# Job model (tâches de fond exécutées par `flask jobs worker`, voir modules/jobs.py)
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(100), nullable=False)
+    statut = db.Column(db.String(20), nullable=False, default='en_attente')  # en_attente, en_cours, termine, echec
+    payload = db.Column(db.Text)  # JSON
+    resultat = db.Column(db.Text)  # JSON
+    fichier_resultat = db.Column(db.String(255))
+    erreur = db.Column(db.Text)
+    progression = db.Column(db.Integer, default=0)  # 0-100
+    message = db.Column(db.String(255))
+    tentatives = db.Column(db.Integer, default=0)
+    max_tentatives = db.Column(db.Integer, default=3)
+    worker = db.Column(db.String(100))
+    executer_apres = db.Column(db.DateTime, default=datetime.now)
+    date_creation = db.Column(db.DateTime, default=datetime.now)
+    date_debut = db.Column(db.DateTime)
+    date_heartbeat = db.Column(db.DateTime)
+    date_fin = db.Column(db.DateTime)
+    cree_par = db.Column(db.Integer, db.ForeignKey('users.id'))
+    
+    # Relationship
+    createur = db.relationship('User', backref=db.backref('jobs', lazy=True))
+    
+    __table_args__ = (
+        db.Index('ix_jobs_statut_executer_apres', 'statut', 'executer_apres'),
+    )
+    
+    def __repr__(self):
+        return f'<Job {self.id}: {self.type} ({self.statut})>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'type': self.type,
+            'statut': self.statut,
+            'progression': self.progression or 0,
+            'message': self.message,
+            'erreur': self.erreur,
+            'tentatives': self.tentatives,
+            'max_tentatives': self.max_tentatives,
+            'fichier_resultat': bool(self.fichier_resultat),
+            'date_creation': self.date_creation.strftime('%Y-%m-%d %H:%M:%S') if self.date_creation else None,
+            'date_debut': self.date_debut.strftime('%Y-%m-%d %H:%M:%S') if self.date_debut else None,
+            'date_fin': self.date_fin.strftime('%Y-%m-%d %H:%M:%S') if self.date_fin else None,
+        }
+
+# BilanAnnuel model (résumé par élève d'une année scolaire clôturée, voir modules/archivage_annuel.py)
+class BilanAnnuel(db.Model):
+    __tablename__ = 'bilans_annuels'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    eleve_id = db.Column(db.Integer, db.ForeignKey('eleves.id'), nullable=False)
+    annee_scolaire = db.Column(db.String(9), nullable=False)  # 2024-2025
+    nombre_notes = db.Column(db.Integer, default=0)
+    moyenne_t1 = db.Column(db.Float)
+    moyenne_t2 = db.Column(db.Float)
+    moyenne_t3 = db.Column(db.Float)
+    moyenne_annuelle = db.Column(db.Float)
+    nombre_presences = db.Column(db.Integer, default=0)
+    nombre_absences = db.Column(db.Integer, default=0)
+    nombre_retards = db.Column(db.Integer, default=0)
+    nombre_paiements = db.Column(db.Integer, default=0)
+    total_paye = db.Column(db.Float, default=0)
+    date_cloture = db.Column(db.DateTime, default=datetime.now)
+    
+    # Relationship
+    eleve = db.relationship('Eleve', backref=db.backref('bilans_annuels', lazy=True))
+    
+    __table_args__ = (
+        db.UniqueConstraint('eleve_id', 'annee_scolaire', name='uq_bilans_annuels_eleve_annee'),
+    )
+    
+    def __repr__(self):
+        return f'<BilanAnnuel {self.eleve_id} {self.annee_scolaire}>'
+
+# JournalAudit model (historique des modifications administratives, voir modules/audit.py)
+class JournalAudit(db.Model):
+    __tablename__ = 'journal_audit'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    user_id = db.Column(db.Integer)  # pas de clé étrangère: le journal survit aux comptes supprimés
+    utilisateur = db.Column(db.String(100))
+    action = db.Column(db.String(20), nullable=False)  # creation, modification, suppression
+    entite = db.Column(db.String(50), nullable=False)  # nom de table: notes, presences, paiements...
+    entite_id = db.Column(db.Integer)  # None pour les insertions en masse
+    changements = db.Column(db.Text)  # JSON {colonne: [avant, après]}
+    source = db.Column(db.String(100))  # endpoint de la requête
+    adresse_ip = db.Column(db.String(45))
+    
+    __table_args__ = (
+        db.Index('ix_journal_audit_date', 'date', 'id'),
+        db.Index('ix_journal_audit_user_date', 'user_id', 'date', 'id'),
+        db.Index('ix_journal_audit_entite_date', 'entite', 'entite_id', 'date', 'id'),
+    )
+    
+    def __repr__(self):
+        return f'<JournalAudit {self.action} {self.entite}#{self.entite_id}>'
+
+@event.listens_for(JournalAudit, 'before_update')
+@event.listens_for(JournalAudit, 'before_delete')
+def _journal_en_ajout_seul(mapper, connection, entree):
+    raise ValueError("Le journal d'audit ne peut pas être modifié.")
+
+# IndisponibiliteProfesseur model (créneaux où un professeur ne peut pas enseigner, voir modules/emploi_du_temps.py)
+class IndisponibiliteProfesseur(db.Model):
+    __tablename__ = 'indisponibilites_professeurs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    professeur_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    jour = db.Column(db.Integer, nullable=False)  # 0 = lundi
+    creneau = db.Column(db.Integer, nullable=False)  # index dans EMPLOI_DU_TEMPS_CRENEAUX
+    
+    __table_args__ = (
+        db.UniqueConstraint('professeur_id', 'jour', 'creneau', name='uq_indisponibilites_professeur_creneau'),
+    )
+    
+    def __repr__(self):
+        return f'<IndisponibiliteProfesseur {self.professeur_id} {self.jour}/{self.creneau}>'
+
+# Seance model (emploi du temps généré: une ligne par heure de cours placée)
+class Seance(db.Model):
+    __tablename__ = 'seances'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    enseignement_id = db.Column(db.Integer, db.ForeignKey('enseignements.id', ondelete='CASCADE'), nullable=False)
+    classe_id = db.Column(db.Integer, db.ForeignKey('classes.id'), nullable=False)
+    cours_id = db.Column(db.Integer, db.ForeignKey('cours.id'), nullable=False)
+    professeur_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    annee_scolaire = db.Column(db.String(9), nullable=False)
+    jour = db.Column(db.Integer, nullable=False)
+    creneau = db.Column(db.Integer, nullable=False)
+    salle = db.Column(db.String(20))
+    
+    __table_args__ = (
+        # Une classe, un professeur: un seul cours par créneau
+        db.UniqueConstraint('classe_id', 'jour', 'creneau', name='uq_seances_classe_creneau'),
+        db.UniqueConstraint('professeur_id', 'annee_scolaire', 'jour', 'creneau', name='uq_seances_professeur_creneau'),
+        db.Index('ix_seances_enseignement', 'enseignement_id'),
+    )
+    
+    def __repr__(self):
+        return f'<Seance {self.classe_id} {self.jour}/{self.creneau}: {self.cours_id}>'
@@ -1,9 +1,12 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, abort, session
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, abort, session, current_app
 from flask_login import login_required, current_user, login_user, logout_user
 from werkzeug.security import check_password_hash, generate_password_hash
 from functools import wraps
 from datetime import datetime, date
-from models import db, User, Contact, Inscription, Annonce, News, Paiement, Eleve, ResultatAdmission, Newsletter
+from models import db, User, Contact, Inscription, Annonce, News, Paiement, Eleve, ResultatAdmission, Newsletter, CampagneNewsletter
+from modules.jobs import enqueue
+from modules import rate_limit
+from modules.loaders import eager
 
 admin_blueprint = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -408,7 +411,7 @@ def paiements():
     # Filtres
     methode = request.args.get('methode', 'tous')
     
-    query = Paiement.query
+    query = Paiement.query.options(*eager(Paiement, 'eleve', 'frais', 'recepteur'))
     
     if methode != 'tous':
         query = query.filter_by(methode=methode)
@@ -454,11 +457,39 @@ def newsletters():
         'actifs': Newsletter.query.filter_by(actif=True).count(),
         'inactifs': Newsletter.query.filter_by(actif=False).count()
     }
+    campagnes = CampagneNewsletter.query.order_by(CampagneNewsletter.date_creation.desc()).limit(5).all()
     
     return render_template('admin/newsletters.html', 
                          newsletters=newsletters,
                          statut_actuel=statut,
-                         stats=stats)
+                         stats=stats,
+                         campagnes=campagnes)
+
+@admin_blueprint.route('/newsletters/campagne', methods=['POST'])
+@login_required
+@admin_required
+def envoyer_campagne():
+    """Envoyer une campagne à tous les abonnés actifs (tâche de fond)"""
+    sujet = request.form.get('sujet', '').strip()
+    contenu = request.form.get('contenu', '').strip()
+    
+    if not sujet or not contenu:
+        flash('Le sujet et le contenu de la campagne sont obligatoires', 'error')
+        return redirect(url_for('admin.newsletters'))
+    
+    try:
+        campagne = CampagneNewsletter(sujet=sujet, contenu=contenu, cree_par=current_user.id)
+        db.session.add(campagne)
+        db.session.commit()
+        job = enqueue('newsletter.envoyer_campagne', {'campagne_id': campagne.id})
+        campagne.job_id = job.id
+        db.session.commit()
+        flash('La campagne a été mise en file d\'envoi', 'success')
+        return redirect(url_for('jobs.statut', job_id=job.id, retour=url_for('admin.newsletters')))
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Erreur lors de la création de la campagne: {str(e)}', 'error')
+        return redirect(url_for('admin.newsletters'))
 
 @admin_blueprint.route('/newsletters/<int:id>/toggle', methods=['POST'])
 @login_required
@@ -490,6 +521,17 @@ def delete_newsletter(id):
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# ==================== SECTION SURVEILLANCE ====================
+
+@admin_blueprint.route('/monitoring/rate-limit')
+@login_required
+@admin_required
+def rate_limit_stats():
+    """Requêtes acceptées/refusées par formulaire public (JSON)"""
+    return jsonify({'enabled': current_app.config.get('RATE_LIMIT_ENABLED', True),
+                    'limits': current_app.config.get('RATE_LIMITS', {}),
+                    'compteurs': rate_limit.stats()})
+
 # ==================== SECTION PROFIL UTILISATEUR ====================
 
 @admin_blueprint.route('/profile', methods=['GET', 'POST'])
@@ -25,6 +25,7 @@ from modules.communication import communication_blueprint
 from modules.inscriptions import inscriptions_blueprint
 from modules.news import news_blueprint
 from modules.whatsapp_management import whatsapp_management_blueprint
+from modules import user_cache
 
 # Configuration
 from config import Config
@@ -41,7 +42,7 @@ login_manager.login_view = 'auth.login'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.load_user(user_id)
 
 # Register blueprints
 app.register_blueprint(auth_blueprint)
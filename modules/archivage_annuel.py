@@ -0,0 +1,351 @@
+"""
+Year-end archival of grades, attendance and payments
+
+Note, Presence and Paiement rows of a closed school year (September 1st to
+August 31st) are moved by
+
+    flask annee cloturer 2024-2025
+
+into a SQLite file of their own, ARCHIVES_ANNUELLES_DIR/annee_2024-2025.sqlite,
+with the same tables and columns. Grades and attendance go by their date;
+payments go by the year of their fee (Frais.annee_scolaire, '2024' or
+'2024-2025'), which is how finances and the parent portal total them, so a
+payment made in June against the fees currently billed stays in place.
+One BilanAnnuel row per student keeps the year's averages, attendance
+counts and payments in the main database. The hot tables therefore only
+hold the current year, and every existing query (bulletins, reports,
+dashboards) reads the current year without change.
+
+History stays readable on demand:
+
+    with session_archive('2023-2024') as s:
+        notes = s.query(Note).filter(Note.eleve_id == eleve_id).all()
+
+Archived rows have no relationships (students and courses stay in the main
+database): read their ids and resolve them there. In the app, a student's
+page and timeline show a closed year with ?annee=2023-2024 (eleves.details,
+eleves.historique), next to the BilanAnnuel summaries of every closed year.
+
+Rows are moved in batches (copied to the archive, then deleted from the
+main database); an interrupted run can simply be started again.
+"""
+
+import os
+import re
+import logging
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, create_engine, delete, func, insert, select, MetaData, Table, Column, Index
+from sqlalchemy.orm import Session
+
+from config import Config
+from models import db, Note, Presence, Paiement, Eleve, Frais, BilanAnnuel
+from modules import reference_data
+from modules.audit import journaliser
+
+logger = logging.getLogger('archivage_annuel')
+
+ARCHIVED_MODELS = (Note, Presence, Paiement)
+TAILLE_LOT = 2000
+FORMAT_ANNEE = re.compile(r'^(\d{4})-(\d{4})$')
+
+# ==================== SCHOOL YEARS ====================
+
+def debut_annee_scolaire(jour=None):
+    """First day of the school year containing `jour` (years start on September 1st)"""
+    jour = jour or date.today()
+    return date(jour.year if jour.month >= 9 else jour.year - 1, 9, 1)
+
+
+def annee_scolaire_de(jour=None):
+    """'2024-2025' for any day between 2024-09-01 and 2025-08-31"""
+    debut = debut_annee_scolaire(jour)
+    return f'{debut.year}-{debut.year + 1}'
+
+
+def bornes(annee):
+    """
+    First and last day of a school year
+
+    Raises:
+        ValueError: Not a 'YYYY-YYYY' pair of consecutive years
+    """
+    match = FORMAT_ANNEE.match(annee or '')
+    if not match or int(match.group(2)) != int(match.group(1)) + 1:
+        raise ValueError(f"Année scolaire invalide: {annee} (format attendu: 2024-2025)")
+    return date(int(match.group(1)), 9, 1), date(int(match.group(2)), 8, 31)
+
+
+# ==================== ARCHIVE FILES ====================
+
+# Copies of the archived tables without foreign keys (their targets stay in the main database)
+_archive_metadata = MetaData()
+for _model in ARCHIVED_MODELS:
+    _source = _model.__table__
+    Table(
+        _source.name, _archive_metadata,
+        *[Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable) for c in _source.columns],
+    )
+    Index(f'ix_{_source.name}_eleve_date', _archive_metadata.tables[_source.name].c.eleve_id,
+          _archive_metadata.tables[_source.name].c.date)
+
+_engines = {}
+
+
+def table_archive(model):
+    """Table of an archive file holding the rows of model (same columns, no foreign keys)"""
+    return _archive_metadata.tables[model.__tablename__]
+
+
+def archives_dir():
+    """Directory of the yearly archive files (created on demand)"""
+    path = current_app.config.get('ARCHIVES_ANNUELLES_DIR') or Config.ARCHIVES_ANNUELLES_DIR
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def archive_path(annee):
+    bornes(annee)
+    return os.path.join(archives_dir(), f'annee_{annee}.sqlite')
+
+
+def archive_engine(annee, creer=False):
+    """
+    Engine of a year's archive file
+
+    Raises:
+        LookupError: The year was never archived (and creer is False)
+    """
+    path = archive_path(annee)
+    if not creer and not os.path.exists(path):
+        raise LookupError(f"Aucune archive pour l'année {annee}")
+    engine = _engines.get(path)
+    if engine is None:
+        engine = _engines[path] = create_engine(f'sqlite:///{path}')
+        _archive_metadata.create_all(engine)
+    return engine
+
+
+def annees_archivees():
+    """School years with an archive file, most recent first"""
+    annees = []
+    for nom in os.listdir(archives_dir()):
+        match = re.match(r'^annee_(\d{4}-\d{4})\.sqlite$', nom)
+        if match:
+            annees.append(match.group(1))
+    return sorted(annees, reverse=True)
+
+
+@contextmanager
+def session_archive(annee):
+    """
+    Read-only session on the archive of a closed school year
+
+    Query Note, Presence and Paiement as usual; relationships are not available.
+    """
+    session = Session(bind=archive_engine(annee))
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.close()
+
+
+# ==================== ROLLOVER ====================
+
+def _de_l_annee(model, annee):
+    """Filter on the rows of model belonging to a school year"""
+    debut, fin = bornes(annee)
+    if model is Paiement:
+        return Paiement.frais_id.in_(select(Frais.id).where(Frais.annee_scolaire.in_([str(debut.year), annee])))
+    return and_(model.date >= debut, model.date <= fin)
+
+
+def _deplacer(model, engine, annee, taille_lot):
+    table = model.__table__
+    archive = _archive_metadata.tables[table.name]
+    total = 0
+    while True:
+        lignes = [dict(row) for row in db.session.execute(
+            select(table).where(_de_l_annee(model, annee)).order_by(table.c.id).limit(taille_lot)
+        ).mappings()]
+        if not lignes:
+            return total
+        # Copy first: if the run stops here, the next one replaces the copies and deletes the originals
+        with engine.begin() as conn:
+            conn.execute(archive.insert().prefix_with('OR REPLACE'), lignes)
+        db.session.execute(
+            delete(model).where(model.id.in_([ligne['id'] for ligne in lignes])),
+            # Not logged row by row: cloturer() records one audit entry per table
+            execution_options={'synchronize_session': False, 'audit': False}
+        )
+        db.session.commit()
+        total += len(lignes)
+
+
+def calculer_bilans(annee):
+    """
+    Rebuild the BilanAnnuel rows of an archived year from its archive file
+
+    Returns:
+        int: Number of students summarised
+    """
+    engine = archive_engine(annee)
+    notes = _archive_metadata.tables['notes']
+    presences = _archive_metadata.tables['presences']
+    paiements = _archive_metadata.tables['paiements']
+    cours_par_id = reference_data.snapshot().cours_par_id
+    bilans = {}
+
+    def bilan(eleve_id):
+        return bilans.setdefault(eleve_id, {
+            'eleve_id': eleve_id, 'annee_scolaire': annee, 'nombre_notes': 0, 'moyennes': {},
+            'nombre_presences': 0, 'nombre_absences': 0, 'nombre_retards': 0,
+            'nombre_paiements': 0, 'total_paye': 0.0,
+        })
+
+    with engine.connect() as conn:
+        for eleve_id, trimestre, cours_id, moyenne, nombre in conn.execute(
+            select(notes.c.eleve_id, notes.c.trimestre, notes.c.cours_id,
+                   func.avg(notes.c.valeur * 20.0 / notes.c.sur), func.count())
+            .where(notes.c.sur > 0).group_by(notes.c.eleve_id, notes.c.trimestre, notes.c.cours_id)
+        ):
+            b = bilan(eleve_id)
+            b['nombre_notes'] += nombre
+            cours = cours_par_id.get(cours_id)
+            coefficient = (cours.coefficient if cours else 1) or 1
+            points, coefficients = b['moyennes'].get(trimestre, (0.0, 0.0))
+            b['moyennes'][trimestre] = (points + moyenne * coefficient, coefficients + coefficient)
+
+        for eleve_id, statut, nombre in conn.execute(
+            select(presences.c.eleve_id, presences.c.statut, func.count())
+            .group_by(presences.c.eleve_id, presences.c.statut)
+        ):
+            b = bilan(eleve_id)
+            b['nombre_presences'] += nombre
+            if statut == 'absent':
+                b['nombre_absences'] += nombre
+            elif statut == 'retard':
+                b['nombre_retards'] += nombre
+
+        for eleve_id, nombre, total in conn.execute(
+            select(paiements.c.eleve_id, func.count(), func.sum(paiements.c.montant)).group_by(paiements.c.eleve_id)
+        ):
+            b = bilan(eleve_id)
+            b['nombre_paiements'] = nombre
+            b['total_paye'] = total or 0.0
+
+    existants = {i for (i,) in db.session.query(Eleve.id)}
+    lignes = []
+    for b in bilans.values():
+        if b['eleve_id'] not in existants:
+            continue
+        moyennes = {t: p / c for t, (p, c) in b.pop('moyennes').items() if c}
+        for trimestre in (1, 2, 3):
+            b[f'moyenne_t{trimestre}'] = round(moyennes[trimestre], 2) if trimestre in moyennes else None
+        b['moyenne_annuelle'] = round(sum(moyennes.values()) / len(moyennes), 2) if moyennes else None
+        b['date_cloture'] = datetime.now()
+        lignes.append(b)
+
+    BilanAnnuel.query.filter_by(annee_scolaire=annee).delete(synchronize_session=False)
+    if lignes:
+        db.session.execute(insert(BilanAnnuel), lignes)
+    db.session.commit()
+    return len(lignes)
+
+
+def cloturer(annee, taille_lot=TAILLE_LOT):
+    """
+    Move a closed school year to its archive file and summarise it
+
+    Args:
+        annee (str): '2024-2025'
+        taille_lot (int): Rows moved per transaction
+
+    Returns:
+        dict: Rows moved per table and number of BilanAnnuel rows
+
+    Raises:
+        ValueError: Invalid year, or a year that is not over yet
+    """
+    _, fin = bornes(annee)
+    if fin >= date.today():
+        raise ValueError(f"L'année {annee} n'est pas terminée (fin le {fin.strftime('%d/%m/%Y')})")
+
+    engine = archive_engine(annee, creer=True)
+    resultat = {}
+    for model in ARCHIVED_MODELS:
+        resultat[model.__tablename__] = _deplacer(model, engine, annee, taille_lot)
+        logger.info(f"{annee}: {resultat[model.__tablename__]} ligne(s) de {model.__tablename__} archivée(s)")
+        if resultat[model.__tablename__]:
+            journaliser('suppression', model.__tablename__,
+                        {'archivage': [None, annee], 'lignes': [resultat[model.__tablename__], 0]})
+            db.session.commit()
+    resultat['bilans'] = calculer_bilans(annee)
+    return resultat
+
+
+def annees_a_cloturer():
+    """Closed school years that still have rows in the hot tables"""
+    limite = debut_annee_scolaire()
+    debuts = set()
+    for model in (Note, Presence):
+        valeur = db.session.query(func.min(model.date)).filter(model.date < limite).scalar()
+        if valeur is not None:
+            valeur = date.fromisoformat(valeur[:10]) if isinstance(valeur, str) else valeur
+            debuts.update(range(debut_annee_scolaire(valeur).year, limite.year))
+    for (annee_frais,) in db.session.query(Frais.annee_scolaire).filter(
+        Frais.id.in_(select(Paiement.frais_id))
+    ).distinct():
+        if (annee_frais or '')[:4].isdigit() and int(annee_frais[:4]) < limite.year:
+            debuts.add(int(annee_frais[:4]))
+    annees = []
+    for debut_annee in sorted(debuts):
+        annee = f'{debut_annee}-{debut_annee + 1}'
+        if any(db.session.query(model.id).filter(_de_l_annee(model, annee)).first() for model in ARCHIVED_MODELS):
+            annees.append(annee)
+    return annees
+
+
+# ==================== CLI ====================
+
+annee_cli = AppGroup('annee', help='Clôture et archives des années scolaires')
+
+
+@annee_cli.command('cloturer')
+@click.argument('annee', required=False)
+@click.option('--toutes', is_flag=True, help='Clôturer toutes les années terminées non archivées')
+@click.option('--taille-lot', type=int, default=TAILLE_LOT, help='Lignes déplacées par transaction')
+@click.option('--vacuum', is_flag=True, help='Compacter la base SQLite après le déplacement')
+def cloturer_command(annee, toutes, taille_lot, vacuum):
+    """Archive les notes, présences et paiements d'une année scolaire terminée"""
+    annees = annees_a_cloturer() if toutes else [annee]
+    if not annees or annees == [None]:
+        raise click.UsageError('Indiquez une année (ex: 2024-2025) ou --toutes')
+    for a in annees:
+        try:
+            resultat = cloturer(a, taille_lot)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"{a}: {resultat['notes']} note(s), {resultat['presences']} présence(s), "
+                   f"{resultat['paiements']} paiement(s) archivés - {resultat['bilans']} bilan(s)")
+    if vacuum and db.engine.dialect.name == 'sqlite':
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql('VACUUM')
+        click.echo('Base compactée')
+
+
+@annee_cli.command('archives')
+def archives_command():
+    """Liste les années archivées"""
+    annees = annees_archivees()
+    if not annees:
+        click.echo('Aucune année archivée')
+    for a in annees:
+        with session_archive(a) as s:
+            comptes = ', '.join(f'{s.query(m).count()} {m.__tablename__}' for m in ARCHIVED_MODELS)
+        click.echo(f'{a}: {comptes}')
@@ -3,6 +3,8 @@ from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
 from models import db, ArchiveDossier, ArchiveFichier
+from modules.loaders import eager
+from modules.jobs import job_handler, enqueue
 from datetime import datetime, timedelta
 import os
 import uuid
@@ -77,7 +79,7 @@ def index():
     elif filtre == 'confidentiel':
         query = query.filter_by(confidentiel=True)
     
-    dossiers = query.order_by(ArchiveDossier.date_creation.desc()).all()
+    dossiers = query.options(*eager(ArchiveDossier, 'createur')).order_by(ArchiveDossier.date_creation.desc()).all()
     
     # Compter les éléments pour chaque filtre
     counts = {
@@ -338,7 +340,7 @@ def corbeille():
     dossiers = ArchiveDossier.query.filter(
         ArchiveDossier.supprime == True,
         ArchiveDossier.date_suppression >= thirty_days_ago
-    ).order_by(ArchiveDossier.date_suppression.desc()).all()
+    ).options(*eager(ArchiveDossier, 'createur')).order_by(ArchiveDossier.date_suppression.desc()).all()
     
     # Calculer les jours restants pour chaque dossier
     for dossier in dossiers:
@@ -434,7 +436,12 @@ def telecharger(fichier_id):
 @login_required
 def export_excel():
     filtre = request.args.get('filtre', 'tous')
-    
+    job = enqueue('archives.export_excel', {'filtre': filtre})
+    return redirect(url_for('jobs.statut', job_id=job.id, retour=url_for('archives.index', filtre=filtre)))
+
+@job_handler('archives.export_excel')
+def export_excel_job(ctx, filtre='tous'):
+    """Tâche de fond: génère archives.xlsx pour le filtre donné"""
     # Récupérer les dossiers selon le filtre
     query = ArchiveDossier.query.filter_by(supprime=False)
     
@@ -447,7 +454,8 @@ def export_excel():
     elif filtre == 'confidentiel':
         query = query.filter_by(confidentiel=True)
     
-    dossiers = query.order_by(ArchiveDossier.date_creation.desc()).all()
+    dossiers = query.options(*eager(ArchiveDossier, 'createur')).order_by(ArchiveDossier.date_creation.desc()).all()
+    ctx.progress(10, f'{len(dossiers)} dossier(s) à exporter')
     
     # Créer le workbook
     wb = Workbook()
@@ -488,13 +496,9 @@ def export_excel():
         adjusted_width = (max_length + 2)
         ws.column_dimensions[column].width = adjusted_width
     
-    # Sauvegarder dans un buffer
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    
-    return send_file(buffer, as_attachment=True, download_name='archives.xlsx', 
-                    mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    ctx.progress(80, 'Enregistrement du fichier')
+    wb.save(ctx.artifact_path('archives.xlsx'))
+    return {'dossiers': len(dossiers)}
 
 # DOCX export disabled due to Linux compatibility issues with python-docx
 # @archives_blueprint.route('/export/docx')
@@ -503,26 +507,42 @@ def export_excel():
 #     flash('Export DOCX temporairement désactivé. Utilisez Excel à la place.', 'warning')
 #     return redirect(url_for('archives.index'))
 
-# Nettoyage automatique de la corbeille (à appeler périodiquement)
-def nettoyer_corbeille():
+# Nettoyage automatique de la corbeille (tâche de fond, voir nettoyer_corbeille_route)
+@job_handler('archives.nettoyer_corbeille')
+def nettoyer_corbeille(ctx=None):
     """Supprime définitivement les dossiers dans la corbeille depuis plus de 30 jours"""
     thirty_days_ago = datetime.now() - timedelta(days=30)
-    dossiers_a_supprimer = ArchiveDossier.query.filter(
+    ids = [dossier_id for (dossier_id,) in db.session.query(ArchiveDossier.id).filter(
         ArchiveDossier.supprime == True,
         ArchiveDossier.date_suppression < thirty_days_ago
-    ).all()
-    
-    for dossier in dossiers_a_supprimer:
-        # Supprimer les fichiers physiques
-        for fichier in dossier.fichiers:
-            if fichier.fichier_path and os.path.exists(fichier.fichier_path):
-                os.remove(fichier.fichier_path)
-            if fichier.photo_couverture and os.path.exists(fichier.photo_couverture):
-                os.remove(fichier.photo_couverture)
-        
-        if dossier.photo_couverture and os.path.exists(dossier.photo_couverture):
-            os.remove(dossier.photo_couverture)
+    )]
+    
+    # Par lots: chaque lot est validé avant de supprimer ses fichiers physiques,
+    # une reprise après erreur ne refait que le lot en cours
+    supprimes = 0
+    for start in range(0, len(ids), 50):
+        dossiers = ArchiveDossier.query.filter(ArchiveDossier.id.in_(ids[start:start + 50])) \
+            .options(*eager(ArchiveDossier, 'fichiers')).all()
+        chemins = []
+        for dossier in dossiers:
+            for fichier in dossier.fichiers:
+                chemins.extend([fichier.fichier_path, fichier.photo_couverture])
+            chemins.append(dossier.photo_couverture)
+            db.session.delete(dossier)
+        db.session.commit()
         
-        db.session.delete(dossier)
-    
-    db.session.commit()
+        for chemin in chemins:
+            if chemin and os.path.exists(chemin):
+                os.remove(chemin)
+        supprimes += len(dossiers)
+        if ctx is not None:
+            ctx.progress(100 * supprimes / len(ids), f'{supprimes}/{len(ids)} dossier(s) supprimé(s)')
+    
+    return {'dossiers_supprimes': supprimes}
+
+@archives_blueprint.route('/corbeille/nettoyer', methods=['POST'])
+@login_required
+@admin_required
+def nettoyer_corbeille_route():
+    job = enqueue('archives.nettoyer_corbeille')
+    return redirect(url_for('jobs.statut', job_id=job.id, retour=url_for('archives.corbeille')))
@@ -43,8 +43,11 @@ def liste():
 def details(slug):
     article = Article.query.filter_by(slug=slug, actif=True).first_or_404()
     
-    # Incrémenter le compteur de vues
-    article.vues += 1
+    # Incrémenter le compteur de vues: UPDATE direct de la table, qui ne touche pas
+    # date_modification et ne déclenche pas les hooks de commit (cache des pages, flux)
+    table = Article.__table__
+    db.session.execute(table.update().where(table.c.id == article.id).values(
+        vues=table.c.vues + 1, date_modification=table.c.date_modification))
     db.session.commit()
     
     # Articles similaires (même catégorie)
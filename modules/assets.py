@@ -0,0 +1,196 @@
+"""
+Fingerprinted static assets
+
+scripts/build_assets.py copies every file of static/ (except user uploads)
+to static/dist/ under a content-hashed name, writes gzip and, when the
+brotli package is installed, brotli variants of compressible files, and
+records the mapping in static/dist/manifest.json.
+
+Once a manifest exists, url_for('static', filename='assets/logo.jpg')
+returns the hashed URL (static/dist/assets/logo.<hash>.jpg) and the static
+view serves those files with a one-year immutable Cache-Control, picking
+the pre-compressed variant accepted by the browser. Files missing from the
+manifest (uploads, new files before the next build) are served as before.
+"""
+
+import os
+import json
+import gzip
+import shutil
+import hashlib
+import logging
+import mimetypes
+import threading
+
+from flask import request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # optional: gzip variants only
+    brotli = None
+
+logger = logging.getLogger('assets')
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+# Never fingerprinted: user content, referenced by paths stored in the database
+EXCLUDED_DIRS = ('uploads', DIST_DIR)
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.html',
+                           '.xml', '.ico', '.ttf', '.otf', '.eot')
+# Encodings served, in order of preference, with their file suffix
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+# ==================== BUILD ====================
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:10]
+
+
+def _write_variants(path):
+    """Write .gz (and .br) next to path when smaller than the original; return encodings written"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    written = []
+    compressors = [('gzip', '.gz', lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        compressors.insert(0, ('br', '.br', lambda d: brotli.compress(d, quality=11)))
+    for encoding, suffix, compress in compressors:
+        compressed = compress(data)
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            written.append(encoding)
+    return written
+
+
+def build(static_folder):
+    """
+    Fingerprint and pre-compress the static files
+
+    Args:
+        static_folder (str): Absolute path of static/
+
+    Returns:
+        dict: The manifest {source: {'file': hashed, 'encodings': [...]}}
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    if os.path.isdir(dist):
+        shutil.rmtree(dist)
+    os.makedirs(dist)
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        rel_root = os.path.relpath(root, static_folder)
+        if rel_root == '.':
+            dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRS]
+        for name in sorted(files):
+            if name.startswith('.'):
+                continue
+            source = os.path.join(root, name)
+            rel = os.path.normpath(os.path.join(rel_root, name)).replace(os.sep, '/')
+            stem, ext = os.path.splitext(rel)
+            hashed = f'{stem}.{_file_hash(source)}{ext}'
+            target = os.path.join(dist, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(source, target)
+            encodings = _write_variants(target) if ext.lower() in COMPRESSIBLE_EXTENSIONS else []
+            manifest[rel] = {'file': hashed, 'encodings': encodings}
+
+    with open(os.path.join(dist, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+# ==================== RUNTIME ====================
+
+class _Manifest:
+    """manifest.json, reloaded when the file changes (new deploy) without restarting workers"""
+
+    def __init__(self, app):
+        self.app = app
+        self._mtime = None
+        self.sources = {}
+        self.hashed = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        path = os.path.join(self.app.static_folder, DIST_DIR, MANIFEST_NAME)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            self._mtime, self.sources, self.hashed = None, {}, {}
+            return
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"Invalid asset manifest {path}: {str(e)}")
+                return
+            self.sources = {src: f"{DIST_DIR}/{entry['file']}" for src, entry in data.items()}
+            self.hashed = {f"{DIST_DIR}/{entry['file']}": entry.get('encodings', []) for entry in data.values()}
+            self._mtime = mtime
+
+
+def _accepted_encodings():
+    accepted = set()
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        token, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(token.strip().lower())
+    return accepted
+
+
+def init_assets(app):
+    """
+    Rewrite url_for('static', ...) to fingerprinted files and serve them
+    with far-future caching and pre-compressed variants
+
+    Args:
+        app (Flask): The application (its 'static' endpoint is replaced)
+    """
+    manifest = _Manifest(app)
+    default_static = app.view_functions['static']
+
+    @app.url_defaults
+    def fingerprint_static_url(endpoint, values):
+        if endpoint != 'static' or 'filename' not in values:
+            return
+        manifest.refresh()
+        hashed = manifest.sources.get(str(values['filename']).lstrip('/'))
+        if hashed:
+            values['filename'] = hashed
+
+    def static(filename):
+        manifest.refresh()
+        encodings = manifest.hashed.get(filename)
+        if encodings is None:
+            return default_static(filename=filename)
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        accepted = _accepted_encodings()
+        for encoding, suffix in ENCODINGS:
+            if encoding in encodings and encoding in accepted:
+                response = send_from_directory(app.static_folder, filename + suffix, mimetype=mimetype,
+                                               max_age=IMMUTABLE_MAX_AGE)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(app.static_folder, filename, mimetype=mimetype,
+                                           max_age=IMMUTABLE_MAX_AGE)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        if encodings:
+            response.vary.add('Accept-Encoding')
+        return response
+
+    app.view_functions['static'] = static
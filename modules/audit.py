@@ -0,0 +1,394 @@
+"""
+Audit log
+
+Every insert, update and delete of the audited models (AUDITES: grades,
+attendance, payments, fees, archives) is recorded in the append-only
+journal_audit table with its before/after values, the user and the request:
+
+    entite='notes', entite_id=12, action='modification',
+    changements='{"valeur": [12.0, 14.0]}', utilisateur='Marie Dupont',
+    source='notes.saisie'
+
+Changes are captured by session events:
+
+- unit-of-work changes (add, attribute changes, delete) in after_flush,
+  from the attribute history already in memory: no query
+- bulk statements in do_orm_execute: executemany UPDATEs by primary key
+  (notes.saisie) read the previous values of their rows with one IN query
+  on the primary key, DELETE/UPDATE ... WHERE (the day rewrite of
+  presence.saisie) read the rows they are about to change with their own
+  WHERE clause, and bulk INSERTs are logged from their parameters (without
+  ids, which the database assigns).
+
+Bulk statements executed with execution_options={'audit': False} are not
+captured: the year-end archival (modules/archivage_annuel.py) moves whole
+years of rows and records one summary entry per table with journaliser()
+instead of one entry per row.
+
+Entries stay on the session until the commit (a rollback drops them), then
+go to a per-process buffer. A background thread writes the buffer with one
+executemany INSERT on its own connection every AUDIT_DELAI seconds, or as
+soon as AUDIT_TAILLE_LOT entries are waiting: the request that made the
+change never waits for the journal. AUDIT_DELAI = 0 writes at commit time
+(tests). If the write fails, the entries are appended to
+audit_secours.jsonl in CACHE_DIR rather than lost.
+
+The log is read at /admin/audit, filtered by user, entity and period and
+paginated by keyset on the (..., date, id) indexes.
+"""
+
+import os
+import json
+import atexit
+import logging
+import threading
+from datetime import datetime, date, time, timedelta
+
+from flask import Blueprint, current_app, has_request_context, render_template, request, url_for
+from flask import session as flask_session
+from flask_login import login_required
+from sqlalchemy import event, insert, select, inspect, or_, and_
+from sqlalchemy.orm import Session
+
+from models import db, User, JournalAudit, Note, Presence, Paiement, Frais, ArchiveDossier, ArchiveFichier
+from modules.admin import admin_required
+from modules.cache import cache_dir
+
+logger = logging.getLogger('audit')
+
+AUDITES = (Note, Presence, Paiement, Frais, ArchiveDossier, ArchiveFichier)
+LIBELLES = {
+    'notes': 'Notes',
+    'presences': 'Présences',
+    'paiements': 'Paiements',
+    'frais': 'Frais',
+    'archive_dossiers': "Dossiers d'archives",
+    'archive_fichiers': "Fichiers d'archives",
+}
+ACTIONS = {'creation': 'Création', 'modification': 'Modification', 'suppression': 'Suppression'}
+# Never written in clear in the journal
+MASQUES = {'code_pin'}
+TAILLE_LOT = 500
+PAR_PAGE = 50
+
+
+# ==================== CAPTURE ====================
+
+def _valeur(colonne, valeur):
+    if valeur is not None and colonne in MASQUES:
+        return '***'
+    if isinstance(valeur, (datetime, date, time)):
+        return valeur.isoformat()
+    return valeur
+
+
+def _convertir(ancienne, nouvelle):
+    """Bulk parameters as the column would store them ('15' -> 15.0), so unchanged values compare equal"""
+    if ancienne is None or nouvelle is None or isinstance(nouvelle, type(ancienne)):
+        return nouvelle
+    try:
+        if isinstance(ancienne, (date, datetime)) and isinstance(nouvelle, str):
+            return type(ancienne).fromisoformat(nouvelle)
+        return type(ancienne)(nouvelle)
+    except (TypeError, ValueError):
+        return nouvelle
+
+
+def _contexte():
+    if not has_request_context():
+        return {'user_id': None, 'utilisateur': None, 'source': 'hors requête', 'adresse_ip': None}
+    return {
+        'user_id': flask_session.get('user_id'),
+        'utilisateur': (flask_session.get('user_name') or '')[:100] or None,
+        'source': (request.endpoint or request.path)[:100],
+        'adresse_ip': request.remote_addr,
+    }
+
+
+def _entree(contexte, action, entite, entite_id, changements):
+    return dict(contexte, date=datetime.now(), action=action, entite=entite, entite_id=entite_id,
+                changements=json.dumps(changements, default=str, ensure_ascii=False))
+
+
+def _en_attente(sess):
+    return sess.info.setdefault('audit', [])
+
+
+def journaliser(action, entite, changements, entite_id=None):
+    """Add an entry by hand to the current session; it is written at its commit like the others"""
+    _en_attente(db.session()).append(_entree(_contexte(), action, entite, entite_id, changements))
+
+
+@event.listens_for(Session, 'after_flush')
+def _capturer_flush(sess, flush_context):
+    # Pre-flush state is still visible here: new/dirty/deleted and attribute history
+    contexte, entrees = None, []
+    for action, objets in (('creation', sess.new), ('modification', sess.dirty), ('suppression', sess.deleted)):
+        for objet in objets:
+            if not isinstance(objet, AUDITES):
+                continue
+            etat = inspect(objet)
+            changements = {}
+            for attribut in etat.mapper.column_attrs:
+                cle = attribut.key
+                if cle == 'id':
+                    continue
+                if action == 'modification':
+                    historique = etat.attrs[cle].history
+                    if not historique.added:
+                        continue
+                    avant = historique.deleted[0] if historique.deleted else None
+                    apres = historique.added[0]
+                    if avant != apres:
+                        changements[cle] = [_valeur(cle, avant), _valeur(cle, apres)]
+                elif etat.dict.get(cle) is not None:
+                    valeur = _valeur(cle, etat.dict[cle])
+                    changements[cle] = [None, valeur] if action == 'creation' else [valeur, None]
+            if action == 'modification' and not changements:
+                continue
+            contexte = contexte or _contexte()
+            entrees.append(_entree(contexte, action, etat.mapper.local_table.name, etat.dict.get('id'), changements))
+    if entrees:
+        _en_attente(sess).extend(entrees)
+
+
+def _modifications_par_cle(connexion, table, lignes, contexte):
+    """executemany UPDATE by id: previous values read with one IN query per TAILLE_LOT rows"""
+    colonnes = sorted({c for ligne in lignes for c in ligne if c != 'id' and c in table.c})
+    ids = [ligne['id'] for ligne in lignes]
+    avant = {}
+    for debut in range(0, len(ids), TAILLE_LOT):
+        requete = select(table.c.id, *[table.c[c] for c in colonnes]).where(table.c.id.in_(ids[debut:debut + TAILLE_LOT]))
+        for ligne in connexion.execute(requete):
+            avant[ligne.id] = ligne._mapping
+
+    entrees = []
+    for ligne in lignes:
+        precedente = avant.get(ligne['id'], {})
+        changements = {}
+        for colonne in colonnes:
+            if colonne not in ligne:
+                continue
+            ancienne = precedente.get(colonne)
+            nouvelle = _convertir(ancienne, ligne[colonne])
+            if ancienne != nouvelle:
+                changements[colonne] = [_valeur(colonne, ancienne), _valeur(colonne, nouvelle)]
+        if changements:
+            entrees.append(_entree(contexte, 'modification', table.name, ligne['id'], changements))
+    return entrees
+
+
+def _modifications_par_clause(connexion, table, instruction, contexte, suppression):
+    """DELETE/UPDATE ... WHERE: the rows are read with the statement's own WHERE clause"""
+    requete = select(table)
+    if instruction.whereclause is not None:
+        requete = requete.where(instruction.whereclause)
+    lignes = connexion.execute(requete).mappings().all()
+    if suppression:
+        return [_entree(contexte, 'suppression', table.name, ligne['id'],
+                        {c: [_valeur(c, v), None] for c, v in ligne.items() if v is not None and c != 'id'})
+                for ligne in lignes]
+
+    # Literal values of the SET clause (SQL expressions such as vues + 1 are not known before execution)
+    valeurs = {c: v for c, v in instruction.compile().params.items() if c in table.c}
+    entrees = []
+    for ligne in lignes:
+        changements = {}
+        for colonne, valeur in valeurs.items():
+            nouvelle = _convertir(ligne[colonne], valeur)
+            if ligne[colonne] != nouvelle:
+                changements[colonne] = [_valeur(colonne, ligne[colonne]), _valeur(colonne, nouvelle)]
+        if changements:
+            entrees.append(_entree(contexte, 'modification', table.name, ligne['id'], changements))
+    return entrees
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _capturer_masse(etat):
+    if not (etat.is_insert or etat.is_update or etat.is_delete):
+        return
+    if etat.execution_options.get('audit') is False:
+        return
+    mapper = etat.bind_mapper
+    if mapper is None or not issubclass(mapper.class_, AUDITES):
+        return
+    table = mapper.local_table
+    parametres = etat.parameters
+    lignes = parametres if isinstance(parametres, list) else ([parametres] if parametres else [])
+    contexte = _contexte()
+
+    if etat.is_insert:
+        entrees = [_entree(contexte, 'creation', table.name, ligne.get('id'),
+                           {c: [None, _valeur(c, v)] for c, v in ligne.items() if v is not None and c != 'id'})
+                   for ligne in lignes]
+    elif etat.is_update and lignes and all('id' in ligne for ligne in lignes):
+        entrees = _modifications_par_cle(etat.session.connection(), table, lignes, contexte)
+    else:
+        entrees = _modifications_par_clause(etat.session.connection(), table, etat.statement, contexte, etat.is_delete)
+    if entrees:
+        _en_attente(etat.session).extend(entrees)
+
+
+@event.listens_for(Session, 'after_commit')
+def _transmettre(sess):
+    entrees = sess.info.pop('audit', None)
+    if entrees:
+        _tampon.ajouter(entrees)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _abandonner(sess):
+    sess.info.pop('audit', None)
+
+
+# ==================== ÉCRITURE ====================
+
+class _Tampon:
+    """Committed entries of this process, written in batches by a background thread"""
+
+    def __init__(self):
+        self._entrees = []
+        self._app = None
+        self._verrou = threading.Lock()
+        self._ecriture = threading.Lock()
+        self._reveil = threading.Event()
+        self._fil = None
+
+    def ajouter(self, entrees):
+        app = current_app._get_current_object()
+        with self._verrou:
+            self._app = app
+            self._entrees.extend(entrees)
+            plein = len(self._entrees) >= app.config.get('AUDIT_TAILLE_LOT', 200)
+        if not app.config.get('AUDIT_DELAI', 2):
+            self.vider()
+            return
+        if self._fil is None or not self._fil.is_alive():
+            self._demarrer()
+        if plein:
+            self._reveil.set()
+
+    def _demarrer(self):
+        with self._verrou:
+            if self._fil is not None and self._fil.is_alive():
+                return
+            # Also started again in a forked worker: the parent's thread does not survive the fork
+            self._fil = threading.Thread(target=self._boucle, name='audit', daemon=True)
+            self._fil.start()
+
+    def _boucle(self):
+        while True:
+            self._reveil.wait(self._app.config.get('AUDIT_DELAI', 2))
+            self._reveil.clear()
+            try:
+                self.vider()
+            except Exception as e:
+                logger.error(f"Écriture du journal d'audit: {str(e)}")
+
+    def vider(self):
+        """Write the waiting entries now; returns the number written"""
+        with self._ecriture:
+            with self._verrou:
+                entrees, self._entrees = self._entrees, []
+                app = self._app
+            if not entrees:
+                return 0
+            with app.app_context():
+                try:
+                    with db.engine.begin() as connexion:
+                        connexion.execute(insert(JournalAudit.__table__), entrees)
+                except Exception as e:
+                    logger.error(f"Journal d'audit indisponible, {len(entrees)} entrée(s) écrite(s) dans le fichier de secours: {str(e)}")
+                    self._secours(entrees)
+                    return 0
+            return len(entrees)
+
+    @staticmethod
+    def _secours(entrees):
+        with open(os.path.join(cache_dir(), 'audit_secours.jsonl'), 'a', encoding='utf-8') as fichier:
+            for entree in entrees:
+                fichier.write(json.dumps(entree, default=str, ensure_ascii=False) + '\n')
+
+
+_tampon = _Tampon()
+atexit.register(_tampon.vider)
+
+
+def vider():
+    """Write the buffered entries of this process now (before reading the journal, at shutdown)"""
+    return _tampon.vider()
+
+
+# ==================== CONSULTATION ====================
+
+audit_bp = Blueprint('audit', __name__, url_prefix='/admin/audit')
+
+
+def _jour(valeur):
+    try:
+        return datetime.strptime(valeur, '%Y-%m-%d') if valeur else None
+    except ValueError:
+        return None
+
+
+def _curseur(valeur):
+    """'<date ISO>_<id>' -> (datetime, id), or None"""
+    try:
+        moment, entree_id = valeur.rsplit('_', 1)
+        return datetime.fromisoformat(moment), int(entree_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+@audit_bp.route('/')
+@login_required
+@admin_required
+def journal():
+    """Journal d'audit filtré par utilisateur, entité et période"""
+    vider()  # changes just made by this process are shown too
+
+    filtres = {
+        'user_id': request.args.get('user_id', type=int),
+        'entite': request.args.get('entite') if request.args.get('entite') in LIBELLES else None,
+        'entite_id': request.args.get('entite_id', type=int),
+        'action': request.args.get('action') if request.args.get('action') in ACTIONS else None,
+        'du': request.args.get('du', ''),
+        'au': request.args.get('au', ''),
+    }
+    requete = JournalAudit.query
+    if filtres['user_id']:
+        requete = requete.filter(JournalAudit.user_id == filtres['user_id'])
+    if filtres['entite']:
+        requete = requete.filter(JournalAudit.entite == filtres['entite'])
+        if filtres['entite_id']:
+            requete = requete.filter(JournalAudit.entite_id == filtres['entite_id'])
+    if filtres['action']:
+        requete = requete.filter(JournalAudit.action == filtres['action'])
+    du, au = _jour(filtres['du']), _jour(filtres['au'])
+    if du:
+        requete = requete.filter(JournalAudit.date >= du)
+    if au:
+        requete = requete.filter(JournalAudit.date < au + timedelta(days=1))
+    curseur = _curseur(request.args.get('avant'))
+    if curseur:
+        moment, entree_id = curseur
+        requete = requete.filter(or_(JournalAudit.date < moment,
+                                     and_(JournalAudit.date == moment, JournalAudit.id < entree_id)))
+
+    entrees = requete.order_by(JournalAudit.date.desc(), JournalAudit.id.desc()).limit(PAR_PAGE + 1).all()
+    page_suivante = None
+    if len(entrees) > PAR_PAGE:
+        entrees = entrees[:PAR_PAGE]
+        page_suivante = url_for('audit.journal', avant=f"{entrees[-1].date.isoformat()}_{entrees[-1].id}",
+                                **{cle: valeur for cle, valeur in filtres.items() if valeur})
+
+    utilisateurs = db.session.query(User.id, User.prenom, User.nom).filter(
+        User.role != 'parent'
+    ).order_by(User.nom, User.prenom).all()
+    return render_template('admin/audit/journal.html',
+                           entrees=[(e, json.loads(e.changements or '{}')) for e in entrees],
+                           page_suivante=page_suivante,
+                           filtres=filtres,
+                           utilisateurs=utilisateurs,
+                           libelles=LIBELLES,
+                           actions=ACTIONS)
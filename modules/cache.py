@@ -0,0 +1,187 @@
+"""
+Shared cache primitives
+
+- VersionCounter: a version number shared by every worker process on the
+  host. It is stored as the size of a small file in CACHE_DIR: bump()
+  appends one byte with O_APPEND (atomic between processes, no lock) and
+  current() is a single os.stat().
+- on_commit(): run a callback after a commit that wrote given models.
+  Covers unit-of-work changes and bulk insert/update/delete statements.
+- VersionedCache: in-process memo whose entries are recomputed as soon as
+  their VersionCounter moves, so a write in one worker refreshes all of them.
+"""
+
+import os
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger('cache')
+
+_DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'cache')
+
+
+def cache_dir():
+    """Directory holding the shared cache files (created on demand)"""
+    path = None
+    if has_app_context():
+        path = current_app.config.get('CACHE_DIR')
+    path = path or os.environ.get('CACHE_DIR') or _DEFAULT_CACHE_DIR
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class VersionCounter:
+    """
+    Version number shared across worker processes
+
+    Args:
+        name (str): Counter name, used as file name in CACHE_DIR
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def _path(self):
+        return os.path.join(cache_dir(), f'{self.name}.version')
+
+    def current(self):
+        """Return the current version (0 if the counter was never bumped)"""
+        try:
+            return os.stat(self._path()).st_size
+        except FileNotFoundError:
+            return 0
+
+    def bump(self):
+        """Increment the version and return the new value"""
+        fd = os.open(self._path(), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, b'.')
+            return os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+
+
+class VersionedCache:
+    """
+    In-process memo invalidated by a VersionCounter
+
+    Entries of an older version are dropped as soon as the version moves.
+    With max_entries, the least recently used entries are dropped beyond
+    that number (use it when keys come from request parameters).
+
+    Args:
+        counter (VersionCounter): Counter bumped whenever the source data changes
+        ttl (int, optional): Maximum age of an entry in seconds, even if the
+                             version did not move (None = no limit)
+        max_entries (int, optional): Maximum number of entries (None = no limit)
+    """
+    def __init__(self, counter, ttl=None, max_entries=None):
+        self.counter = counter
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        """
+        Return the cached value for key, calling compute() if it is missing or stale
+
+        Args:
+            key: Hashable cache key
+            compute (callable): Builds the value when needed
+        """
+        version = self.counter.current()
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry_version, stored_at, value = entry
+            if entry_version == version and (self.ttl is None or now - stored_at < self.ttl):
+                if self.max_entries is not None:
+                    with self._lock:
+                        if key in self._entries:
+                            self._entries.move_to_end(key)
+                return value
+        value = compute()
+        with self._lock:
+            if version != self._version:
+                # Everything cached before the change is stale
+                self._entries.clear()
+                self._version = version
+            self._entries[key] = (version, now, value)
+            self._entries.move_to_end(key)
+            while self.max_entries is not None and len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key=None):
+        """Drop one entry (or all of them) in this process only"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+# ==================== COMMIT HOOKS ====================
+
+_commit_listeners = []
+
+
+def on_commit(*models):
+    """
+    Decorator: call fn(changes) after every commit that wrote one of the models
+
+    changes maps each written model class to the set of primary keys that
+    were inserted, updated or deleted. Bulk statements (Query.delete(),
+    session.execute(update(Model)...)) add None to the set, meaning
+    "unknown rows".
+    """
+    def decorator(fn):
+        _commit_listeners.append((tuple(models), fn))
+        return fn
+    return decorator
+
+
+def _record(session, model, ident):
+    changes = session.info.setdefault('cache_changes', {})
+    changes.setdefault(model, set()).add(ident)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_flushed(session, flush_context):
+    # new/dirty/deleted still show the pre-flush state here
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        _record(session, type(obj), getattr(obj, 'id', None))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            _record(orm_execute_state.session, mapper.class_, None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch_commit(session):
+    changes = session.info.pop('cache_changes', None)
+    if not changes:
+        return
+    for models, fn in _commit_listeners:
+        relevant = {m: ids for m, ids in changes.items() if issubclass(m, models)}
+        if relevant:
+            try:
+                fn(relevant)
+            except Exception as e:
+                logger.error(f"Commit hook {fn.__name__} failed: {str(e)}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('cache_changes', None)
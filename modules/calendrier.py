@@ -1,15 +1,145 @@
+from collections import namedtuple
 from flask import Blueprint, render_template, redirect, url_for, flash, request, session, jsonify
 from flask_login import login_required
 from models import Evenement
 from models import db
 from datetime import datetime, date, timedelta
+from modules.cache import VersionCounter, VersionedCache, on_commit
+from modules.recurrence import (FREQUENCES, MAX_DUREE, MAX_INTERVALLE, dates_occurrences, lire_exceptions,
+                                ecrire_exceptions)
 
 
 calendrier_blueprint = Blueprint('calendrier', __name__, url_prefix='/calendrier')
 
+# Month grids and event lists are built once per change of the events:
+# every commit writing Evenement bumps the 'calendrier' version, and each
+# worker rebuilds what it shows on its next request. Only the months within
+# ANNEES_EN_CACHE years of today are kept, in a bounded LRU: the page is
+# public and crawlers follow the prev/next links without end.
+ANNEES_EN_CACHE = 2
+MAX_ENTREES_CACHE = 64
+# Widest window of the public JSON feed: FullCalendar's month grid asks for 6 weeks
+FENETRE_API_MAX = timedelta(days=42)
+calendrier_version = VersionCounter('calendrier')
+_cache = VersionedCache(calendrier_version, max_entries=MAX_ENTREES_CACHE)
+
+# Plain copy of an occurrence, safe to share between requests
+EvenementVue = namedtuple('EvenementVue', 'id titre description lieu type date heure_debut heure_fin')
+MoisCalendrier = namedtuple('MoisCalendrier', 'weeks month_name')
+
+
+@on_commit(Evenement)
+def _invalidate(changes):
+    calendrier_version.bump()
+
+
+class Occurrence:
+    """One date of an event: the event itself, seen at that date"""
+
+    def __init__(self, evenement, jour):
+        self.evenement = evenement
+        self.date = jour
+
+    def __getattr__(self, nom):
+        return getattr(self.evenement, nom)
+
+
+def evenements_entre(debut, fin):
+    """
+    Occurrences of the events between debut and fin (inclusive), by date and time
+
+    Only the rules overlapping the window are loaded (ix_evenements_periode),
+    then expanded for that window: the cost does not depend on the length
+    of the series.
+    """
+    evenements = Evenement.query.filter(Evenement.date_fin >= debut, Evenement.date <= fin).all()
+    occurrences = [Occurrence(evenement, jour)
+                   for evenement in evenements
+                   for jour in dates_occurrences(evenement, debut, fin)]
+    occurrences.sort(key=lambda o: (o.date, o.heure_debut or datetime.min.time()))
+    return occurrences
+
+
+def _vue(evenement):
+    return EvenementVue(evenement.id, evenement.titre, evenement.description, evenement.lieu, evenement.type,
+                        evenement.date, evenement.heure_debut, evenement.heure_fin)
+
+
+def _construire_mois(year, month):
+    first_day = date(year, month, 1)
+    if month == 12:
+        last_day = date(year + 1, 1, 1) - timedelta(days=1)
+    else:
+        last_day = date(year, month + 1, 1) - timedelta(days=1)
+    # Occurrences of this month (recurring events expanded for the month only)
+    events_by_day = {}
+    for event in evenements_entre(first_day, last_day):
+        events_by_day.setdefault(event.date.day, []).append(_vue(event))
+    calendar_data = [{'day': None, 'events': ()}] * first_day.weekday()
+    for day in range(1, last_day.day + 1):
+        calendar_data.append({'day': day, 'events': tuple(events_by_day.get(day, ()))})
+    while len(calendar_data) % 7 != 0:
+        calendar_data.append({'day': None, 'events': ()})
+    weeks = tuple(tuple(calendar_data[i:i + 7]) for i in range(0, len(calendar_data), 7))
+    return MoisCalendrier(weeks, first_day.strftime('%B'))
+
+
+def mois(year, month):
+    """Grid of a month: weeks of 7 {'day', 'events'} cells (built once per change of the events)"""
+    if abs(year - date.today().year) > ANNEES_EN_CACHE:
+        return _construire_mois(year, month)
+    return _cache.get(('mois', year, month), lambda: _construire_mois(year, month))
+
+
+def a_venir(limite=20):
+    """Next occurrences over the coming year, from today (built once per day and per change)"""
+    today = date.today()
+    return _cache.get(('a_venir', today), lambda: tuple(
+        _vue(o) for o in evenements_entre(today, today + timedelta(days=365))[:20]
+    ))[:limite]
+
+
+def passes(limite=20):
+    """Series that are over, most recent first (built once per day and per change)"""
+    today = date.today()
+    return _cache.get(('passes', today), lambda: tuple(
+        _vue(e) for e in Evenement.query.filter(Evenement.date_fin < today).order_by(
+            Evenement.date.desc(), Evenement.heure_debut
+        ).limit(20)
+    ))[:limite]
+
+
+def _lire_formulaire(event):
+    """Fill an event from the add/edit form; returns an error message or None"""
+    try:
+        event.date = datetime.strptime(request.form['date'], '%Y-%m-%d').date()
+        event.heure_debut = datetime.strptime(request.form['heure_debut'], '%H:%M').time() if request.form.get('heure_debut') else None
+        event.heure_fin = datetime.strptime(request.form['heure_fin'], '%H:%M').time() if request.form.get('heure_fin') else None
+        jusqu_au = request.form.get('recurrence_jusqu_au')
+        event.recurrence_jusqu_au = datetime.strptime(jusqu_au, '%Y-%m-%d').date() if jusqu_au else None
+        event.intervalle = int(request.form.get('intervalle') or 1)
+        event.recurrence_nombre = int(request.form.get('recurrence_nombre') or 0) or None
+    except ValueError:
+        return 'Date, heure ou répétition invalide.'
+    event.titre = request.form['titre']
+    event.description = request.form.get('description')
+    event.lieu = request.form.get('lieu')
+    event.type = request.form.get('type') or 'autre'
+    event.recurrence = request.form.get('recurrence') if request.form.get('recurrence') in FREQUENCES else None
+    if not 1 <= event.intervalle <= MAX_INTERVALLE:
+        return f'L\'intervalle doit être compris entre 1 et {MAX_INTERVALLE}.'
+    if event.recurrence_jusqu_au and event.recurrence_jusqu_au < event.date:
+        return 'La date de fin de la répétition précède la date de l\'événement.'
+    if event.recurrence_jusqu_au and event.recurrence_jusqu_au > event.date + MAX_DUREE:
+        return 'Une répétition ne peut pas dépasser deux ans.'
+    event.recurrence_exceptions = ecrire_exceptions(lire_exceptions(request.form.get('recurrence_exceptions')))
+    if not event.recurrence:
+        event.intervalle, event.recurrence_jusqu_au, event.recurrence_nombre = 1, None, None
+        event.recurrence_exceptions = None
+    return None
+
 @calendrier_blueprint.route('/')
 def index():
-    from models import Evenement
     # Get month and year from query parameters, default to current month/year
     month = request.args.get('month', datetime.now().month)
     year = request.args.get('year', datetime.now().year)
@@ -29,37 +159,14 @@ def index():
     elif month > 12:
         month = 1
         year += 1
-    first_day = date(year, month, 1)
-    if month == 12:
-        last_day = date(year + 1, 1, 1) - timedelta(days=1)
-    else:
-        last_day = date(year, month + 1, 1) - timedelta(days=1)
-    # Get events for this month using ORM
-    events = Evenement.query.filter(Evenement.date.between(first_day, last_day)).order_by(Evenement.date, Evenement.heure_debut).all()
-    # Organize events by day
-    events_by_day = {}
-    for event in events:
-        day = event.date.day
-        if day not in events_by_day:
-            events_by_day[day] = []
-        events_by_day[day].append(event)
-    calendar_data = []
-    first_weekday = first_day.weekday()
-    for _ in range(first_weekday):
-        calendar_data.append({'day': None, 'events': []})
-    for day in range(1, last_day.day + 1):
-        calendar_data.append({'day': day, 'events': events_by_day.get(day, [])})
-    while len(calendar_data) % 7 != 0:
-        calendar_data.append({'day': None, 'events': []})
-    weeks = []
-    for i in range(0, len(calendar_data), 7):
-        weeks.append(calendar_data[i:i+7])
-    month_name = first_day.strftime('%B')
+    if not 1 <= year <= 9999:
+        year, month = now.year, now.month
+    grille = mois(year, month)
     return render_template('calendrier/index.html',
-                          weeks=weeks,
+                          weeks=grille.weeks,
                           month=month,
                           year=year,
-                          month_name=month_name,
+                          month_name=grille.month_name,
                           prev_month=(month - 1) if month > 1 else 12,
                           prev_year=year if month > 1 else year - 1,
                           next_month=(month + 1) if month < 12 else 1,
@@ -69,31 +176,9 @@ def index():
 @calendrier_blueprint.route('/evenements')
 @login_required
 def evenements():
-    from models import Evenement, User
-    from sqlalchemy import desc
-    from datetime import date
-    
-    # Get upcoming events
-    evenements_a_venir = Evenement.query.join(
-        User, Evenement.organisateur_id == User.id, isouter=True
-    ).filter(
-        Evenement.date >= date.today()
-    ).order_by(
-        Evenement.date, Evenement.heure_debut
-    ).limit(20).all()
-    
-    # Get past events
-    evenements_passes = Evenement.query.join(
-        User, Evenement.organisateur_id == User.id, isouter=True
-    ).filter(
-        Evenement.date < date.today()
-    ).order_by(
-        desc(Evenement.date), Evenement.heure_debut
-    ).limit(20).all()
-    
     return render_template('calendrier/evenements.html',
-                          evenements_a_venir=evenements_a_venir,
-                          evenements_passes=evenements_passes)
+                          evenements_a_venir=a_venir(),
+                          evenements_passes=passes())
 
 @calendrier_blueprint.route('/evenements/<int:evenement_id>')
 def details(evenement_id):
@@ -101,7 +186,7 @@ def details(evenement_id):
     
     # Get event with organizer information
     event = Evenement.query.join(
-        User, Evenement.organisateur_id == User.id, isouter=True
+        User, Evenement.cree_par == User.id, isouter=True
     ).add_columns(
         Evenement, 
         User.prenom.label('organisateur_prenom'),
@@ -117,7 +202,8 @@ def details(evenement_id):
     event_data.organisateur_prenom = event.organisateur_prenom
     event_data.organisateur_nom = event.organisateur_nom
     
-    return render_template('calendrier/details.html', event=event_data)
+    return render_template('calendrier/details.html', event=event_data, frequences=FREQUENCES,
+                           exceptions=sorted(lire_exceptions(event_data.recurrence_exceptions)))
 
 @calendrier_blueprint.route('/evenements/ajouter', methods=['GET', 'POST'])
 @login_required
@@ -128,29 +214,16 @@ def ajouter():
         return redirect(url_for('calendrier.evenements'))
     
     if request.method == 'POST':
-        titre = request.form['titre']
-        description = request.form['description']
-        date_event = request.form['date']
-        heure_debut = request.form['heure_debut']
-        heure_fin = request.form['heure_fin']
-        lieu = request.form['lieu']
-        public = int(request.form.get('public', 0))
-        important = int(request.form.get('important', 0))
-        event = Evenement(
-            titre=titre,
-            description=description,
-            date=date_event,
-            heure_debut=heure_debut,
-            heure_fin=heure_fin,
-            lieu=lieu,
-            public=public,
-            important=important
-        )
+        event = Evenement(cree_par=session.get('user_id'))
+        erreur = _lire_formulaire(event)
+        if erreur:
+            flash(erreur, 'danger')
+            return render_template('calendrier/ajouter.html', frequences=FREQUENCES)
         db.session.add(event)
         db.session.commit()
         flash('Événement ajouté avec succès!', 'success')
-        return redirect(url_for('calendrier.index'))
-    return render_template('calendrier/ajouter.html')
+        return redirect(url_for('calendrier.index', month=event.date.month, year=event.date.year))
+    return render_template('calendrier/ajouter.html', frequences=FREQUENCES)
 
 @calendrier_blueprint.route('/evenements/<int:evenement_id>/modifier', methods=['GET', 'POST'])
 @login_required
@@ -166,23 +239,20 @@ def modifier(evenement_id):
         return redirect(url_for('calendrier.evenements'))
     
     # Check if user is the organizer or has admin/director privileges
-    if event.organisateur_id != session.get('user_id') and session.get('user_role') not in ['admin', 'directeur']:
+    if event.cree_par != session.get('user_id') and session.get('user_role') not in ['admin', 'directeur']:
         flash('Vous n\'êtes pas autorisé à modifier cet événement.', 'danger')
         return redirect(url_for('calendrier.evenements'))
     
     if request.method == 'POST':
-        event.titre = request.form['titre']
-        event.description = request.form['description']
-        event.date = request.form['date']
-        event.heure_debut = request.form['heure_debut']
-        event.heure_fin = request.form['heure_fin']
-        event.lieu = request.form['lieu']
-        event.public = int(request.form.get('public', 0))
-        event.important = int(request.form.get('important', 0))
+        erreur = _lire_formulaire(event)
+        if erreur:
+            db.session.rollback()
+            flash(erreur, 'danger')
+            return redirect(url_for('calendrier.modifier', evenement_id=evenement_id))
         db.session.commit()
         flash('Événement modifié avec succès!', 'success')
         return redirect(url_for('calendrier.details', evenement_id=evenement_id))
-    return render_template('calendrier/modifier.html', event=event)
+    return render_template('calendrier/modifier.html', event=event, frequences=FREQUENCES)
 
 @calendrier_blueprint.route('/evenements/<int:evenement_id>/supprimer', methods=['POST'])
 @login_required
@@ -216,11 +286,11 @@ def api_evenements():
         end_date = datetime.strptime(end_date.split('T')[0], '%Y-%m-%d').date()
     except ValueError:
         return jsonify([]), 400
+    if end_date < start_date or end_date - start_date > FENETRE_API_MAX:
+        return jsonify([]), 400
     
-    # Get events between start and end dates
-    events = Evenement.query.filter(
-        Evenement.date.between(start_date, end_date)
-    ).order_by(Evenement.date, Evenement.heure_debut).all()
+    # Occurrences between start and end dates (one entry per date of a recurring event)
+    events = evenements_entre(start_date, end_date)
     
     # Format events for FullCalendar
     formatted_events = []
@@ -251,3 +321,8 @@ def get_event_color(event_type):
         'autre': '#757575'        # Gray
     }
     return colors.get(event_type, '#757575')
+
+
+@calendrier_blueprint.context_processor
+def _couleurs():
+    return {'get_event_color': get_event_color}
@@ -5,6 +5,7 @@ from flask_login import login_required
 import os
 import uuid
 from modules.whatsapp_notifications import send_announcement_to_whatsapp
+from modules.jobs import job_handler, enqueue
 
 communication_blueprint = Blueprint('communication', __name__, url_prefix='/communication')
 
@@ -107,11 +108,8 @@ def ajouter_annonce():
         # Send WhatsApp notification for public announcements
         if public:
             try:
-                result = send_announcement_to_whatsapp(annonce)
-                if result.get('error'):
-                    flash(f'Annonce ajoutée, mais erreur lors de l\'envoi des notifications WhatsApp: {result["error"]}', 'warning')
-                else:
-                    flash('Annonce ajoutée avec succès et notifications WhatsApp envoyées!', 'success')
+                enqueue('communication.whatsapp_annonce', {'annonce_id': annonce.id})
+                flash('Annonce ajoutée avec succès. Les notifications WhatsApp sont en cours d\'envoi.', 'success')
             except Exception as e:
                 flash(f'Annonce ajoutée, mais erreur lors de l\'envoi des notifications WhatsApp: {str(e)}', 'warning')
         else:
@@ -139,11 +137,8 @@ def modifier_annonce(annonce_id):
         # Send WhatsApp notification if the announcement wasn't public before but is now
         if not was_public and annonce.public:
             try:
-                result = send_announcement_to_whatsapp(annonce)
-                if result.get('error'):
-                    flash(f'Annonce modifiée, mais erreur lors de l\'envoi des notifications WhatsApp: {result["error"]}', 'warning')
-                else:
-                    flash('Annonce modifiée avec succès et notifications WhatsApp envoyées!', 'success')
+                enqueue('communication.whatsapp_annonce', {'annonce_id': annonce.id})
+                flash('Annonce modifiée avec succès. Les notifications WhatsApp sont en cours d\'envoi.', 'success')
             except Exception as e:
                 flash(f'Annonce modifiée, mais erreur lors de l\'envoi des notifications WhatsApp: {str(e)}', 'warning')
         else:
@@ -152,6 +147,26 @@ def modifier_annonce(annonce_id):
         return redirect(url_for('communication.annonces'))
     return render_template('communication/modifier_annonce.html', annonce=annonce)
 
+@job_handler('communication.whatsapp_annonce')
+def whatsapp_annonce_job(ctx, annonce_id):
+    """Tâche de fond: envoie une annonce publique aux destinataires WhatsApp"""
+    annonce = Annonce.query.get(annonce_id)
+    if not annonce:
+        return {'status': 'skipped', 'reason': 'annonce_supprimee'}
+    
+    ctx.progress(5, 'Envoi des notifications WhatsApp')
+    result = send_announcement_to_whatsapp(annonce)
+    if result.get('error'):
+        # Nothing was sent (notifier not configured): safe to retry
+        raise RuntimeError(result['error'])
+    if 'status' in result:
+        return result
+    
+    # Per-recipient failures are reported, not retried: a retry would resend to everyone
+    envoyes = sum(1 for r in result.values() if r.get('success'))
+    return {'envoyes': envoyes, 'echecs': len(result) - envoyes,
+            'erreurs': {phone: r.get('error') for phone, r in result.items() if not r.get('success')}}
+
 @communication_blueprint.route('/annonces/<int:annonce_id>/supprimer', methods=['POST'])
 @login_required
 def supprimer_annonce(annonce_id):
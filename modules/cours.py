@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import login_required
 from models import Cours, Classe, Enseignement
 from models import db
+from modules import reference_data
 
 
 cours_blueprint = Blueprint('cours', __name__, url_prefix='/cours')
@@ -66,8 +67,8 @@ def ajouter():
         return redirect(url_for('cours.liste'))
 
     # Get data for form
-    classes = Classe.query.order_by(Classe.niveau, Classe.nom).all()
-    professeurs = User.query.filter_by(role='professeur').order_by(User.nom, User.prenom).all()
+    classes = reference_data.classes()
+    professeurs = reference_data.professeurs()
     return render_template('cours/ajouter.html', classes=classes, professeurs=professeurs)
 
 @cours_blueprint.route('/<int:cours_id>')
@@ -126,6 +127,6 @@ def modifier(cours_id):
         return redirect(url_for('cours.details', cours_id=cours.id))
 
     # Get data for form
-    classes = Classe.query.order_by(Classe.niveau, Classe.nom).all()
-    professeurs = User.query.filter_by(role='professeur').order_by(User.nom, User.prenom).all()
+    classes = reference_data.classes()
+    professeurs = reference_data.professeurs()
     return render_template('cours/modifier.html', cours=cours, classes=classes, professeurs=professeurs, enseignement=enseignement)
@@ -0,0 +1,186 @@
+"""
+Database engine profiles
+
+Builds the SQLAlchemy engine options from the Config and applies the
+SQLite pragmas on every new connection. The 'production' profile lets
+several gunicorn workers read concurrently while one of them writes
+(WAL journal + busy timeout) instead of failing with "database is locked".
+"""
+
+import logging
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger('database')
+
+# Profiles selectable with Config.DB_ENGINE_PROFILE
+ENGINE_PROFILES = ('production', 'default')
+
+
+def _backend(database_uri):
+    """Return (backend_name, is_memory) for a database URI"""
+    url = make_url(database_uri)
+    backend = url.get_backend_name()
+    is_memory = backend == 'sqlite' and url.database in (None, '', ':memory:')
+    return backend, is_memory
+
+
+def get_profile(config):
+    """Return the engine profile name configured, falling back to 'production'"""
+    profile = config.get('DB_ENGINE_PROFILE') or 'production'
+    if profile not in ENGINE_PROFILES:
+        logger.warning(f"Unknown DB_ENGINE_PROFILE '{profile}', using 'production'")
+        profile = 'production'
+    return profile
+
+
+def sqlite_pragmas(config):
+    """
+    Pragmas executed on every new SQLite connection
+
+    Args:
+        config (dict): Flask application config
+
+    Returns:
+        list: (pragma, value) tuples, in execution order
+    """
+    return [
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+        ('busy_timeout', int(config.get('SQLITE_BUSY_TIMEOUT_MS', 15000))),
+        ('mmap_size', int(config.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))),
+        # Negative value = size in KiB rather than in pages
+        ('cache_size', -int(config.get('SQLITE_CACHE_SIZE_KB', 64 * 1024))),
+        ('foreign_keys', 'ON'),
+        ('temp_store', 'MEMORY'),
+    ]
+
+
+def engine_options(config):
+    """
+    Compute SQLALCHEMY_ENGINE_OPTIONS for the configured profile and backend
+
+    Args:
+        config (dict): Flask application config
+
+    Returns:
+        dict: Keyword arguments passed to create_engine()
+    """
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    if get_profile(config) == 'default':
+        return options
+
+    backend, is_memory = _backend(config['SQLALCHEMY_DATABASE_URI'])
+
+    if backend == 'sqlite':
+        if is_memory:
+            # In-memory databases live in a single connection, keep SQLAlchemy's pool
+            return options
+        connect_args = dict(options.get('connect_args') or {})
+        # pysqlite's own lock wait, in seconds (busy_timeout pragma is set as well)
+        connect_args.setdefault('timeout', int(config.get('SQLITE_BUSY_TIMEOUT_MS', 15000)) / 1000)
+        connect_args.setdefault('check_same_thread', False)
+        options['connect_args'] = connect_args
+        # WAL allows many readers: keep a few connections open per worker,
+        # SQLite itself serialises the writers
+        options.setdefault('pool_size', int(config.get('DB_POOL_SIZE', 5)))
+        options.setdefault('max_overflow', int(config.get('DB_MAX_OVERFLOW', 10)))
+        options.setdefault('pool_timeout', int(config.get('DB_POOL_TIMEOUT', 30)))
+    else:
+        # Client/server backends (MySQL, PostgreSQL)
+        options.setdefault('pool_size', int(config.get('DB_POOL_SIZE', 5)))
+        options.setdefault('max_overflow', int(config.get('DB_MAX_OVERFLOW', 10)))
+        options.setdefault('pool_timeout', int(config.get('DB_POOL_TIMEOUT', 30)))
+        options.setdefault('pool_recycle', int(config.get('DB_POOL_RECYCLE', 1800)))
+        options.setdefault('pool_pre_ping', True)
+
+    return options
+
+
+def _install_sqlite_pragmas(engine, pragmas):
+    """Register a connect listener applying the pragmas to each new DBAPI connection"""
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+
+def init_database(app, db):
+    """
+    Configure the engine profile and bind the SQLAlchemy extension to the app
+
+    Replaces db.init_app(app): the engine options must be known before
+    Flask-SQLAlchemy creates the engine.
+
+    Args:
+        app (Flask): The application
+        db (SQLAlchemy): The extension instance from models.py
+    """
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    db.init_app(app)
+
+    backend, is_memory = _backend(app.config['SQLALCHEMY_DATABASE_URI'])
+    if backend == 'sqlite' and get_profile(app.config) == 'production':
+        pragmas = sqlite_pragmas(app.config)
+        if is_memory:
+            # WAL and mmap have no meaning for :memory:
+            pragmas = [p for p in pragmas if p[0] not in ('journal_mode', 'mmap_size')]
+        with app.app_context():
+            _install_sqlite_pragmas(db.engine, pragmas)
+
+
+def effective_settings(db):
+    """
+    Read back the settings actually in effect on a live connection
+
+    Must be called inside an application context.
+
+    Returns:
+        dict: Backend, pool and (for SQLite) pragma values
+    """
+    engine = db.engine
+    settings = {
+        'backend': engine.dialect.name,
+        'pool': type(engine.pool).__name__,
+    }
+    if hasattr(engine.pool, 'size'):
+        settings['pool_size'] = engine.pool.size()
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as conn:
+            for name in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size',
+                         'cache_size', 'foreign_keys', 'temp_store'):
+                settings[name] = conn.exec_driver_sql(f'PRAGMA {name}').scalar()
+    return settings
+
+
+def check_engine_settings(app, db):
+    """
+    Startup check: log the effective engine settings and warn when the
+    production profile could not be applied (e.g. WAL refused on a network share)
+
+    Returns:
+        dict: The effective settings (empty if the database is unreachable)
+    """
+    try:
+        with app.app_context():
+            settings = effective_settings(db)
+    except Exception as e:
+        logger.error(f"Database startup check failed: {str(e)}")
+        return {}
+
+    profile = get_profile(app.config)
+    logger.info(f"Database profile '{profile}': " + ', '.join(f'{k}={v}' for k, v in settings.items()))
+
+    if settings.get('backend') == 'sqlite' and profile == 'production':
+        _, is_memory = _backend(app.config['SQLALCHEMY_DATABASE_URI'])
+        if not is_memory and str(settings.get('journal_mode')).lower() != 'wal':
+            logger.warning("SQLite is not in WAL mode: concurrent readers will block on writers")
+        if settings.get('foreign_keys') != 1:
+            logger.warning("SQLite foreign key enforcement is disabled")
+    return settings
@@ -1,7 +1,11 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, session
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session, jsonify, abort
 from flask_login import login_required, current_user
 from models import Eleve
 from models import db
+from modules.loaders import eager
+from modules import reference_data
+from modules import timeline
+from modules.import_eleves import importer_eleves
 import os
 import traceback
 from werkzeug.utils import secure_filename
@@ -28,11 +32,10 @@ def liste():
     classe_id = request.args.get('classe_id', '')
 
     # Get all classes for the filter
-    from models import Classe
-    classes = Classe.query.order_by(Classe.niveau, Classe.nom).all()
+    classes = reference_data.classes()
 
     # Build the query using SQLAlchemy ORM
-    query = Eleve.query.filter_by(actif=True)
+    query = Eleve.query.filter_by(actif=True).options(*eager(Eleve, 'classe'))
     if search:
         search_term = f"%{search}%"
         query = query.filter(
@@ -57,8 +60,8 @@ def ajouter():
         flash('Accès non autorisé.', 'danger')
         return redirect(url_for('accueil'))
 
-    from models import Classe, User
-    classes = Classe.query.order_by(Classe.niveau, Classe.nom).all()
+    from models import User
+    classes = reference_data.classes()
     parents = User.query.filter_by(role='parent').order_by(User.nom, User.prenom).all()
 
     if request.method == 'POST':
@@ -143,6 +146,53 @@ def ajouter():
     return render_template('eleves/ajouter.html', classes=classes, parents=parents)
 
 
+@eleves_blueprint.route('/importer', methods=['GET', 'POST'])
+@login_required
+def importer():
+    """Import d'une liste d'élèves (CSV/XLSX) avec un ZIP de photos facultatif"""
+    if not is_admin_or_directeur():
+        flash('Accès non autorisé.', 'danger')
+        return redirect(url_for('accueil'))
+
+    classes = reference_data.classes()
+    erreurs = []
+    if request.method == 'POST':
+        fichier = request.files.get('fichier')
+        if not fichier or not fichier.filename:
+            flash('Veuillez choisir un fichier CSV ou XLSX.', 'warning')
+            return redirect(url_for('eleves.importer'))
+        photos = request.files.get('photos')
+        if photos is not None and not photos.filename:
+            photos = None
+
+        resultat = importer_eleves(
+            fichier, photos=photos,
+            dossier_photos=os.path.join(ensure_upload_dirs(), 'eleves'),
+            classe_defaut=request.form.get('classe_id', type=int)
+        )
+        if not resultat.erreurs:
+            flash(f'Import terminé: {resultat.creees} élève(s) ajouté(s).', 'success')
+            return redirect(url_for('eleves.liste'))
+        erreurs = resultat.erreurs
+        flash(f'{len(erreurs)} erreur(s): aucun élève n\'a été enregistré. Corrigez le fichier puis recommencez.', 'danger')
+
+    return render_template('eleves/importer.html', classes=classes, erreurs=erreurs)
+
+
+def _bilans(eleve_id):
+    """Summaries of the student's closed school years, most recent first"""
+    from models import BilanAnnuel
+    return BilanAnnuel.query.filter_by(eleve_id=eleve_id).order_by(BilanAnnuel.annee_scolaire.desc()).all()
+
+def _derniers_archives(eleve, annee):
+    """Last 10 presences, grades and payments of a closed year, read from its archive"""
+    def derniers(type_):
+        return timeline.page(eleve, limite=10, types=(type_,), annee=annee).activites
+    presences = [dict(a.details, date=a.moment.date(), cours_nom=a.titre) for a in derniers('presence')]
+    notes = [dict(a.details, date=a.moment.date(), cours_nom=a.titre) for a in derniers('note')]
+    paiements = [dict(a.details, date=a.moment.date(), frais_type=a.details['frais']) for a in derniers('paiement')]
+    return presences, notes, paiements
+
 @eleves_blueprint.route('/<int:eleve_id>')
 @login_required
 def details(eleve_id):
@@ -151,14 +201,68 @@ def details(eleve_id):
     if not eleve:
         flash("Élève non trouvé.", "danger")
         return redirect(url_for('eleves.liste'))
-    presences = Presence.query.filter_by(eleve_id=eleve_id).order_by(Presence.date.desc()).limit(10).all()
-    notes = Note.query.filter_by(eleve_id=eleve_id).order_by(Note.date.desc()).limit(10).all()
-    paiements = Paiement.query.filter_by(eleve_id=eleve_id).order_by(Paiement.date.desc()).limit(10).all()
+    # ?annee=2023-2024: a closed school year, read from its archive file
+    annee = request.args.get('annee')
+    if annee:
+        try:
+            presences, notes, paiements = _derniers_archives(eleve, annee)
+        except (ValueError, LookupError):
+            flash(f"Aucune archive pour l'année {annee}.", "warning")
+            return redirect(url_for('eleves.details', eleve_id=eleve_id))
+    else:
+        presences = Presence.query.filter_by(eleve_id=eleve_id).order_by(Presence.date.desc()).limit(10).all()
+        notes = Note.query.filter_by(eleve_id=eleve_id).order_by(Note.date.desc()).limit(10).all()
+        paiements = Paiement.query.filter_by(eleve_id=eleve_id).order_by(Paiement.date.desc()).limit(10).all()
     return render_template('eleves/details.html', 
                           eleve=eleve, 
                           presences=presences, 
                           notes=notes, 
-                          paiements=paiements)
+                          paiements=paiements,
+                          annee=annee,
+                          bilans=_bilans(eleve_id))
+
+def _page_historique(eleve_id):
+    """Eleve and timeline page for the current user; aborts if the student is not visible"""
+    eleve = Eleve.query.get_or_404(eleve_id)
+    if session.get('user_role') in ['admin', 'directeur']:
+        types = None
+    elif session.get('user_role') == 'professeur':
+        types = timeline.SOURCES_PROFESSEUR
+    elif eleve.parent_id is not None and eleve.parent_id == current_user.id:
+        types = timeline.SOURCES_PARENT
+    else:
+        abort(403)
+    try:
+        page = timeline.page(eleve, request.args.get('curseur'),
+                             request.args.get('limite', 30, type=int), types,
+                             annee=request.args.get('annee'))
+    except ValueError:
+        abort(400)
+    except LookupError:
+        abort(404)
+    return eleve, page
+
+@eleves_blueprint.route('/<int:eleve_id>/historique')
+@login_required
+def historique(eleve_id):
+    """Historique complet de l'élève, du plus récent au plus ancien (?annee= pour une année clôturée)"""
+    eleve, page = _page_historique(eleve_id)
+    return render_template('eleves/historique.html', eleve=eleve, page=page,
+                           premiere_page=not request.args.get('curseur'),
+                           annee=request.args.get('annee'),
+                           bilans=_bilans(eleve_id))
+
+@eleves_blueprint.route('/<int:eleve_id>/historique.json')
+@login_required
+def historique_json(eleve_id):
+    """Historique de l'élève en JSON (même pagination par curseur)"""
+    eleve, page = _page_historique(eleve_id)
+    return jsonify({
+        'eleve_id': eleve.id,
+        'annee': request.args.get('annee'),
+        'activites': [timeline.to_dict(a) for a in page.activites],
+        'curseur_suivant': page.curseur_suivant,
+    })
 
 @eleves_blueprint.route('/<int:eleve_id>/modifier', methods=['GET', 'POST'])
 @login_required
@@ -167,13 +271,13 @@ def modifier(eleve_id):
         flash('Accès non autorisé.', 'danger')
         return redirect(url_for('accueil'))
 
-    from models import Classe, User
+    from models import User
     eleve = Eleve.query.get(eleve_id)
     if not eleve:
         flash('Elève non trouvé.', 'danger')
         return redirect(url_for('eleves.liste'))
 
-    classes = Classe.query.order_by(Classe.niveau, Classe.nom).all()
+    classes = reference_data.classes()
     parents = User.query.filter_by(role='parent').order_by(User.nom, User.prenom).all()
 
     if request.method == 'POST':
@@ -0,0 +1,355 @@
+"""
+Weekly timetable
+
+The weekly hours of every Enseignement (heures_hebdo) are placed on the
+grid of EMPLOI_DU_TEMPS_JOURS days x EMPLOI_DU_TEMPS_CRENEAUX slots by
+modules/solveur_horaire.py, with three hard constraints: a class, a
+teacher and a room (Classe.salle) never have two lessons at the same time,
+and a teacher is never given a slot listed in IndisponibiliteProfesseur.
+
+    rapport = generer('2025-2026')          # or: flask emploi generer 2025-2026
+    cours_id = cours_actuel(classe_id)      # course of the class right now, or None
+
+The result is stored as one Seance row per lesson. Generating again
+starts from the stored Seance rows: lessons that are still valid keep
+their slot, so a change (a new unavailability, one more hour of maths)
+only moves the few lessons it conflicts with, and only those rows are
+deleted and inserted. `depuis_zero=True` ignores the stored timetable.
+
+Classes with more active pupils than Classe.capacite are reported as a
+warning: pupils are not split across rooms.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime, time
+
+import click
+from flask import Blueprint, current_app, flash, redirect, render_template, request, session, url_for
+from flask.cli import AppGroup
+from flask_login import login_required
+from sqlalchemy import delete, func, insert
+
+from models import db, Classe, Cours, Eleve, Enseignement, IndisponibiliteProfesseur, Seance, User
+from modules.archivage_annuel import annee_scolaire_de
+from modules.solveur_horaire import Besoin, resoudre
+
+logger = logging.getLogger('emploi_du_temps')
+
+JOURS = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche']
+
+emploi_du_temps_bp = Blueprint('emploi_du_temps', __name__, url_prefix='/emploi-du-temps')
+
+# ==================== GRID ====================
+
+def _heure(texte):
+    heures, minutes = texte.strip().split(':')
+    return time(int(heures), int(minutes))
+
+
+def creneaux():
+    """[(debut, fin), ...] of the slots of a day, from EMPLOI_DU_TEMPS_CRENEAUX"""
+    resultat = []
+    for creneau in current_app.config['EMPLOI_DU_TEMPS_CRENEAUX']:
+        debut, fin = creneau.split('-')
+        resultat.append((_heure(debut), _heure(fin)))
+    return resultat
+
+
+def jours():
+    return JOURS[:current_app.config['EMPLOI_DU_TEMPS_JOURS']]
+
+
+def grille():
+    """Every (jour, numero) of the week, first slots of each day first"""
+    return [(jour, numero) for numero in range(len(creneaux())) for jour in range(len(jours()))]
+
+
+def creneau_a(moment):
+    """(jour, numero) of the slot running at `moment`, or None outside lessons"""
+    if moment.weekday() >= len(jours()):
+        return None
+    heure = moment.time()
+    for numero, (debut, fin) in enumerate(creneaux()):
+        if debut <= heure < fin:
+            return moment.weekday(), numero
+    return None
+
+
+def annee_courante():
+    """Latest school year with teaching assignments (the current one when there are none)"""
+    return db.session.query(func.max(Enseignement.annee_scolaire)).scalar() or annee_scolaire_de()
+
+# ==================== GENERATION ====================
+
+def _besoins(annee):
+    lignes = (db.session.query(Enseignement.id, Enseignement.classe_id, Enseignement.professeur_id,
+                               Enseignement.heures_hebdo, Classe.salle)
+              .join(Classe, Enseignement.classe_id == Classe.id)
+              .filter(Enseignement.annee_scolaire == annee)
+              .all())
+    return [Besoin(id=ens_id, classe=classe_id, professeur=professeur_id,
+                   salle=(salle or '').strip().upper() or None, heures=heures or 0)
+            for ens_id, classe_id, professeur_id, heures, salle in lignes]
+
+
+def _indisponibles(professeurs):
+    indisponibles = defaultdict(set)
+    if professeurs:
+        for professeur_id, jour, numero in db.session.query(
+                IndisponibiliteProfesseur.professeur_id, IndisponibiliteProfesseur.jour,
+                IndisponibiliteProfesseur.creneau
+        ).filter(IndisponibiliteProfesseur.professeur_id.in_(professeurs)):
+            indisponibles[professeur_id].add((jour, numero))
+    return indisponibles
+
+
+def _avertissements_capacite(annee):
+    effectifs = (db.session.query(Classe.nom, Classe.capacite, func.count(Eleve.id))
+                 .join(Eleve, (Eleve.classe_id == Classe.id) & (Eleve.actif == True))
+                 .filter(Classe.annee_scolaire == annee)
+                 .group_by(Classe.id, Classe.nom, Classe.capacite)
+                 .all())
+    return [f"La classe {nom} compte {effectif} élèves pour une capacité de {capacite}."
+            for nom, capacite, effectif in effectifs if capacite and effectif > capacite]
+
+
+def generer(annee=None, depuis_zero=False):
+    """
+    (Re)generate the timetable of a school year and store it as Seance rows
+
+    Args:
+        annee (str, optional): School year, e.g. '2025-2026' (default: annee_courante())
+        depuis_zero (bool): Ignore the stored timetable instead of adjusting it
+
+    Returns:
+        dict: places, non_places ([(Enseignement, heures manquantes)]), conserves,
+              ajoutees, retirees, duree (seconds) and avertissements
+    """
+    annee = annee or annee_courante()
+    besoins = _besoins(annee)
+    par_id = {b.id: b for b in besoins}
+    indisponibles = _indisponibles({b.professeur for b in besoins})
+
+    existantes = (db.session.query(Seance.id, Seance.enseignement_id, Seance.jour, Seance.creneau)
+                  .filter(Seance.annee_scolaire == annee)
+                  .order_by(Seance.enseignement_id, Seance.jour, Seance.creneau)
+                  .all())
+    precedent, rangs = {}, defaultdict(int)
+    if not depuis_zero:
+        for _, ens_id, jour, numero in existantes:
+            precedent[(ens_id, rangs[ens_id])] = (jour, numero)
+            rangs[ens_id] += 1
+
+    solution = resoudre(besoins, grille(), indisponibles, precedent=precedent)
+
+    # Only the rows that changed are written
+    voulues = {(lecon[0], jour, numero) for lecon, (jour, numero) in solution.placement.items()}
+    actuelles = {(ens_id, jour, numero): seance_id for seance_id, ens_id, jour, numero in existantes}
+    a_retirer = [seance_id for cle, seance_id in actuelles.items() if cle not in voulues]
+    a_ajouter = sorted(voulues - set(actuelles))
+    if a_retirer:
+        db.session.execute(delete(Seance).where(Seance.id.in_(a_retirer)))
+    if a_ajouter:
+        enseignements = {e.id: e for e in Enseignement.query.filter(
+            Enseignement.id.in_({ens_id for ens_id, _, _ in a_ajouter}))}
+        db.session.execute(insert(Seance), [{
+            'enseignement_id': ens_id,
+            'classe_id': enseignements[ens_id].classe_id,
+            'cours_id': enseignements[ens_id].cours_id,
+            'professeur_id': enseignements[ens_id].professeur_id,
+            'annee_scolaire': annee,
+            'jour': jour,
+            'creneau': numero,
+            'salle': par_id[ens_id].salle,
+        } for ens_id, jour, numero in a_ajouter])
+    db.session.commit()
+
+    manquantes = defaultdict(int)
+    for ens_id, _ in solution.non_places:
+        manquantes[ens_id] += 1
+    non_places = []
+    if manquantes:
+        enseignements = Enseignement.query.filter(Enseignement.id.in_(manquantes)).all()
+        non_places = [(e, manquantes[e.id]) for e in enseignements]
+
+    logger.info("Emploi du temps %s: %d séance(s) placée(s), %d non placée(s), %d ajoutée(s), %d retirée(s) en %.2f s",
+                annee, len(solution.placement), len(solution.non_places), len(a_ajouter), len(a_retirer),
+                solution.duree)
+    return {
+        'annee': annee,
+        'places': len(solution.placement),
+        'non_places': non_places,
+        'conserves': solution.conserves,
+        'ajoutees': len(a_ajouter),
+        'retirees': len(a_retirer),
+        'duree': solution.duree,
+        'avertissements': _avertissements_capacite(annee),
+    }
+
+
+def cours_actuel(classe_id, moment=None):
+    """Id of the course the class has at `moment` (default: now), or None"""
+    creneau = creneau_a(moment or datetime.now())
+    if creneau is None:
+        return None
+    return db.session.query(Seance.cours_id).filter(
+        Seance.classe_id == classe_id, Seance.jour == creneau[0], Seance.creneau == creneau[1]
+    ).scalar()
+
+# ==================== PAGES ====================
+
+def _gestionnaire():
+    return session.get('user_role') in ['admin', 'directeur']
+
+
+@emploi_du_temps_bp.route('/')
+@login_required
+def index():
+    """Emploi du temps d'une classe ou d'un professeur"""
+    if not session.get('user_role') in ['admin', 'directeur', 'professeur']:
+        flash('Accès non autorisé.', 'danger')
+        return redirect(url_for('accueil'))
+
+    annee = request.args.get('annee') or annee_courante()
+    classe_id = request.args.get('classe_id', type=int)
+    professeur_id = request.args.get('professeur_id', type=int)
+    if not classe_id and not professeur_id and session.get('user_role') == 'professeur':
+        professeur_id = session.get('user_id')
+
+    classes = Classe.query.filter_by(annee_scolaire=annee).order_by(Classe.nom).all()
+    if not classes:
+        classes = Classe.query.order_by(Classe.nom).all()
+    professeurs = User.query.filter_by(role='professeur').order_by(User.nom, User.prenom).all()
+    if not classe_id and not professeur_id and classes:
+        classe_id = classes[0].id
+
+    requete = (db.session.query(Seance, Cours.nom, Classe.nom, User.prenom, User.nom)
+               .join(Cours, Seance.cours_id == Cours.id)
+               .join(Classe, Seance.classe_id == Classe.id)
+               .join(User, Seance.professeur_id == User.id)
+               .filter(Seance.annee_scolaire == annee))
+    if professeur_id:
+        requete = requete.filter(Seance.professeur_id == professeur_id)
+    else:
+        requete = requete.filter(Seance.classe_id == classe_id)
+    cases = {(seance.jour, seance.creneau): {
+        'cours': cours_nom, 'classe': classe_nom, 'professeur': f"{prenom} {nom}", 'salle': seance.salle,
+    } for seance, cours_nom, classe_nom, prenom, nom in requete}
+
+    enseignements, indisponibilites = [], set()
+    if _gestionnaire():
+        enseignements = (db.session.query(Enseignement, Cours.nom, Classe.nom, User.prenom, User.nom)
+                         .join(Cours, Enseignement.cours_id == Cours.id)
+                         .join(Classe, Enseignement.classe_id == Classe.id)
+                         .join(User, Enseignement.professeur_id == User.id)
+                         .filter(Enseignement.annee_scolaire == annee))
+        if professeur_id:
+            enseignements = enseignements.filter(Enseignement.professeur_id == professeur_id)
+            indisponibilites = {(i.jour, i.creneau) for i in
+                                IndisponibiliteProfesseur.query.filter_by(professeur_id=professeur_id)}
+        else:
+            enseignements = enseignements.filter(Enseignement.classe_id == classe_id)
+        enseignements = enseignements.order_by(Cours.nom).all()
+
+    return render_template('emploi_du_temps/index.html',
+                           annee=annee,
+                           jours=jours(),
+                           creneaux=creneaux(),
+                           cases=cases,
+                           classes=classes,
+                           professeurs=professeurs,
+                           classe_id=classe_id,
+                           professeur_id=professeur_id,
+                           enseignements=enseignements,
+                           indisponibilites=indisponibilites,
+                           gestionnaire=_gestionnaire())
+
+
+def _retour():
+    return redirect(request.referrer or url_for('emploi_du_temps.index'))
+
+
+@emploi_du_temps_bp.route('/generer', methods=['POST'])
+@login_required
+def generer_route():
+    """Génère ou ajuste l'emploi du temps de l'année"""
+    if not _gestionnaire():
+        flash('Accès non autorisé.', 'danger')
+        return redirect(url_for('emploi_du_temps.index'))
+    try:
+        rapport = generer(request.form.get('annee'), depuis_zero=bool(request.form.get('depuis_zero')))
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Une erreur est survenue: {str(e)}', 'danger')
+        return _retour()
+
+    flash(f"Emploi du temps {rapport['annee']}: {rapport['places']} séance(s) placée(s), "
+          f"{rapport['ajoutees']} ajoutée(s), {rapport['retirees']} retirée(s).", 'success')
+    for enseignement, heures in rapport['non_places']:
+        flash(f"{enseignement.cours.nom} ({enseignement.classe.nom}): {heures} heure(s) sans créneau possible.",
+              'warning')
+    for avertissement in rapport['avertissements']:
+        flash(avertissement, 'warning')
+    return _retour()
+
+
+@emploi_du_temps_bp.route('/heures', methods=['POST'])
+@login_required
+def heures():
+    """Enregistre les heures hebdomadaires des enseignements affichés"""
+    if not _gestionnaire():
+        flash('Accès non autorisé.', 'danger')
+        return redirect(url_for('emploi_du_temps.index'))
+    # Pairs are filtered together: dropping an invalid id alone would shift every following value
+    saisies = {int(e): int(v) for e, v in zip(request.form.getlist('enseignement_id[]'),
+                                              request.form.getlist('heures_hebdo[]'))
+               if str(e).isdigit() and str(v).isdigit()}
+    for enseignement in Enseignement.query.filter(Enseignement.id.in_(saisies)):
+        enseignement.heures_hebdo = saisies[enseignement.id]
+    db.session.commit()
+    flash('Heures hebdomadaires enregistrées. Générez l\'emploi du temps pour les appliquer.', 'success')
+    return _retour()
+
+
+@emploi_du_temps_bp.route('/indisponibilites/<int:professeur_id>', methods=['POST'])
+@login_required
+def indisponibilites(professeur_id):
+    """Remplace les créneaux où le professeur ne peut pas enseigner"""
+    if not _gestionnaire():
+        flash('Accès non autorisé.', 'danger')
+        return redirect(url_for('emploi_du_temps.index'))
+    User.query.get_or_404(professeur_id)
+    cases, valides = set(), set(grille())
+    for valeur in request.form.getlist('creneau[]'):
+        try:
+            jour, numero = (int(v) for v in valeur.split('_'))
+        except ValueError:
+            continue
+        if (jour, numero) in valides:
+            cases.add((jour, numero))
+    IndisponibiliteProfesseur.query.filter_by(professeur_id=professeur_id).delete()
+    db.session.add_all([IndisponibiliteProfesseur(professeur_id=professeur_id, jour=jour, creneau=numero)
+                        for jour, numero in sorted(cases)])
+    db.session.commit()
+    flash('Indisponibilités enregistrées. Générez l\'emploi du temps pour les appliquer.', 'success')
+    return _retour()
+
+# ==================== CLI ====================
+
+emploi_cli = AppGroup('emploi', help='Emploi du temps')
+
+
+@emploi_cli.command('generer')
+@click.argument('annee', required=False)
+@click.option('--depuis-zero', is_flag=True, help="Ignore l'emploi du temps enregistré")
+def generer_command(annee, depuis_zero):
+    """Génère ou ajuste l'emploi du temps d'une année scolaire"""
+    rapport = generer(annee, depuis_zero=depuis_zero)
+    click.echo(f"{rapport['annee']}: {rapport['places']} séance(s) placée(s) "
+               f"({rapport['conserves']} conservée(s), {rapport['ajoutees']} ajoutée(s), "
+               f"{rapport['retirees']} retirée(s)) en {rapport['duree']:.2f} s")
+    for enseignement, heures in rapport['non_places']:
+        click.echo(f"  non placé: {enseignement.cours.nom} ({enseignement.classe.nom}) - {heures} h")
+    for avertissement in rapport['avertissements']:
+        click.echo(f"  attention: {avertissement}")
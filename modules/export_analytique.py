@@ -0,0 +1,262 @@
+"""
+Analytics export of a school year
+
+Writes the students, classes, courses, fees, grades, attendance and
+payments of one school year as compressed columnar files, one per table,
+with a manifest.json giving each file's row count, columns and SHA-256:
+
+    flask export annee 2024-2025 --sortie /srv/exports/2024-2025
+
+or from the reports page, as a background job whose result is a ZIP of the
+same files. Files are Parquet (zstd) when pyarrow is installed, gzip CSV
+otherwise.
+
+Rows are read with streamed results in chunks of TAILLE_LOT and written
+chunk by chunk, so memory stays flat whatever the size of the year (only
+the ids of the year's students and fees are kept). Years closed with
+`flask annee cloturer` are read from their archive file.
+"""
+
+import io
+import os
+import csv
+import gzip
+import json
+import hashlib
+import logging
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import select, distinct, Boolean, Date, DateTime, Float, Integer, Numeric
+
+from models import db, Eleve, Classe, Cours, Frais, Note, Presence, Paiement
+from modules.archivage_annuel import bornes, annees_archivees, archive_engine, table_archive
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # optional: gzip CSV only
+    pyarrow = None
+
+logger = logging.getLogger('export_analytique')
+
+TAILLE_LOT = 5000
+FORMATS = ('parquet', 'csv')
+MANIFEST_NAME = 'manifest.json'
+
+
+def formats_disponibles():
+    return FORMATS if pyarrow is not None else ('csv',)
+
+
+def format_par_defaut():
+    return formats_disponibles()[0]
+
+
+# ==================== WRITERS ====================
+
+def _type_arrow(type_):
+    if isinstance(type_, Boolean):
+        return pyarrow.bool_()
+    if isinstance(type_, Integer):
+        return pyarrow.int64()
+    if isinstance(type_, (Float, Numeric)):
+        return pyarrow.float64()
+    if isinstance(type_, DateTime):
+        return pyarrow.timestamp('us')
+    if isinstance(type_, Date):
+        return pyarrow.date32()
+    return pyarrow.string()
+
+
+class _EcrivainParquet:
+    extension = '.parquet'
+
+    def __init__(self, path, colonnes):
+        self.schema = pyarrow.schema([(c.name, _type_arrow(c.type)) for c in colonnes])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression='zstd')
+
+    def ecrire(self, lignes):
+        # One row group per chunk
+        valeurs = list(zip(*lignes))
+        self.writer.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(colonne, type=champ.type) for colonne, champ in zip(valeurs, self.schema)],
+            schema=self.schema
+        ))
+
+    def fermer(self):
+        self.writer.close()
+
+
+class _EcrivainCSV:
+    extension = '.csv.gz'
+
+    def __init__(self, path, colonnes):
+        # mtime=0: the same rows always give the same checksum
+        self.texte = io.TextIOWrapper(gzip.GzipFile(path, 'wb', compresslevel=6, mtime=0),
+                                      encoding='utf-8', newline='')
+        self.writer = csv.writer(self.texte)
+        self.writer.writerow([c.name for c in colonnes])
+
+    def ecrire(self, lignes):
+        self.writer.writerows(
+            ['' if v is None else v.isoformat() if hasattr(v, 'isoformat') else v for v in ligne]
+            for ligne in lignes
+        )
+
+    def fermer(self):
+        self.texte.close()
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for bloc in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(bloc)
+    return digest.hexdigest()
+
+
+# ==================== EXPORT ====================
+
+def _lots(engine, requete):
+    """Chunks of TAILLE_LOT rows, streamed from the server"""
+    with engine.connect() as conn:
+        resultat = conn.execution_options(stream_results=True, yield_per=TAILLE_LOT).execute(requete)
+        for lot in resultat.partitions():
+            yield lot
+
+
+def _ecrire_table(dossier, format, table, lots, garder=None):
+    """
+    Write one table and return its manifest entry
+
+    garder: optional row filter applied chunk by chunk
+    """
+    ecrivain_classe = _EcrivainParquet if format == 'parquet' else _EcrivainCSV
+    fichier = table.name + ecrivain_classe.extension
+    path = os.path.join(dossier, fichier)
+    colonnes = list(table.columns)
+    ecrivain = ecrivain_classe(path, colonnes)
+    lignes = 0
+    try:
+        for lot in lots:
+            if garder is not None:
+                lot = [ligne for ligne in lot if garder(ligne)]
+            if lot:
+                ecrivain.ecrire(lot)
+                lignes += len(lot)
+    finally:
+        ecrivain.fermer()
+    return {
+        'table': table.name,
+        'fichier': fichier,
+        'lignes': lignes,
+        'octets': os.path.getsize(path),
+        'sha256': _sha256(path),
+        'colonnes': [{'nom': c.name, 'type': str(c.type)} for c in colonnes],
+    }
+
+
+def exporter_annee(annee, dossier, format=None, progress=None):
+    """
+    Export a school year into a directory
+
+    Args:
+        annee (str): '2024-2025'
+        dossier (str): Output directory (created if needed)
+        format (str, optional): 'parquet' or 'csv' (default: parquet when pyarrow is installed)
+        progress (callable, optional): progress(percentage, message)
+
+    Returns:
+        dict: The manifest, also written to dossier/manifest.json
+
+    Raises:
+        ValueError: Invalid year or format, or parquet without pyarrow
+    """
+    debut, fin = bornes(annee)
+    format = format or format_par_defaut()
+    if format not in FORMATS:
+        raise ValueError(f"Format inconnu: {format} ({', '.join(FORMATS)})")
+    if format == 'parquet' and pyarrow is None:
+        raise ValueError("Le format parquet nécessite le paquet pyarrow: utilisez le format csv.")
+    os.makedirs(dossier, exist_ok=True)
+    progress = progress or (lambda *args: None)
+
+    # Grades, attendance and payments: from the archive file once the year is closed
+    archivee = annee in annees_archivees()
+    if archivee:
+        source = archive_engine(annee)
+        faits = [(table_archive(model), select(table_archive(model)).order_by(table_archive(model).c.id))
+                 for model in (Note, Presence, Paiement)]
+    else:
+        source = db.engine
+        faits = [(model.__table__, select(model.__table__).where(
+            model.__table__.c.date >= debut, model.__table__.c.date <= fin).order_by(model.__table__.c.id))
+            for model in (Note, Presence, Paiement)]
+
+    # Students and fees of the year: those referenced by its rows, plus its classes and fees
+    classes = {i for (i,) in db.session.query(Classe.id).filter(Classe.annee_scolaire == annee)}
+    eleves, frais = set(), set()
+    with source.connect() as conn:
+        for table, requete in faits:
+            sous_requete = requete.subquery()
+            eleves.update(i for (i,) in conn.execute(select(distinct(sous_requete.c.eleve_id))))
+            if 'frais_id' in table.c:
+                frais.update(i for (i,) in conn.execute(select(distinct(sous_requete.c.frais_id))) if i)
+    frais.update(i for (i,) in db.session.query(Frais.id).filter(
+        Frais.annee_scolaire.in_([annee, str(debut.year), str(fin.year)])))
+
+    eleves_table, frais_table = Eleve.__table__, Frais.__table__
+    etapes = [
+        (Classe.__table__, _lots(db.engine, select(Classe.__table__).where(
+            Classe.__table__.c.annee_scolaire == annee).order_by(Classe.__table__.c.id)), None),
+        (Cours.__table__, _lots(db.engine, select(Cours.__table__).order_by(Cours.__table__.c.id)), None),
+        (frais_table, _lots(db.engine, select(frais_table).order_by(frais_table.c.id)),
+         lambda ligne: ligne.id in frais),
+        (eleves_table, _lots(db.engine, select(eleves_table).order_by(eleves_table.c.id)),
+         lambda ligne: ligne.id in eleves or ligne.classe_id in classes),
+    ] + [(table, _lots(source, requete), None) for table, requete in faits]
+
+    fichiers = []
+    for i, (table, lots, garder) in enumerate(etapes):
+        progress(100 * i / len(etapes), f'Export de {table.name}')
+        fichiers.append(_ecrire_table(dossier, format, table, lots, garder))
+        logger.info(f"{annee}: {fichiers[-1]['lignes']} ligne(s) de {table.name}")
+
+    manifest = {
+        'annee_scolaire': annee,
+        'debut': debut.isoformat(),
+        'fin': fin.isoformat(),
+        'format': format,
+        'source': 'archive' if archivee else 'base',
+        'genere_le': datetime.now().isoformat(timespec='seconds'),
+        'fichiers': fichiers,
+    }
+    with open(os.path.join(dossier, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    progress(100, 'Export terminé')
+    return manifest
+
+
+# ==================== CLI ====================
+
+export_cli = AppGroup('export', help='Exports analytiques')
+
+
+@export_cli.command('annee')
+@click.argument('annee')
+@click.option('--sortie', type=click.Path(file_okay=False), default=None,
+              help="Dossier de destination (défaut: ./export_<annee>)")
+@click.option('--format', 'format_', type=click.Choice(FORMATS), default=None,
+              help='parquet (si pyarrow est installé) ou csv compressé')
+def annee_command(annee, sortie, format_):
+    """Exporte élèves, classes, cours, frais, notes, présences et paiements d'une année scolaire"""
+    sortie = sortie or f'export_{annee}'
+    try:
+        manifest = exporter_annee(annee, sortie, format_)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for fichier in manifest['fichiers']:
+        click.echo(f"{fichier['fichier']}: {fichier['lignes']} ligne(s), {fichier['octets']} octets")
+    click.echo(f"Manifeste: {os.path.join(sortie, MANIFEST_NAME)}")
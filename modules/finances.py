@@ -3,6 +3,7 @@ from flask_login import login_required
 from models import Paiement
 from models import db
 from datetime import datetime, date
+from modules import reference_data
 
 
 finances_blueprint = Blueprint('finances', __name__, url_prefix='/finances')
@@ -165,9 +166,8 @@ def ajouter_frais():
         flash('Frais ajouté avec succès!', 'success')
         return redirect(url_for('finances.frais'))
     
-    # Get classes using SQLAlchemy ORM
-    from models import Classe
-    classes = Classe.query.order_by(Classe.niveau, Classe.nom).all()
+    # Get classes from the reference data cache
+    classes = reference_data.classes()
     
     # Format classes for template
     classes_list = [{
@@ -245,12 +245,11 @@ def paiements():
         })
     
     # Get classes for filter
-    classes = Classe.query.order_by(Classe.niveau, Classe.nom).all()
+    classes = reference_data.classes()
     classes_list = [{'id': c.id, 'nom': c.nom} for c in classes]
     
     # Get fee types for filter
-    types_frais_query = db.session.query(distinct(Frais.type)).order_by(Frais.type)
-    types_frais = [{'type': t[0]} for t in types_frais_query.all()]
+    types_frais = [{'type': t} for t in reference_data.types_frais()]
     
     return render_template('finances/paiements.html', 
                           paiements=paiements,
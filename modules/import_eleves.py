@@ -0,0 +1,272 @@
+"""
+Bulk student import
+
+Creates students from a CSV/XLSX list (one row per student), with an
+optional ZIP of photos named after the matricules (M0123.jpg):
+
+    resultat = importer_eleves(fichier, photos=zip_ou_None, dossier_photos=...)
+    resultat.erreurs   # every problem found, 'Ligne 12: ...'
+    resultat.creees    # number of students inserted (0 when there are errors)
+
+The whole file is validated before anything is written: dates, sexe,
+class names (against the reference data), parent emails and matricules
+(duplicates inside the file, and existing ones with a single IN query).
+Any error rejects the whole file, so it can be corrected and imported
+again; otherwise the rows are inserted by batches of TAILLE_LOT in one
+transaction.
+"""
+
+import io
+import os
+import zipfile
+from collections import namedtuple
+from datetime import date, datetime
+
+from sqlalchemy import func, insert
+from werkzeug.utils import secure_filename
+
+from models import db, Eleve, User
+from modules import reference_data
+from modules.archivage_annuel import annee_scolaire_de
+from modules.import_tableur import lire_tableur, normaliser_colonne, en_date
+
+TAILLE_LOT = 1000
+EXTENSIONS_PHOTO = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+
+# Normalised column name -> Eleve field
+COLONNES = {
+    'matricule': 'matricule',
+    'nom': 'nom',
+    'prenom': 'prenom',
+    'date de naissance': 'date_naissance',
+    'date_naissance': 'date_naissance',
+    'naissance': 'date_naissance',
+    'lieu de naissance': 'lieu_naissance',
+    'lieu_naissance': 'lieu_naissance',
+    'sexe': 'sexe',
+    'adresse': 'adresse',
+    'telephone': 'telephone',
+    'email': 'email',
+    'classe': 'classe',
+    'email parent': 'email_parent',
+    'email_parent': 'email_parent',
+    'photo': 'photo',
+}
+OBLIGATOIRES = ('matricule', 'nom', 'prenom', 'date_naissance', 'lieu_naissance', 'sexe')
+SEXES = {'m': 'M', 'masculin': 'M', 'garcon': 'M', 'f': 'F', 'feminin': 'F', 'fille': 'F'}
+LONGUEURS = {c.name: c.type.length for c in Eleve.__table__.columns if getattr(c.type, 'length', None)}
+
+ResultatImport = namedtuple('ResultatImport', 'creees erreurs')
+
+
+def _index_classes():
+    """Normalised class name -> id; names used by several years resolve to the current year"""
+    annee = annee_scolaire_de()
+    par_nom = {}
+    for classe in reference_data.classes():
+        par_nom.setdefault(normaliser_colonne(classe.nom).replace(' ', ''), []).append(classe)
+    index = {}
+    for nom, classes in par_nom.items():
+        if len(classes) > 1:
+            classes = [c for c in classes if c.annee_scolaire == annee] or classes
+        index[nom] = classes[0].id if len(classes) == 1 else None  # None: ambiguous
+    return index
+
+
+def _index_photos(photos):
+    """Matricule (lowercase) -> ZIP entry name"""
+    index = {}
+    for nom in photos.namelist():
+        base, extension = os.path.splitext(os.path.basename(nom))
+        if base and extension.lower() in EXTENSIONS_PHOTO:
+            index[base.lower()] = nom
+    return index
+
+
+def valider(lignes, classe_defaut=None, photos=None):
+    """
+    Validate every row of a student list
+
+    Args:
+        lignes: (numero, {column: value}) as yielded by lire_tableur
+        classe_defaut (int, optional): Class of the rows without a classe column/value
+        photos (zipfile.ZipFile, optional): Photos named after the matricules
+
+    Returns:
+        tuple: (eleves, erreurs) - eleves is a list of (row values, photo entry or None)
+    """
+    classes = _index_classes()
+    index_photos = _index_photos(photos) if photos else {}
+    eleves, erreurs, vus = [], [], {}
+    emails_parents = set()
+
+    for numero, ligne in lignes:
+        valeurs = {}
+        for colonne, valeur in ligne.items():
+            champ = COLONNES.get(colonne)
+            if champ and valeur is not None:
+                valeurs[champ] = valeur
+        erreurs_ligne = []
+
+        manquants = [c for c in OBLIGATOIRES if valeurs.get(c) in (None, '')]
+        if manquants:
+            erreurs_ligne.append(f"champ(s) obligatoire(s) manquant(s): {', '.join(manquants)}")
+
+        for champ in ('matricule', 'nom', 'prenom', 'lieu_naissance', 'adresse', 'telephone', 'email', 'photo'):
+            if champ in valeurs:
+                valeurs[champ] = str(valeurs[champ]).strip()
+                if champ in LONGUEURS and len(valeurs[champ]) > LONGUEURS[champ]:
+                    erreurs_ligne.append(f"{champ} trop long ({LONGUEURS[champ]} caractères maximum)")
+
+        if valeurs.get('date_naissance') is not None:
+            try:
+                valeurs['date_naissance'] = en_date(valeurs['date_naissance'])
+                if valeurs['date_naissance'] >= date.today():
+                    erreurs_ligne.append(f"date de naissance dans le futur ({valeurs['date_naissance'].strftime('%d/%m/%Y')})")
+            except ValueError as e:
+                erreurs_ligne.append(str(e))
+
+        if valeurs.get('sexe') is not None:
+            sexe = SEXES.get(normaliser_colonne(valeurs['sexe']))
+            if sexe is None:
+                erreurs_ligne.append(f"sexe invalide ({valeurs['sexe']}): M ou F")
+            valeurs['sexe'] = sexe
+
+        nom_classe = valeurs.pop('classe', None)
+        if nom_classe is not None:
+            cle = normaliser_colonne(nom_classe).replace(' ', '')
+            if cle not in classes:
+                erreurs_ligne.append(f"classe inconnue ({nom_classe})")
+            elif classes[cle] is None:
+                erreurs_ligne.append(f"classe ambiguë ({nom_classe}): plusieurs classes portent ce nom")
+            valeurs['classe_id'] = classes.get(cle)
+        elif classe_defaut:
+            valeurs['classe_id'] = classe_defaut
+        else:
+            erreurs_ligne.append("classe manquante")
+
+        if valeurs.get('email_parent'):
+            valeurs['email_parent'] = str(valeurs['email_parent']).strip().lower()
+            emails_parents.add(valeurs['email_parent'])
+
+        matricule = valeurs.get('matricule')
+        if matricule:
+            if matricule.lower() in vus:
+                erreurs_ligne.append(f"matricule {matricule} en double (déjà ligne {vus[matricule.lower()]})")
+            else:
+                vus[matricule.lower()] = numero
+
+        photo = None
+        if photos and matricule:
+            nom_photo = valeurs.pop('photo', None)
+            if nom_photo:
+                photo = index_photos.get(os.path.splitext(os.path.basename(nom_photo))[0].lower())
+                if photo is None:
+                    erreurs_ligne.append(f"photo {nom_photo} absente du fichier ZIP")
+            else:
+                photo = index_photos.get(matricule.lower())
+        valeurs.pop('photo', None)
+
+        if erreurs_ligne:
+            erreurs.extend(f"Ligne {numero}: {e}." for e in erreurs_ligne)
+        else:
+            valeurs['_ligne'] = numero
+            eleves.append((valeurs, photo))
+
+    # Matricules already in the database (one query for the whole file)
+    if vus:
+        existants = {m.lower() for (m,) in db.session.query(Eleve.matricule).filter(
+            Eleve.matricule.in_([v['matricule'] for v, _ in eleves] or [''])
+        )}
+        for valeurs, _ in eleves:
+            if valeurs['matricule'].lower() in existants:
+                erreurs.append(f"Ligne {valeurs['_ligne']}: le matricule {valeurs['matricule']} existe déjà.")
+
+    # Parents by email (one query)
+    if emails_parents:
+        parents = {email.lower(): user_id for user_id, email in db.session.query(User.id, User.email).filter(
+            User.role == 'parent', func.lower(User.email).in_(emails_parents))}
+        for valeurs, _ in eleves:
+            email = valeurs.pop('email_parent', None)
+            if email:
+                if email in parents:
+                    valeurs['parent_id'] = parents[email]
+                else:
+                    erreurs.append(f"Ligne {valeurs['_ligne']}: aucun compte parent avec l'email {email}.")
+
+    erreurs.sort(key=lambda e: int(e.split(':', 1)[0].split()[1]))
+    return eleves, erreurs
+
+
+def importer_eleves(fichier, photos=None, dossier_photos=None, classe_defaut=None):
+    """
+    Validate and import a student list
+
+    Args:
+        fichier: CSV/XLSX upload (see lire_tableur)
+        photos: Optional ZIP upload of photos named after the matricules
+        dossier_photos (str): Where photos are extracted (required with photos)
+        classe_defaut (int, optional): Class of the rows without one
+
+    Returns:
+        ResultatImport: Nothing is written when erreurs is not empty
+    """
+    try:
+        colonnes, lignes = lire_tableur(fichier)
+    except Exception as e:
+        return ResultatImport(0, [f'Fichier illisible: {str(e)}'])
+    manquantes = [c for c in ('matricule', 'nom', 'prenom') if c not in colonnes]
+    if manquantes:
+        return ResultatImport(0, [f"Colonne(s) obligatoire(s) absente(s): {', '.join(manquantes)}."])
+
+    archive = None
+    if photos is not None:
+        flux = getattr(photos, 'stream', photos)
+        if not hasattr(flux, 'seekable'):
+            flux = io.BytesIO(flux.read())  # SpooledTemporaryFile before Python 3.11
+        try:
+            archive = zipfile.ZipFile(flux)
+        except zipfile.BadZipFile:
+            return ResultatImport(0, ['Le fichier de photos n\'est pas une archive ZIP valide.'])
+
+    try:
+        eleves, erreurs = valider(lignes, classe_defaut, archive)
+        if erreurs:
+            return ResultatImport(0, erreurs)
+        if not eleves:
+            return ResultatImport(0, ['Le fichier ne contient aucun élève.'])
+
+        horodatage = datetime.now().strftime('%Y%m%d%H%M%S')
+        aujourd_hui = date.today()
+        lignes_eleves, a_extraire = [], []
+        for valeurs, photo in eleves:
+            valeurs.pop('_ligne')
+            valeurs.setdefault('adresse', '')
+            valeurs.update(date_inscription=aujourd_hui, actif=True, photo=None)
+            if photo:
+                extension = os.path.splitext(photo)[1].lower()
+                valeurs['photo'] = f"{horodatage}_{secure_filename(valeurs['matricule'] + extension)}"
+                a_extraire.append((photo, valeurs['photo']))
+            lignes_eleves.append(valeurs)
+
+        colonnes_insert = set().union(*lignes_eleves)
+        for ligne in lignes_eleves:
+            for colonne in colonnes_insert:
+                ligne.setdefault(colonne, None)  # same keys on every row: one executemany per batch
+        try:
+            for debut in range(0, len(lignes_eleves), TAILLE_LOT):
+                db.session.execute(insert(Eleve), lignes_eleves[debut:debut + TAILLE_LOT])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return ResultatImport(0, [f"Erreur lors de l'enregistrement: {str(e)}"])
+
+        if a_extraire:
+            os.makedirs(dossier_photos, exist_ok=True)
+            for entree, nom in a_extraire:
+                with archive.open(entree) as source, open(os.path.join(dossier_photos, nom), 'wb') as cible:
+                    cible.write(source.read())
+        return ResultatImport(len(lignes_eleves), [])
+    finally:
+        if archive is not None:
+            archive.close()
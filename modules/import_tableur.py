@@ -0,0 +1,133 @@
+"""
+Spreadsheet import helpers
+
+Reads an uploaded CSV or XLSX file as rows of {column: value} with
+normalised column names, for the bulk import screens (gradebooks,
+student lists, admission results). XLSX files are opened in openpyxl's
+read_only mode so large workbooks are streamed rather than loaded whole.
+
+Usage:
+    colonnes, lignes = lire_tableur(request.files['fichier'])
+    for numero, ligne in lignes:
+        matricule = ligne.get('matricule')
+"""
+
+import csv
+import io
+import os
+import unicodedata
+from datetime import datetime, date
+
+EXTENSIONS_TABLEUR = ('.csv', '.xlsx')
+
+
+def normaliser_colonne(nom):
+    """'  Note Examen / 20 ' -> 'note examen / 20' (sans accents, minuscules, espaces réduits)"""
+    if nom is None:
+        return ''
+    texte = unicodedata.normalize('NFKD', str(nom))
+    texte = ''.join(c for c in texte if not unicodedata.combining(c))
+    return ' '.join(texte.lower().split())
+
+
+def _valeur(cellule):
+    if isinstance(cellule, str):
+        cellule = cellule.strip()
+        return cellule or None
+    return cellule
+
+
+def _lignes_csv(flux):
+    texte = io.TextIOWrapper(flux, encoding='utf-8-sig', newline='')
+    echantillon = texte.read(4096)
+    texte.seek(0)
+    try:
+        dialecte = csv.Sniffer().sniff(echantillon, delimiters=',;\t')
+    except csv.Error:
+        dialecte = csv.excel
+    return csv.reader(texte, dialecte)
+
+
+def _lignes_xlsx(flux):
+    from openpyxl import load_workbook
+    classeur = load_workbook(flux, read_only=True, data_only=True)
+    return classeur.active.iter_rows(values_only=True)
+
+
+def lire_tableur(fichier, nom_fichier=None):
+    """
+    Open a CSV or XLSX file
+
+    Args:
+        fichier: werkzeug FileStorage, binary file object or path
+        nom_fichier (str, optional): Name used to detect the format when
+                                     fichier is a bare file object
+
+    Returns:
+        tuple: (colonnes, lignes) - colonnes is the list of normalised
+               column names; lignes yields (numero_de_ligne, dict) for each
+               non-empty row, numero_de_ligne counting the header as 1
+
+    Raises:
+        ValueError: Unsupported format or missing header row
+    """
+    if isinstance(fichier, str):
+        nom_fichier = nom_fichier or fichier
+        flux = open(fichier, 'rb')
+    else:
+        nom_fichier = nom_fichier or getattr(fichier, 'filename', None) or getattr(fichier, 'name', '')
+        flux = getattr(fichier, 'stream', fichier)
+
+    extension = os.path.splitext(nom_fichier or '')[1].lower()
+    if extension not in EXTENSIONS_TABLEUR:
+        raise ValueError('Format non supporté: utilisez un fichier CSV ou XLSX.')
+
+    if extension == '.csv':
+        # TextIOWrapper needs a readable binary stream with the usual methods
+        if not hasattr(flux, 'readable'):
+            flux = io.BytesIO(flux.read())
+        lignes_brutes = _lignes_csv(flux)
+    else:
+        if not hasattr(flux, 'seekable') or not flux.seekable():
+            flux = io.BytesIO(flux.read())
+        lignes_brutes = _lignes_xlsx(flux)
+
+    entete = next(iter(lignes_brutes), None)
+    if not entete or not any(_valeur(c) for c in entete):
+        raise ValueError('Le fichier est vide ou ne contient pas de ligne d\'en-tête.')
+    colonnes = [normaliser_colonne(c) for c in entete]
+
+    def lignes():
+        for numero, brute in enumerate(lignes_brutes, 2):
+            valeurs = [_valeur(c) for c in brute]
+            if not any(v is not None for v in valeurs):
+                continue
+            yield numero, {col: val for col, val in zip(colonnes, valeurs) if col}
+
+    return colonnes, lignes()
+
+
+def en_nombre(valeur):
+    """'12,5' / '12.5' / 12.5 -> 12.5; None for empty; ValueError otherwise"""
+    if valeur is None or valeur == '':
+        return None
+    if isinstance(valeur, (int, float)):
+        return float(valeur)
+    return float(str(valeur).replace(',', '.').replace(' ', ''))
+
+
+def en_date(valeur):
+    """date, datetime, 'AAAA-MM-JJ' or 'JJ/MM/AAAA' -> date; None for empty; ValueError otherwise"""
+    if valeur is None or valeur == '':
+        return None
+    if isinstance(valeur, datetime):
+        return valeur.date()
+    if isinstance(valeur, date):
+        return valeur
+    texte = str(valeur).strip()
+    for fmt in ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y'):
+        try:
+            return datetime.strptime(texte, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Date invalide: {texte}")
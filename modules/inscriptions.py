@@ -2,9 +2,14 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import login_required, current_user
 from datetime import datetime
 import os
+import re
 from werkzeug.utils import secure_filename
 import uuid
-from models import db, Inscription, Eleve, User, Cours
+from models import db, Inscription, Eleve, User, Document
+from sqlalchemy import func, or_
+from modules import reference_data
+from modules.archivage_annuel import annee_scolaire_de
+from modules.import_tableur import normaliser_colonne
 from functools import wraps
 
 # Create blueprint
@@ -380,7 +385,8 @@ def liste():
     return render_template('admin/inscriptions.html', 
                          inscriptions=inscriptions, 
                          statut_actuel=statut,
-                         inscriptions_count=en_attente_count)
+                         inscriptions_count=en_attente_count,
+                         classes=reference_data.classes())
 
 @inscriptions_blueprint.route('/admin/<int:id>', methods=['GET'])
 @login_required
@@ -442,108 +448,271 @@ def delete(id):
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# ==================== CONVERSION EN ÉLÈVES ====================
+
+PREFIXE_MATRICULE = 'EPSJA'
+# Inscription column -> (Document.type, Document.titre)
+DOCUMENTS_INSCRIPTION = {
+    'acte_naissance': ('acte_naissance', 'Acte de naissance'),
+    'bulletins_notes': ('bulletin', 'Bulletin (inscription)'),
+    'recu_paiement': ('recu', 'Reçu des frais d\'inscription'),
+}
+
+
+def _chiffres(telephone):
+    return ''.join(c for c in (telephone or '') if c.isdigit())
+
+
+def _classe_du_niveau(niveau, annee):
+    """Only class of the level for the school year, or None when there are none or several"""
+    cle = normaliser_colonne(niveau)
+    candidates = [c for c in reference_data.classes()
+                  if normaliser_colonne(c.niveau) == cle and c.annee_scolaire == annee]
+    return candidates[0].id if len(candidates) == 1 else None
+
+
+def _prochains_matricules(annee_civile):
+    """Generator of free matricules EPSJA-<year>-0001, ... (one query)"""
+    prefixe = f"{PREFIXE_MATRICULE}-{annee_civile}-"
+    dernier = 0
+    for (matricule,) in db.session.query(Eleve.matricule).filter(Eleve.matricule.like(prefixe + '%')):
+        suffixe = matricule[len(prefixe):]
+        if suffixe.isdigit():
+            dernier = max(dernier, int(suffixe))
+    while True:
+        dernier += 1
+        yield f"{prefixe}{dernier:04d}"
+
+
+def _parents_existants(inscriptions):
+    """
+    Parent user ids by email and by phone number, for every inscription at once
+
+    Emails match any account; phone numbers match the parent of a student
+    already registered with that number (siblings).
+    """
+    emails = {i.parent1_email.strip().lower() for i in inscriptions if i.parent1_email}
+    par_email = {}
+    if emails:
+        par_email = {email.lower(): user_id for user_id, email in
+                     db.session.query(User.id, User.email).filter(func.lower(User.email).in_(emails))}
+    telephones = {i.parent1_telephone.strip() for i in inscriptions if i.parent1_telephone}
+    telephones |= {_chiffres(t) for t in telephones}
+    par_telephone = {}
+    if telephones:
+        for telephone, parent_id in db.session.query(Eleve.telephone, Eleve.parent_id).filter(
+                Eleve.parent_id.isnot(None), Eleve.telephone.in_(telephones)):
+            par_telephone.setdefault(_chiffres(telephone), parent_id)
+    return par_email, par_telephone
+
+
+def _noms_utilisateur_pris(bases):
+    if not bases:
+        return set()
+    return {u for (u,) in db.session.query(User.username).filter(
+        or_(*[User.username.like(base + '%') for base in bases]))}
+
+
+def _deplacer(chemin, sous_dossier, deplacements):
+    """Move an uploaded file into UPLOAD_FOLDER/sous_dossier; returns the new file name or None"""
+    if not chemin or not os.path.exists(chemin):
+        return None
+    nom = os.path.basename(chemin)
+    destination = os.path.join(UPLOAD_FOLDER, sous_dossier)
+    os.makedirs(destination, exist_ok=True)
+    cible = os.path.join(destination, nom)
+    os.replace(chemin, cible)
+    deplacements.append((chemin, cible))
+    return nom
+
+
+def convertir_inscriptions(ids, classe_id=None, cree_par=None):
+    """
+    Turn approved inscriptions into students, in one transaction
+
+    For each inscription: a matricule is allocated, the parent account is
+    matched by email (or by the phone number of a sibling) or created, the
+    Eleve is created in the requested class (default: the only class of
+    the requested level this school year), the photo moves to the student
+    photos and the other uploads become Documents of the student.
+
+    Args:
+        ids (list): Inscription ids
+        classe_id (int, optional): Class for every converted student
+        cree_par (int, optional): User recorded as creator of the documents
+
+    Returns:
+        list: One dict per id - {'id', 'statut': 'convertie'|'ignoree'|'erreur',
+              'message', 'matricule', 'eleve_id', 'parent'}
+    """
+    from modules.auth import bcrypt
+
+    ids = [int(i) for i in dict.fromkeys(ids)]
+    inscriptions = {i.id: i for i in Inscription.query.filter(Inscription.id.in_(ids or [0]))}
+    annee = annee_scolaire_de()
+    resultats = {}
+    a_convertir = []
+    for inscription_id in ids:
+        inscription = inscriptions.get(inscription_id)
+        if inscription is None:
+            resultats[inscription_id] = {'statut': 'erreur', 'message': 'Inscription introuvable'}
+        elif inscription.statut != 'approuvee':
+            resultats[inscription_id] = {'statut': 'ignoree', 'message': 'Inscription non approuvée'}
+        else:
+            classe = classe_id or _classe_du_niveau(inscription.niveau_demande, annee)
+            if not classe:
+                resultats[inscription_id] = {
+                    'statut': 'erreur',
+                    'message': f"Aucune classe unique de niveau {inscription.niveau_demande} pour {annee}: choisissez une classe"
+                }
+            else:
+                a_convertir.append((inscription, classe))
+
+    if a_convertir:
+        par_email, par_telephone = _parents_existants([i for i, _ in a_convertir])
+        bases = {re.sub(r'[^a-z0-9._-]', '', i.parent1_email.split('@')[0].lower()) or 'parent'
+                 for i, _ in a_convertir if i.parent1_email}
+        pris = _noms_utilisateur_pris(bases)
+        matricules = _prochains_matricules(datetime.now().year)
+        # New parents receive an unknown random password (one hash for the batch): they
+        # get access when the administration sets theirs
+        mot_de_passe = bcrypt.generate_password_hash(uuid.uuid4().hex).decode('utf-8')
+        maintenant = datetime.now()
+        deplacements, documents = [], []
+        nouveaux_parents = {}
+
+        try:
+            # Parents first, created together, so that the students can be flushed in one batch
+            parents = []
+            for inscription, _ in a_convertir:
+                email = (inscription.parent1_email or '').strip().lower()
+                parent_id = par_email.get(email) or par_telephone.get(_chiffres(inscription.parent1_telephone))
+                if parent_id is not None or not email:
+                    parents.append((parent_id, 'existant' if parent_id else None))
+                    continue
+                if email not in nouveaux_parents:
+                    base = re.sub(r'[^a-z0-9._-]', '', email.split('@')[0]) or 'parent'
+                    username, n = base, 1
+                    while username in pris:
+                        n += 1
+                        username = f'{base}{n}'
+                    pris.add(username)
+                    noms = (inscription.parent1_nom or '').split()
+                    nouveaux_parents[email] = User(username=username, email=inscription.parent1_email.strip(),
+                                                   password_hash=mot_de_passe,
+                                                   nom=noms[-1] if noms else inscription.parent1_nom,
+                                                   prenom=' '.join(noms[:-1]), role='parent')
+                parents.append((nouveaux_parents[email], 'cree'))
+            db.session.add_all(nouveaux_parents.values())
+            db.session.flush()
+
+            for (inscription, classe), (parent, origine_parent) in zip(a_convertir, parents):
+                parent_id = parent.id if isinstance(parent, User) else parent
+                matricule = next(matricules)
+                eleve = Eleve(
+                    matricule=matricule,
+                    nom=inscription.nom_eleve,
+                    prenom=inscription.prenom_eleve,
+                    date_naissance=inscription.date_naissance,
+                    lieu_naissance=inscription.lieu_naissance,
+                    sexe='M' if inscription.genre.lower() in ('masculin', 'm', 'garcon') else 'F',
+                    adresse=inscription.adresse,
+                    telephone=inscription.parent1_telephone,
+                    email=inscription.parent1_email,
+                    classe_id=classe,
+                    photo=_deplacer(inscription.photo_identite, 'eleves', deplacements),
+                    parent_id=parent_id,
+                    actif=True,
+                    date_inscription=maintenant.date(),
+                )
+                db.session.add(eleve)
+                if eleve.photo:
+                    inscription.photo_identite = os.path.join(UPLOAD_FOLDER, 'eleves', eleve.photo)
+                for colonne, (type_document, titre) in DOCUMENTS_INSCRIPTION.items():
+                    chemins = [c for c in (getattr(inscription, colonne) or '').split(';') if c]
+                    nouveaux = []
+                    for chemin in chemins:
+                        nom = _deplacer(chemin, 'documents', deplacements)
+                        if nom:
+                            documents.append((eleve, Document(titre=titre, type=type_document, fichier=nom,
+                                                              date_creation=maintenant, cree_par=cree_par)))
+                            nouveaux.append(os.path.join(UPLOAD_FOLDER, 'documents', nom))
+                    if nouveaux:
+                        setattr(inscription, colonne, ';'.join(nouveaux))
+
+                inscription.statut = 'completee'
+                inscription.date_traitement = maintenant
+                inscription.notes_admin = (inscription.notes_admin or '') + \
+                    f"\nConverti en élève le {maintenant.strftime('%d/%m/%Y %H:%M')}. Matricule: {matricule}"
+                resultats[inscription.id] = {'statut': 'convertie', 'message': 'Élève créé', 'matricule': matricule,
+                                             'eleve': eleve, 'parent': origine_parent}
+
+            db.session.flush()
+            for resultat in resultats.values():
+                if 'eleve' in resultat:
+                    resultat['eleve_id'] = resultat.pop('eleve').id
+            for eleve, document in documents:
+                document.eleve_id = eleve.id
+                if document.cree_par is None:
+                    document.cree_par = eleve.parent_id
+                db.session.add(document)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            for source, cible in reversed(deplacements):
+                if os.path.exists(cible):
+                    os.replace(cible, source)
+            message = f'Erreur lors de la conversion: {str(e)}'
+            for inscription, _ in a_convertir:
+                resultats[inscription.id] = {'statut': 'erreur', 'message': message}
+
+    sortie = []
+    for inscription_id in ids:
+        sortie.append({'id': inscription_id, 'matricule': None, 'parent': None, 'eleve_id': None,
+                       **resultats[inscription_id]})
+    return sortie
+
+
+def _classe_demandee():
+    data = request.get_json(silent=True) if request.is_json else request.form
+    classe_id = (data or {}).get('classe_id')
+    return int(classe_id) if classe_id else None
+
+
+@inscriptions_blueprint.route('/admin/convert', methods=['POST'])
+@login_required
+@admin_required
+def convert_batch():
+    """Conversion de plusieurs inscriptions approuvées, résultat par inscription"""
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids') or request.form.getlist('ids')
+    if not ids:
+        return jsonify({'success': False, 'error': 'Aucune inscription sélectionnée'}), 400
+    try:
+        resultats = convertir_inscriptions(ids, _classe_demandee(), current_user.id)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Paramètres invalides'}), 400
+    return jsonify({
+        'success': True,
+        'converties': sum(1 for r in resultats if r['statut'] == 'convertie'),
+        'resultats': resultats,
+    })
+
+
 @inscriptions_blueprint.route('/admin/<int:id>/convert', methods=['POST'])
 @login_required
 @admin_required
 def convert_to_student(id):
-    inscription = Inscription.query.get_or_404(id)
-    
-    if inscription.statut != 'approuvee':
-        return jsonify({'success': False, 'error': 'Seules les inscriptions approuvées peuvent être converties en élèves'}), 400
-    
+    Inscription.query.get_or_404(id)
     try:
-        # Generate a unique matricule
-        current_year = datetime.now().year
-        count = Eleve.query.count() + 1
-        matricule = f"EPSJA-{current_year}-{count:04d}"
-        
-        # Create parent user if needed
-        parent_id = None
-        if inscription.parent1_email:
-            parent = User.query.filter_by(email=inscription.parent1_email).first()
-            if not parent:
-                # Create a new parent user
-                from flask_bcrypt import Bcrypt
-                bcrypt = Bcrypt()
-                
-                # Generate a temporary password
-                temp_password = f"temp{uuid.uuid4().hex[:8]}"
-                hashed_password = bcrypt.generate_password_hash(temp_password).decode('utf-8')
-                
-                parent = User(
-                    username=inscription.parent1_email.split('@')[0],
-                    email=inscription.parent1_email,
-                    password_hash=hashed_password,
-                    nom=inscription.parent1_nom.split()[-1] if ' ' in inscription.parent1_nom else inscription.parent1_nom,
-                    prenom=inscription.parent1_nom.split()[0] if ' ' in inscription.parent1_nom else '',
-                    role='parent'
-                )
-                db.session.add(parent)
-                db.session.flush()  # To get the ID without committing
-                parent_id = parent.id
-            else:
-                parent_id = parent.id
-        
-        # Get the default class if specified in the request
-        classe_id = None
-        if request.is_json:
-            data = request.get_json(silent=True)
-            if data:
-                classe_id = data.get('classe_id')
-        else:
-            classe_id = request.form.get('classe_id')
-        
-        # If no class is specified, get the first available class or create a default one
-        if not classe_id:
-            # Try to find a class
-            default_class = Cours.query.first()
-            
-            # If no class exists, create a default one
-            if not default_class:
-                default_class = Cours(
-                    nom="Classe par défaut",
-                    niveau="1",
-                    annee_scolaire=f"{datetime.now().year}-{datetime.now().year + 1}",
-                    capacite=30,
-                    description="Classe par défaut pour les nouveaux élèves"
-                )
-                db.session.add(default_class)
-                db.session.flush()  # To get the ID without committing
-            
-            classe_id = default_class.id
-        
-        # Create new student
-        eleve = Eleve(
-            matricule=matricule,
-            nom=inscription.nom_eleve,
-            prenom=inscription.prenom_eleve,
-            date_naissance=inscription.date_naissance,
-            lieu_naissance=inscription.lieu_naissance,
-            sexe='M' if inscription.genre.lower() == 'masculin' else 'F',
-            adresse=inscription.adresse,
-            telephone=inscription.parent1_telephone,
-            email=inscription.parent1_email,
-            classe_id=classe_id,
-            photo=inscription.photo_identite,
-            parent_id=parent_id,
-            actif=True,
-            date_inscription=datetime.now()
-        )
-        
-        # Add student to database
-        db.session.add(eleve)
-        
-        # Update inscription status
-        inscription.statut = 'completee'
-        inscription.notes_admin = (inscription.notes_admin or '') + f"\nConverti en élève le {datetime.now().strftime('%d/%m/%Y %H:%M')}. Matricule: {matricule}"
-        
-        db.session.commit()
-        
-        return jsonify({
-            'success': True, 
-            'eleve_id': eleve.id,
-            'matricule': matricule
-        })
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'success': False, 'error': str(e)}), 500
+        classe_id = _classe_demandee()
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Classe invalide'}), 400
+    resultat = convertir_inscriptions([id], classe_id, current_user.id)[0]
+    if resultat['statut'] != 'convertie':
+        return jsonify({'success': False, 'error': resultat['message']}), 400
+    return jsonify({
+        'success': True,
+        'eleve_id': resultat['eleve_id'],
+        'matricule': resultat['matricule']
+    })
@@ -0,0 +1,348 @@
+"""
+Background jobs
+
+Slow admin actions (broadcasts, exports, bulk deletions, large reports) are
+queued in the 'jobs' table and executed by worker processes started with
+
+    flask jobs worker
+
+Nothing beyond the application database is needed: a worker claims a job
+with a conditional UPDATE (only one worker can move it from 'en_attente' to
+'en_cours'), runs the registered handler, then stores its result, an
+optional result file and its progress on the same row. Failed jobs are
+retried with an exponential delay up to max_tentatives; a job whose worker
+died (no heartbeat for JOB_LEASE_SECONDS) is claimed again.
+
+Usage:
+    @job_handler('archives.export_excel')
+    def export_excel_job(ctx, filtre='tous'):
+        ...
+        wb.save(ctx.artifact_path('archives.xlsx'))
+        return {'dossiers': len(dossiers)}
+
+    job = enqueue('archives.export_excel', {'filtre': 'recent'})
+    return redirect(url_for('jobs.statut', job_id=job.id))
+"""
+
+import os
+import json
+import time
+import socket
+import shutil
+import logging
+from datetime import datetime, timedelta
+
+import click
+from flask import (Blueprint, current_app, has_request_context, render_template, jsonify,
+                   send_file, abort, request, session, url_for)
+from flask.cli import AppGroup
+from flask_login import login_required, current_user
+from sqlalchemy import update, or_, and_
+from werkzeug.utils import secure_filename
+
+from models import db, Job
+
+logger = logging.getLogger('jobs')
+
+_DEFAULT_RESULTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'jobs')
+
+# type -> (handler, max_tentatives)
+_handlers = {}
+
+
+def job_handler(job_type, max_tentatives=None):
+    """
+    Decorator registering fn(ctx, **payload) as the handler of a job type
+
+    Args:
+        job_type (str): Name stored in Job.type, e.g. 'archives.export_excel'
+        max_tentatives (int, optional): Attempts before the job is marked
+                                        'echec' (default JOB_MAX_TENTATIVES)
+    """
+    def decorator(fn):
+        _handlers[job_type] = (fn, max_tentatives)
+        return fn
+    return decorator
+
+
+def results_dir():
+    """Directory holding the result files of jobs (created on demand)"""
+    path = current_app.config.get('JOB_RESULTS_DIR') or _DEFAULT_RESULTS_DIR
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class JobContext:
+    """
+    Passed to handlers to report progress and store result files
+
+    progress() writes the heartbeat on a connection of its own and leaves
+    the handler's session alone, so it can be called while a result is
+    still streaming (yield_per). Handlers commit their own units of work,
+    so a retry only redoes the unit that failed.
+    """
+    def __init__(self, job):
+        self.job_id = job.id
+        self.tentative = job.tentatives
+        self.max_tentatives = job.max_tentatives or 1
+        self._fichier = None
+
+    @property
+    def derniere_tentative(self):
+        """True when a failure of this attempt will not be retried"""
+        return self.tentative >= self.max_tentatives
+
+    def progress(self, progression, message=None):
+        """
+        Record progress (0-100) and refresh the heartbeat
+
+        Args:
+            progression (int|float): Percentage done
+            message (str, optional): Short status shown in the admin UI
+        """
+        values = {'progression': max(0, min(100, int(progression))), 'date_heartbeat': datetime.now()}
+        if message is not None:
+            values['message'] = message[:255]
+        with db.engine.begin() as conn:
+            conn.execute(update(Job).where(Job.id == self.job_id).values(**values))
+
+    def artifact_path(self, filename):
+        """
+        Absolute path where the handler writes its result file
+
+        The file is offered for download on the job status page.
+        """
+        directory = os.path.join(results_dir(), str(self.job_id))
+        os.makedirs(directory, exist_ok=True)
+        self._fichier = os.path.join(str(self.job_id), secure_filename(filename))
+        return os.path.join(results_dir(), self._fichier)
+
+
+def enqueue(job_type, payload=None, cree_par=None, max_tentatives=None, delai=0):
+    """
+    Queue a job and commit it
+
+    Args:
+        job_type (str): Registered job type
+        payload (dict, optional): JSON-serialisable keyword arguments for the handler
+        cree_par (int, optional): User id (default: the logged-in user)
+        max_tentatives (int, optional): Overrides the handler/config default
+        delai (int, optional): Seconds to wait before the job may start
+
+    Returns:
+        Job: The queued job
+    """
+    if job_type not in _handlers:
+        raise ValueError(f"Type de tâche inconnu: {job_type}")
+    if cree_par is None and has_request_context() and current_user.is_authenticated:
+        cree_par = current_user.id
+
+    _, handler_max = _handlers[job_type]
+    job = Job(
+        type=job_type,
+        statut='en_attente',
+        payload=json.dumps(payload or {}, default=str),
+        cree_par=cree_par,
+        max_tentatives=max_tentatives or handler_max or current_app.config.get('JOB_MAX_TENTATIVES', 3),
+        executer_apres=datetime.now() + timedelta(seconds=delai),
+        progression=0,
+        tentatives=0,
+    )
+    db.session.add(job)
+    db.session.commit()
+    logger.info(f"Job {job.id} ({job_type}) mis en file")
+    return job
+
+
+def claim(worker_id):
+    """
+    Atomically take the next runnable job
+
+    Args:
+        worker_id (str): Identifier stored in Job.worker
+
+    Returns:
+        Job|None: The claimed job, now 'en_cours'
+    """
+    now = datetime.now()
+    stale = now - timedelta(seconds=current_app.config.get('JOB_LEASE_SECONDS', 600))
+    candidates = db.session.query(Job.id, Job.statut, Job.date_heartbeat).filter(or_(
+        and_(Job.statut == 'en_attente', or_(Job.executer_apres.is_(None), Job.executer_apres <= now)),
+        and_(Job.statut == 'en_cours', Job.date_heartbeat < stale),
+    )).order_by(Job.executer_apres, Job.id).limit(10).all()
+    db.session.rollback()  # release the read transaction before writing
+
+    for job_id, statut, heartbeat in candidates:
+        conditions = [Job.id == job_id, Job.statut == statut]
+        if statut == 'en_cours':
+            # Abandoned by a dead worker: only reclaim if nobody else did
+            conditions.append(Job.date_heartbeat == heartbeat)
+        result = db.session.execute(
+            update(Job).where(*conditions).values(
+                statut='en_cours',
+                worker=worker_id,
+                tentatives=Job.tentatives + 1,
+                date_debut=now,
+                date_heartbeat=now,
+            ),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+        if result.rowcount == 1:
+            return db.session.get(Job, job_id)
+    return None
+
+
+def run(job):
+    """Execute a claimed job and record its outcome"""
+    job_id = job.id
+    handler, _ = _handlers.get(job.type, (None, None))
+
+    if handler is None:
+        _finish(job_id, statut='echec', erreur=f"Type de tâche inconnu: {job.type}")
+        return
+    if job.tentatives > (job.max_tentatives or 1):
+        _finish(job_id, statut='echec', erreur=job.erreur or 'Nombre maximal de tentatives atteint')
+        return
+
+    ctx = JobContext(job)
+    started = time.monotonic()
+    try:
+        payload = json.loads(job.payload or '{}')
+        resultat = handler(ctx, **payload)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f"Job {job_id} ({job.type}) en échec, tentative {ctx.tentative}")
+        job = db.session.get(Job, job_id)
+        if job.tentatives < (job.max_tentatives or 1):
+            delay = current_app.config.get('JOB_RETRY_DELAY', 30) * 2 ** (job.tentatives - 1)
+            _finish(job_id, statut='en_attente', erreur=str(e),
+                    executer_apres=datetime.now() + timedelta(seconds=delay), date_fin=None)
+        else:
+            _finish(job_id, statut='echec', erreur=str(e))
+        return
+
+    _finish(job_id, statut='termine', progression=100, erreur=None,
+            resultat=json.dumps(resultat, default=str) if resultat is not None else None,
+            fichier_resultat=ctx._fichier)
+    logger.info(f"Job {job_id} ({job.type}) terminé en {time.monotonic() - started:.1f}s")
+
+
+def _finish(job_id, **values):
+    values.setdefault('date_fin', datetime.now())
+    db.session.execute(
+        update(Job).where(Job.id == job_id).values(**values),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+
+
+def work(worker_id=None, once=False, interval=None):
+    """
+    Worker loop, to be called inside an application context
+
+    Args:
+        worker_id (str, optional): Defaults to hostname:pid
+        once (bool): Exit when the queue is empty instead of polling
+        interval (float, optional): Seconds between polls (default JOB_POLL_INTERVAL)
+    """
+    worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+    interval = interval or current_app.config.get('JOB_POLL_INTERVAL', 2)
+    logger.info(f"Worker {worker_id} démarré")
+    processed = 0
+    while True:
+        job = claim(worker_id)
+        if job is not None:
+            run(job)
+            processed += 1
+            db.session.remove()
+            continue
+        if once:
+            return processed
+        time.sleep(interval)
+
+
+def purge(jours=30):
+    """Delete finished jobs older than `jours` days and their result files"""
+    limite = datetime.now() - timedelta(days=jours)
+    anciens = [job_id for (job_id,) in db.session.query(Job.id).filter(
+        Job.statut.in_(['termine', 'echec']), Job.date_fin < limite
+    )]
+    for start in range(0, len(anciens), 500):
+        chunk = anciens[start:start + 500]
+        Job.query.filter(Job.id.in_(chunk)).delete(synchronize_session=False)
+        db.session.commit()
+        for job_id in chunk:
+            shutil.rmtree(os.path.join(results_dir(), str(job_id)), ignore_errors=True)
+    return len(anciens)
+
+
+# ==================== CLI ====================
+
+jobs_cli = AppGroup('jobs', help='Tâches de fond')
+
+
+@jobs_cli.command('worker')
+@click.option('--once', is_flag=True, help='Traiter la file puis quitter')
+@click.option('--interval', type=float, default=None, help='Secondes entre deux scrutations')
+def worker_command(once, interval):
+    """Exécute les tâches en attente"""
+    try:
+        processed = work(once=once, interval=interval)
+        click.echo(f'{processed} tâche(s) traitée(s)')
+    except KeyboardInterrupt:
+        click.echo('Worker arrêté')
+
+
+@jobs_cli.command('purge')
+@click.option('--jours', type=int, default=30, help='Âge minimum des tâches terminées')
+def purge_command(jours):
+    """Supprime les anciennes tâches terminées et leurs fichiers"""
+    click.echo(f'{purge(jours)} tâche(s) supprimée(s)')
+
+
+# ==================== ROUTES ====================
+
+jobs_blueprint = Blueprint('jobs', __name__, url_prefix='/jobs')
+
+
+def _get_job_or_403(job_id):
+    job = Job.query.get_or_404(job_id)
+    if session.get('user_role') not in ['admin', 'directeur'] and job.cree_par != current_user.id:
+        abort(403)
+    return job
+
+
+def _safe_retour():
+    retour = request.args.get('retour', '')
+    return retour if retour.startswith('/') and not retour.startswith('//') else None
+
+
+@jobs_blueprint.route('/<int:job_id>')
+@login_required
+def statut(job_id):
+    job = _get_job_or_403(job_id)
+    return render_template('jobs/statut.html', job=job, retour=_safe_retour())
+
+
+@jobs_blueprint.route('/<int:job_id>/statut')
+@login_required
+def statut_json(job_id):
+    job = _get_job_or_403(job_id)
+    data = job.to_dict()
+    data['resultat'] = json.loads(job.resultat) if job.resultat else None
+    data['url_resultat'] = url_for('jobs.resultat', job_id=job.id) if job.fichier_resultat else None
+    return jsonify(data)
+
+
+@jobs_blueprint.route('/<int:job_id>/resultat')
+@login_required
+def resultat(job_id):
+    job = _get_job_or_403(job_id)
+    if job.statut != 'termine' or not job.fichier_resultat:
+        abort(404)
+    path = os.path.join(results_dir(), job.fichier_resultat)
+    if not os.path.exists(path):
+        abort(404)
+    return send_file(path, as_attachment=True, download_name=os.path.basename(path))
@@ -0,0 +1,75 @@
+"""
+Eager-loading profiles
+
+All relationships in models.py are declared lazy=True, so a listing page
+that touches note.eleve or paiement.frais in its template issues one query
+per row. Listing routes declare here which relationships they need and get
+the matching loader options: joinedload for many-to-one relationships
+(one JOIN in the main query), selectinload for collections (one extra
+IN query per relationship, whatever the number of rows).
+
+Usage:
+    notes = Note.query.options(*eager(Note, 'eleve.classe', 'cours')).all()
+    dossiers = eager_query(ArchiveDossier.query, ArchiveDossier).all()
+"""
+
+from sqlalchemy.orm import joinedload, selectinload
+
+from models import (Note, Presence, Paiement, ArchiveDossier, Article, Eleve,
+                    Evenement, Document, Enseignement, Frais, Doleance)
+
+# Default relationship paths per model, matching what the common list pages display
+DEFAULT_PROFILES = {
+    Note: ('eleve.classe', 'cours'),
+    Presence: ('eleve', 'cours'),
+    Paiement: ('eleve', 'frais', 'recepteur'),
+    ArchiveDossier: ('createur',),
+    Article: ('auteur',),
+    Eleve: ('classe', 'parent'),
+    Evenement: ('createur',),
+    Document: ('createur', 'eleve'),
+    Enseignement: ('cours', 'classe', 'professeur'),
+    Frais: ('classe',),
+    Doleance: ('admin',),
+}
+
+
+def _path_option(model, path):
+    """Build a chained loader option for a dotted relationship path"""
+    option = None
+    entity = model
+    for name in path.split('.'):
+        attribute = getattr(entity, name, None)
+        if attribute is None or not hasattr(attribute, 'property') or \
+                not hasattr(attribute.property, 'mapper'):
+            raise ValueError(f"'{name}' n'est pas une relation de {entity.__name__} (profil '{path}')")
+        relation = attribute.property
+        if option is None:
+            strategy = selectinload if relation.uselist else joinedload
+            option = strategy(attribute)
+        else:
+            option = option.selectinload(attribute) if relation.uselist else option.joinedload(attribute)
+        entity = relation.mapper.class_
+    return option
+
+
+def eager(model, *paths):
+    """
+    Loader options for a model
+
+    Args:
+        model: Mapped class the query returns
+        *paths (str): Dotted relationship paths ('eleve.classe'); the
+                      model's default profile is used when none are given
+
+    Returns:
+        list: Options to pass to Query.options()
+    """
+    if not paths:
+        paths = DEFAULT_PROFILES.get(model, ())
+    return [_path_option(model, path) for path in paths]
+
+
+def eager_query(query, model, *paths):
+    """Apply eager(model, *paths) to a query and return it"""
+    return query.options(*eager(model, *paths))
@@ -1,6 +1,8 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import (Blueprint, render_template, request, redirect, url_for, flash, jsonify, abort, current_app,
+                   Response, stream_with_context)
 from flask_login import login_required, current_user
 from models import db, News
+from modules import news_feed
 from functools import wraps
 from datetime import datetime
 
@@ -88,12 +90,37 @@ def delete_news(id):
 
 @news_blueprint.route('/api/news')
 def get_news():
-    """API pour récupérer les actualités actives"""
-    news_items = News.query.filter_by(active=True).order_by(News.priority.desc(), News.date_created.desc()).all()
-    return jsonify([{
-        'id': item.id,
-        'content': item.content
-    } for item in news_items])
+    """API pour récupérer les actualités actives (flux pré-calculé, voir modules/news_feed.py)"""
+    body, etag = news_feed.current()
+    
+    # Long-poll: ?attendre=<etag> répond dès que le flux change
+    attendre = request.args.get('attendre')
+    if attendre and current_app.config.get('NEWS_PUSH_ENABLED'):
+        if attendre == etag:
+            nouveau = news_feed.wait_for_change(etag, current_app.config.get('NEWS_LONG_POLL_TIMEOUT', 25),
+                                                current_app.config.get('NEWS_PUSH_INTERVAL', 1))
+            if nouveau is None:
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+            body, etag = nouveau
+    
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@news_blueprint.route('/api/news/stream')
+def stream_news():
+    """Flux Server-Sent Events des actualités"""
+    if not current_app.config.get('NEWS_PUSH_ENABLED'):
+        abort(404)
+    events = news_feed.sse_events(current_app.config.get('NEWS_STREAM_DURATION', 300),
+                                  current_app.config.get('NEWS_PUSH_INTERVAL', 1))
+    response = Response(stream_with_context(events), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx: send each event immediately
+    return response
 
 @news_blueprint.route('/admin/news/<int:id>/toggle', methods=['POST'])
 @login_required
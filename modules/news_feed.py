@@ -0,0 +1,161 @@
+"""
+News ticker feed
+
+The active News items are serialised once into a JSON blob
+(CACHE_DIR/news-feed.json) by publish(), which runs after every commit
+writing News, whichever page made it (modules/news.py or the admin
+content panel). The 'news'
+VersionCounter is bumped at the same time, so every worker reloads the
+blob on its next read; between two publications /api/news costs one
+os.stat() and no query.
+
+The ETag is a hash of the blob: clients revalidate with If-None-Match and
+get 304 while nothing changed. When NEWS_PUSH_ENABLED is set, clients can
+also wait for the next publication instead of polling:
+
+- /api/news?attendre=<etag>  long-poll, answers when the feed differs
+                             from <etag> or 304 after NEWS_LONG_POLL_TIMEOUT
+- /api/news/stream           Server-Sent Events, one 'news' event per
+                             publication, closed after NEWS_STREAM_DURATION
+                             (the browser reconnects by itself)
+
+Each waiting client holds a worker thread: only enable push with a
+threaded or gevent worker class.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+
+from sqlalchemy import select
+
+from models import db, News
+from modules.cache import VersionCounter, cache_dir, on_commit
+
+logger = logging.getLogger('news_feed')
+
+BLOB_NAME = 'news-feed.json'
+
+news_version = VersionCounter('news')
+# (version, body, etag) of the blob last read by this worker
+_current = (None, None, None)
+_lock = threading.Lock()
+
+
+def _blob_path():
+    return os.path.join(cache_dir(), BLOB_NAME)
+
+
+def _etag(body):
+    return hashlib.sha1(body).hexdigest()[:16]
+
+
+def _serialise():
+    # Own connection: publish() also runs from the after-commit hook, where the session cannot query
+    with db.engine.connect() as conn:
+        items = conn.execute(select(News.id, News.content).where(News.active == True).order_by(
+            News.priority.desc(), News.date_created.desc()
+        )).all()
+    return json.dumps([{'id': i, 'content': c} for i, c in items], ensure_ascii=False,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def publish():
+    """
+    Rebuild the blob from the database and notify every worker
+
+    Returns:
+        str: The new ETag
+    """
+    body = _serialise()
+    path = _blob_path()
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.news-feed-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(body)
+    os.replace(tmp_path, path)  # readers never see a partial file
+    news_version.bump()
+    return _etag(body)
+
+
+@on_commit(News)
+def _publier(changes):
+    publish()
+
+
+def current():
+    """
+    The published feed
+
+    Returns:
+        tuple: (body as bytes, etag)
+    """
+    global _current
+    version = news_version.current()
+    cached_version, body, etag = _current
+    if cached_version == version:
+        return body, etag
+    try:
+        with open(_blob_path(), 'rb') as f:
+            body = f.read()
+    except FileNotFoundError:
+        # First access on this host: nothing was published yet
+        publish()
+        return current()
+    etag = _etag(body)
+    with _lock:
+        _current = (version, body, etag)
+    return body, etag
+
+
+def wait_for_change(etag, timeout, interval=1.0):
+    """
+    Block until the published feed no longer matches etag
+
+    Args:
+        etag (str): ETag known by the client
+        timeout (float): Maximum wait in seconds
+        interval (float): Seconds between two checks (one os.stat each)
+
+    Returns:
+        tuple|None: (body, etag) of the new feed, None on timeout
+    """
+    deadline = time.monotonic() + timeout
+    version = news_version.current()
+    while True:
+        body, current_etag = current()
+        if current_etag != etag:
+            return body, current_etag
+        if time.monotonic() >= deadline:
+            return None
+        while news_version.current() == version and time.monotonic() < deadline:
+            time.sleep(interval)
+        version = news_version.current()
+
+
+def sse_events(duration, interval=1.0, heartbeat=15):
+    """
+    Server-Sent Events stream of the feed: the current feed, then one
+    event per publication, comments as keep-alive
+
+    Args:
+        duration (float): Seconds before the stream ends (the client reconnects)
+        interval (float): Seconds between two checks
+        heartbeat (float): Seconds between keep-alive comments
+    """
+    yield 'retry: 5000\n\n'
+    deadline = time.monotonic() + duration
+    sent = None
+    last_write = time.monotonic()
+    while time.monotonic() < deadline:
+        body, etag = current()
+        if etag != sent:
+            yield f"event: news\nid: {etag}\ndata: {body.decode('utf-8')}\n\n"
+            sent, last_write = etag, time.monotonic()
+        elif time.monotonic() - last_write >= heartbeat:
+            yield ': ping\n\n'
+            last_write = time.monotonic()
+        time.sleep(interval)
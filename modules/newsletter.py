@@ -0,0 +1,429 @@
+"""
+Newsletter dispatch
+
+A campaign (CampagneNewsletter) is sent by the 'newsletter.envoyer_campagne'
+background job to every active Newsletter subscriber:
+
+- the message is rendered once (templates/emails/newsletter.html); each
+  recipient only gets a string substitution for its unsubscribe link;
+- messages go through a small pool of persistent SMTP connections
+  (NEWSLETTER_SMTP_CONNEXIONS threads, each reusing its connection for
+  NEWSLETTER_MESSAGES_PAR_CONNEXION messages) throttled to
+  NEWSLETTER_DEBIT messages per second overall;
+- per-recipient results are written back to the newsletters table in
+  batched UPDATEs: permanent rejections (5xx) deactivate the address as
+  'rebond', temporary ones (4xx) are counted and the job is retried for
+  those recipients only;
+- a server that cannot be used at all (connection or login refused,
+  sender rejected) aborts the pass without counting anything against the
+  subscribers, and the job retries it as a whole.
+
+The SMTP connection factory is injectable (smtp_factory), so the whole
+path can run against a local stand-in instead of a real server.
+"""
+
+import queue
+import smtplib
+import logging
+import threading
+import time
+from datetime import datetime
+from email.message import EmailMessage
+from email.utils import make_msgid, formatdate
+
+from flask import current_app, render_template, url_for
+from itsdangerous import URLSafeSerializer, BadSignature
+from sqlalchemy import update, or_
+
+from models import db, Newsletter, CampagneNewsletter
+from modules.jobs import job_handler
+
+logger = logging.getLogger('newsletter')
+
+# Replaced by each recipient's token in the rendered message
+MARQUEUR_JETON = 'JETON-DESABONNEMENT'
+# Results written to the database every N recipients
+TAILLE_LOT = 200
+
+
+# ==================== UNSUBSCRIBE TOKENS ====================
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='newsletter-desabonnement')
+
+
+def jeton_desabonnement(abonne_id):
+    """Signed token identifying a subscriber in unsubscribe links"""
+    return _serializer().dumps(abonne_id)
+
+
+def lire_jeton(jeton):
+    """Subscriber id for a token, or None if the signature is invalid"""
+    try:
+        return int(_serializer().loads(jeton))
+    except (BadSignature, TypeError, ValueError):
+        return None
+
+
+def desabonner(abonne_id, motif='desabonnement'):
+    """Deactivate a subscription; returns False if the subscriber does not exist"""
+    abonne = db.session.get(Newsletter, abonne_id)
+    if abonne is None:
+        return False
+    if abonne.actif:
+        abonne.actif = False
+        abonne.date_desabonnement = datetime.now()
+        abonne.motif_desactivation = motif
+        db.session.commit()
+    return True
+
+
+# ==================== MESSAGE ====================
+
+class Gabarit:
+    """
+    A campaign rendered once, personalised per recipient by substitution
+
+    Built inside the application context; message() is then safe to call
+    from the pool's threads.
+
+    Args:
+        campagne (CampagneNewsletter): The campaign
+        modele_lien (str): Absolute unsubscribe URL containing MARQUEUR_JETON
+        expediteur (str): From address
+    """
+    def __init__(self, campagne, modele_lien, expediteur):
+        self.sujet = campagne.sujet
+        self.expediteur = expediteur
+        self.modele_lien = modele_lien
+        self.html = render_template('emails/newsletter.html', campagne=campagne, lien_desabonnement=modele_lien)
+        self.texte = (f"{campagne.contenu}\n\n--\n"
+                      f"Pour ne plus recevoir cette newsletter: {modele_lien}\n")
+        self._domaine = expediteur.rsplit('@', 1)[-1] if '@' in expediteur else None
+        self._serializer = _serializer()
+
+    def message(self, abonne_id, email):
+        """EmailMessage for one subscriber"""
+        jeton = self._serializer.dumps(abonne_id)
+        lien = self.modele_lien.replace(MARQUEUR_JETON, jeton)
+        msg = EmailMessage()
+        msg['Subject'] = self.sujet
+        msg['From'] = self.expediteur
+        msg['To'] = email
+        msg['Date'] = formatdate(localtime=True)
+        msg['Message-ID'] = make_msgid(domain=self._domaine)
+        msg['List-Unsubscribe'] = f'<{lien}>'
+        msg['List-Unsubscribe-Post'] = 'List-Unsubscribe=One-Click'
+        msg.set_content(self.texte.replace(MARQUEUR_JETON, jeton))
+        msg.add_alternative(self.html.replace(MARQUEUR_JETON, jeton), subtype='html')
+        return msg
+
+
+# ==================== SMTP POOL ====================
+
+def smtp_factory_depuis_config(config):
+    """Default factory: a logged-in smtplib.SMTP built from the MAIL_* settings"""
+    use_tls = str(config.get('MAIL_USE_TLS', True)).lower() not in ('0', 'false', 'no', '')
+
+    def factory():
+        smtp = smtplib.SMTP(config.get('MAIL_SERVER'), int(config.get('MAIL_PORT', 587)), timeout=30)
+        smtp.ehlo()
+        if use_tls:
+            smtp.starttls()
+            smtp.ehlo()
+        if config.get('MAIL_USERNAME'):
+            smtp.login(config['MAIL_USERNAME'], config.get('MAIL_PASSWORD') or '')
+        return smtp
+    return factory
+
+
+class _Debit:
+    """Thread-safe throttle spacing calls to at most `par_seconde` per second"""
+
+    def __init__(self, par_seconde):
+        self.intervalle = 1.0 / par_seconde if par_seconde else 0
+        self._prochain = time.monotonic()
+        self._lock = threading.Lock()
+
+    def attendre(self):
+        if not self.intervalle:
+            return
+        with self._lock:
+            maintenant = time.monotonic()
+            depart = max(maintenant, self._prochain)
+            self._prochain = depart + self.intervalle
+        if depart > maintenant:
+            time.sleep(depart - maintenant)
+
+
+class ServeurIndisponible(Exception):
+    """The SMTP server cannot be used at all: the pass is aborted and retried as a whole"""
+
+
+# Errors answering one recipient's RCPT or DATA; any other one is the server's
+ERREURS_DESTINATAIRE = (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError)
+
+
+def _classer_erreur(erreur, email):
+    """(statut, code, message) for an SMTP exception: 'rebond' is permanent, 'echec' temporary"""
+    if isinstance(erreur, smtplib.SMTPRecipientsRefused):
+        code, message = erreur.recipients.get(email, next(iter(erreur.recipients.values()), (None, b'')))
+    elif isinstance(erreur, smtplib.SMTPResponseException):
+        code, message = erreur.smtp_code, erreur.smtp_error
+    else:
+        return 'echec', None, str(erreur)
+    if isinstance(message, bytes):
+        message = message.decode('utf-8', 'replace')
+    statut = 'rebond' if isinstance(erreur, smtplib.SMTPRecipientsRefused) and code and code >= 500 else 'echec'
+    return statut, code, f'{code} {message}'
+
+
+class PoolSMTP:
+    """
+    Sends messages over a few persistent SMTP connections
+
+    Args:
+        smtp_factory (callable): Returns a connected smtplib.SMTP-like object
+        connexions (int): Number of connections (and sender threads)
+        debit (float, optional): Overall messages per second (None = unlimited)
+        messages_par_connexion (int): Connection recycled after this many messages
+    """
+    def __init__(self, smtp_factory, connexions=3, debit=None, messages_par_connexion=100):
+        self.smtp_factory = smtp_factory
+        self.connexions = max(1, connexions)
+        self.messages_par_connexion = messages_par_connexion
+        self._debit = _Debit(debit)
+        self._lock = threading.Lock()
+        self._panne = None
+
+    def _travailleur(self, entree, sortie):
+        smtp, envoyes = None, 0
+        try:
+            while True:
+                element = entree.get()
+                if element is None:
+                    return
+                if self._panne is not None:
+                    continue  # pass aborted: drain the queue without sending
+                abonne_id, email, construire = element
+                resultat = None
+                for tentative in range(2):
+                    if smtp is None or envoyes >= self.messages_par_connexion:
+                        self._fermer(smtp)
+                        smtp, envoyes = None, 0
+                        try:
+                            smtp = self.smtp_factory()
+                        except Exception as e:
+                            # Refused connection, bad credentials: not this recipient's fault
+                            self._arreter(e)
+                            break
+                    try:
+                        self._debit.attendre()
+                        smtp.send_message(construire(), to_addrs=[email])
+                        envoyes += 1
+                        resultat = (abonne_id, 'envoye', None)
+                        break
+                    except ERREURS_DESTINATAIRE as e:
+                        statut, _, message = _classer_erreur(e, email)
+                        resultat = (abonne_id, statut, message)
+                        try:
+                            smtp.rset()
+                        except (OSError, smtplib.SMTPException):
+                            self._fermer(smtp)
+                            smtp = None
+                        break
+                    except OSError as e:  # includes the other smtplib.SMTPException
+                        self._fermer(smtp)
+                        smtp = None
+                        perdue = not isinstance(e, smtplib.SMTPException) or isinstance(e, smtplib.SMTPServerDisconnected)
+                        if perdue and envoyes and not tentative:
+                            # Idle connection dropped by the server: reconnect and retry once
+                            continue
+                        # Sender refused, or a fresh connection failing too: the server is unusable
+                        self._arreter(e)
+                        break
+                    except Exception as e:
+                        # Never let one message stop the thread: the queue would never drain
+                        logger.exception(f"Envoi à {email} impossible")
+                        resultat = (abonne_id, 'echec', str(e))
+                        break
+                if resultat is not None:
+                    sortie.put(resultat)
+        finally:
+            self._fermer(smtp)
+
+    def _arreter(self, erreur):
+        with self._lock:
+            if self._panne is None:
+                logger.error(f"Serveur SMTP inutilisable, envoi interrompu: {erreur!r}")
+                self._panne = erreur
+
+    @staticmethod
+    def _fermer(smtp):
+        if smtp is None:
+            return
+        try:
+            smtp.quit()
+        except Exception:
+            try:
+                smtp.close()
+            except Exception:
+                pass
+
+    def envoyer(self, destinataires, construire, rapporter):
+        """
+        Send one message per recipient
+
+        Args:
+            destinataires (iterable): (abonne_id, email) tuples
+            construire (callable): construire(abonne_id, email) -> EmailMessage
+            rapporter (callable): Called from the calling thread with a list
+                                  of (abonne_id, statut, erreur) results
+
+        Raises:
+            ServeurIndisponible: The server refused the connection, the login
+                                 or the sender; recipients not reached yet are
+                                 not reported
+        """
+        self._panne = None
+        entree = queue.Queue(maxsize=self.connexions * 20)
+        sortie = queue.Queue()
+        threads = [threading.Thread(target=self._travailleur, args=(entree, sortie), daemon=True)
+                   for _ in range(self.connexions)]
+        for thread in threads:
+            thread.start()
+
+        def vider(bloquant=False):
+            resultats = []
+            while True:
+                try:
+                    resultats.append(sortie.get(timeout=0.5) if bloquant and not resultats else sortie.get_nowait())
+                except queue.Empty:
+                    break
+            if resultats:
+                rapporter(resultats)
+
+        for abonne_id, email in destinataires:
+            if self._panne is not None:
+                break
+            entree.put((abonne_id, email, lambda a=abonne_id, e=email: construire(a, e)))
+            if sortie.qsize() >= TAILLE_LOT:
+                vider()
+        for _ in threads:
+            entree.put(None)
+        while any(thread.is_alive() for thread in threads):
+            vider(bloquant=True)
+        vider()
+        if self._panne is not None:
+            raise ServeurIndisponible(str(self._panne) or self._panne.__class__.__name__) from self._panne
+
+
+# ==================== CAMPAIGN JOB ====================
+
+def _modele_lien():
+    config = current_app.config
+    with current_app.test_request_context(base_url=config.get('SITE_URL') or 'http://localhost'):
+        return url_for('newsletter_desabonnement', jeton=MARQUEUR_JETON, _external=True)
+
+
+def envoyer_campagne(campagne_id, smtp_factory=None, ctx=None):
+    """
+    Send a campaign to the active subscribers it has not reached yet
+
+    Args:
+        campagne_id (int): CampagneNewsletter id
+        smtp_factory (callable, optional): Defaults to the MAIL_* settings
+        ctx (JobContext, optional): Progress reporting when run as a job
+
+    Returns:
+        dict: Counters for this pass (envoyes, rebonds, echecs)
+    """
+    config = current_app.config
+    campagne = db.session.get(CampagneNewsletter, campagne_id)
+    if campagne is None:
+        return {'status': 'skipped', 'reason': 'campagne_supprimee'}
+
+    # Subscribers already reached by this campaign are skipped: a retry only resends the failures
+    destinataires = db.session.query(Newsletter.id, Newsletter.email, Newsletter.nombre_echecs).filter(
+        Newsletter.actif == True,
+        or_(Newsletter.derniere_campagne_id.is_(None), Newsletter.derniere_campagne_id != campagne.id)
+    ).order_by(Newsletter.id).all()
+    echecs_precedents = {abonne_id: nombre or 0 for abonne_id, _, nombre in destinataires}
+
+    if campagne.statut != 'en_cours':
+        campagne.statut = 'en_cours'
+        campagne.date_envoi = campagne.date_envoi or datetime.now()
+        campagne.nombre_destinataires = len(destinataires)
+    db.session.commit()
+
+    gabarit = Gabarit(campagne, _modele_lien(), config.get('MAIL_DEFAULT_SENDER'))
+    pool = PoolSMTP(
+        smtp_factory or smtp_factory_depuis_config(config),
+        connexions=config.get('NEWSLETTER_SMTP_CONNEXIONS', 3),
+        debit=config.get('NEWSLETTER_DEBIT', 10),
+        messages_par_connexion=config.get('NEWSLETTER_MESSAGES_PAR_CONNEXION', 100),
+    )
+    max_echecs = config.get('NEWSLETTER_MAX_ECHECS', 3)
+    compteurs = {'envoyes': 0, 'rebonds': 0, 'echecs': 0}
+
+    def rapporter(resultats):
+        maintenant = datetime.now()
+        lignes = []
+        for abonne_id, statut, erreur in resultats:
+            if statut == 'envoye':
+                compteurs['envoyes'] += 1
+                lignes.append({'id': abonne_id, 'statut_envoi': 'envoye', 'dernier_envoi': maintenant,
+                               'derniere_campagne_id': campagne_id, 'nombre_echecs': 0, 'derniere_erreur': None})
+                continue
+            nombre = echecs_precedents.get(abonne_id, 0) + 1
+            ligne = {'id': abonne_id, 'statut_envoi': statut, 'nombre_echecs': nombre,
+                     'derniere_erreur': (erreur or '')[:255]}
+            if statut == 'rebond' or nombre >= max_echecs:
+                compteurs['rebonds'] += 1
+                ligne.update(statut_envoi='rebond', actif=False, motif_desactivation='rebond',
+                             derniere_campagne_id=campagne_id)
+            else:
+                compteurs['echecs'] += 1
+            lignes.append(ligne)
+        db.session.execute(update(Newsletter), lignes)
+        db.session.commit()
+        if ctx is not None:
+            traites = sum(compteurs.values())
+            ctx.progress(100 * traites / max(1, len(destinataires)),
+                         f"{traites}/{len(destinataires)} destinataire(s) traité(s)")
+
+    debut = time.monotonic()
+    try:
+        pool.envoyer(((a, e) for a, e, _ in destinataires), gabarit.message, rapporter)
+    finally:
+        logger.info(f"Campagne {campagne_id}: {compteurs} en {time.monotonic() - debut:.1f}s")
+        # Bounces of earlier passes stay attached to the campaign; temporary failures are those of this pass
+        rebonds = Newsletter.query.filter_by(derniere_campagne_id=campagne_id, statut_envoi='rebond').count()
+        db.session.execute(update(CampagneNewsletter).where(CampagneNewsletter.id == campagne_id).values(
+            nombre_envoyes=CampagneNewsletter.nombre_envoyes + compteurs['envoyes'],
+            nombre_echecs=rebonds + compteurs['echecs'],
+        ))
+        db.session.commit()
+    return compteurs
+
+
+@job_handler('newsletter.envoyer_campagne', max_tentatives=4)
+def envoyer_campagne_job(ctx, campagne_id):
+    """Tâche de fond: envoie une campagne, les échecs temporaires sont réessayés par la tâche"""
+    try:
+        compteurs = envoyer_campagne(campagne_id, ctx=ctx)
+    except ServeurIndisponible:
+        # Nobody's failure counter moved: the whole pass is retried later
+        if ctx.derniere_tentative:
+            db.session.execute(update(CampagneNewsletter).where(CampagneNewsletter.id == campagne_id).values(
+                statut='echec', date_fin=datetime.now()))
+            db.session.commit()
+        raise
+    if compteurs.get('echecs') and not ctx.derniere_tentative:
+        raise RuntimeError(f"{compteurs['echecs']} envoi(s) en échec temporaire, nouvelle tentative prévue")
+
+    statut = 'terminee' if not compteurs.get('echecs') else 'echec'
+    db.session.execute(update(CampagneNewsletter).where(CampagneNewsletter.id == campagne_id).values(
+        statut=statut, date_fin=datetime.now()))
+    db.session.commit()
+    return compteurs
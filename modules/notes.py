@@ -3,6 +3,11 @@ from flask_login import login_required
 from models import Note, Eleve, Cours
 from models import db
 from datetime import datetime, date
+import re
+from modules.loaders import eager
+from modules import reference_data
+from modules.import_tableur import lire_tableur, normaliser_colonne, en_nombre, en_date
+from sqlalchemy import insert, update
 
 
 notes_blueprint = Blueprint('notes', __name__, url_prefix='/notes')
@@ -10,15 +15,107 @@ notes_blueprint = Blueprint('notes', __name__, url_prefix='/notes')
 @notes_blueprint.route('/')
 @login_required
 def index():
-    from models import Classe
-    classes = Classe.query.order_by(Classe.niveau, Classe.nom).all()
+    classes = reference_data.classes()
     return render_template('notes/index.html', classes=classes)
 
+TYPES_NOTE = ('devoir', 'examen', 'projet', 'participation')
+
+
+def _valider_saisies(saisies):
+    """
+    Convert and check every entry in one pass
+
+    Each entry is a dict with eleve_id, type, valeur, sur, commentaire and
+    ligne (row label used in messages). valeur and sur are converted to
+    float in place.
+
+    Returns:
+        list: Error messages (empty if everything is valid)
+    """
+    erreurs = []
+    for saisie in saisies:
+        ligne = saisie.get('ligne', '?')
+        try:
+            saisie['eleve_id'] = int(saisie['eleve_id'])
+        except (TypeError, ValueError):
+            erreurs.append(f"Ligne {ligne}: élève invalide.")
+            continue
+        if saisie['type'] not in TYPES_NOTE:
+            erreurs.append(f"Ligne {ligne}: type d'évaluation inconnu ({saisie['type']}).")
+            continue
+        try:
+            saisie['sur'] = en_nombre(saisie['sur'])
+            saisie['valeur'] = en_nombre(saisie['valeur'])
+        except ValueError:
+            erreurs.append(f"Ligne {ligne}: note non numérique.")
+            continue
+        if not saisie['sur'] or saisie['sur'] <= 0:
+            erreurs.append(f"Ligne {ligne}: le barème doit être positif.")
+        elif saisie['valeur'] is None or not 0 <= saisie['valeur'] <= saisie['sur']:
+            erreurs.append(f"Ligne {ligne}: la note doit être comprise entre 0 et {saisie['sur']:g}.")
+    return erreurs
+
+
+def enregistrer_notes(cours_id, trimestre, date_note, saisies):
+    """
+    Insert or update the notes of several students, and several evaluation types, at once
+
+    The existing notes are loaded in one query; new notes are written with
+    one INSERT and existing ones with one UPDATE (executemany). Nothing is
+    written if any entry is invalid.
+
+    Args:
+        cours_id (int): Course
+        trimestre (int): Trimester
+        date_note (date): Date stored on every note
+        saisies (list): dicts with eleve_id, type, valeur, sur, commentaire, ligne
+
+    Returns:
+        tuple: (erreurs, nombre_inserees, nombre_modifiees)
+    """
+    erreurs = _valider_saisies(saisies)
+    if erreurs:
+        return erreurs, 0, 0
+    if not saisies:
+        return [], 0, 0
+    cours_id, trimestre = int(cours_id), int(trimestre)
+
+    eleve_ids = {s['eleve_id'] for s in saisies}
+    types = {s['type'] for s in saisies}
+    existantes = {
+        (eleve_id, type_note): note_id
+        for note_id, eleve_id, type_note in db.session.query(Note.id, Note.eleve_id, Note.type).filter(
+            Note.cours_id == cours_id,
+            Note.trimestre == trimestre,
+            Note.type.in_(types),
+            Note.eleve_id.in_(eleve_ids)
+        )
+    }
+
+    insertions, mises_a_jour = [], []
+    for saisie in saisies:
+        valeurs = {'valeur': saisie['valeur'], 'sur': saisie['sur'], 'date': date_note,
+                   'commentaire': saisie.get('commentaire')}
+        note_id = existantes.get((saisie['eleve_id'], saisie['type']))
+        if note_id:
+            mises_a_jour.append(dict(valeurs, id=note_id))
+        else:
+            insertions.append(dict(valeurs, eleve_id=saisie['eleve_id'], cours_id=cours_id,
+                                   trimestre=trimestre, type=saisie['type']))
+
+    if insertions:
+        db.session.execute(insert(Note), insertions)
+    if mises_a_jour:
+        db.session.execute(update(Note), mises_a_jour)
+    db.session.commit()
+    return [], len(insertions), len(mises_a_jour)
+
 @notes_blueprint.route('/saisie', methods=['GET', 'POST'])
 @login_required
 def saisie():
     if request.method == 'POST':
         cours_id = request.form.get('cours_id')
+        classe_id = request.form.get('classe_id')
         trimestre = request.form.get('trimestre')
         type_note = request.form.get('type')
         date_note = request.form.get('date')
@@ -27,34 +124,26 @@ def saisie():
         sur = request.form.get('sur', 20)
         commentaires = request.form.getlist('commentaire[]')
         
-        from models import Note
-        from datetime import datetime
         # Ensure date_note is a datetime.date object
         if isinstance(date_note, str):
             date_note = datetime.strptime(date_note, "%Y-%m-%d").date()
-        for i in range(len(eleves_data)):
-            eleve_id = eleves_data[i]
-            note_value = notes[i] if i < len(notes) and notes[i] else 0
-            commentaire = commentaires[i] if i < len(commentaires) else None
-            existing = Note.query.filter_by(eleve_id=eleve_id, cours_id=cours_id, trimestre=trimestre, type=type_note).first()
-            if existing:
-                existing.valeur = note_value
-                existing.sur = sur
-                existing.date = date_note
-                existing.commentaire = commentaire
-            else:
-                new_note = Note(
-                    eleve_id=eleve_id,
-                    cours_id=cours_id,
-                    trimestre=trimestre,
-                    type=type_note,
-                    valeur=note_value,
-                    sur=sur,
-                    date=date_note,
-                    commentaire=commentaire
-                )
-                db.session.add(new_note)
-        db.session.commit()
+        saisies = [{
+            'eleve_id': eleves_data[i],
+            'type': type_note,
+            'valeur': notes[i] if i < len(notes) and notes[i] else 0,
+            'sur': sur,
+            'commentaire': commentaires[i] if i < len(commentaires) else None,
+            'ligne': i + 1,
+        } for i in range(len(eleves_data))]
+        
+        erreurs, inserees, modifiees = enregistrer_notes(cours_id, trimestre, date_note, saisies)
+        if erreurs:
+            for erreur in erreurs[:10]:
+                flash(erreur, 'danger')
+            if classe_id:
+                return redirect(url_for('notes.saisie', classe_id=classe_id, cours_id=cours_id,
+                                        trimestre=trimestre, type=type_note))
+            return redirect(url_for('notes.index'))
         flash('Notes enregistrées avec succès!', 'success')
         return redirect(url_for('notes.index'))
     
@@ -73,7 +162,8 @@ def saisie():
     if not cours:
         flash('Cours non trouvé.', 'danger')
         return redirect(url_for('notes.index'))
-    classe_nom = Classe.query.get(classe_id).nom if classe_id else None
+    classe_ref = reference_data.classe(classe_id)
+    classe_nom = classe_ref.nom if classe_ref else None
     from models import Eleve, Note
     eleves = Eleve.query.filter_by(classe_id=classe_id, actif=1).order_by(Eleve.nom, Eleve.prenom).all()
     existing_notes = Note.query.join(Eleve, Note.eleve_id == Eleve.id)
@@ -86,12 +176,87 @@ def saisie():
     notes_dict = {n.eleve_id: n for n in existing_notes}
     return render_template('notes/saisie.html',
                           cours=cours,
+                          classe_id=classe_id,
+                          classe_nom=classe_nom,
                           eleves=eleves,
                           notes_dict=notes_dict,
                           trimestre=trimestre,
                           type_note=type_note,
                           date_note=date.today().strftime('%Y-%m-%d'))
 
+# Gradebook column headers: "examen", "devoir /20", "projet sur 50"
+COLONNE_EVALUATION = re.compile(r'^(%s)\s*(?:(?:/|sur)\s*(\d+(?:[.,]\d+)?))?$' % '|'.join(TYPES_NOTE))
+
+@notes_blueprint.route('/import', methods=['POST'])
+@login_required
+def importer():
+    """Import a CSV/XLSX gradebook: one row per student (matricule), one column per evaluation"""
+    classe_id = request.form.get('classe_id')
+    cours_id = request.form.get('cours_id')
+    trimestre = request.form.get('trimestre')
+    retour = url_for('notes.saisie', classe_id=classe_id, cours_id=cours_id, trimestre=trimestre,
+                     type=request.form.get('type', 'devoir'))
+    fichier = request.files.get('fichier')
+    if not (classe_id and cours_id and trimestre) or not fichier or not fichier.filename:
+        flash('Veuillez choisir un fichier CSV ou XLSX.', 'warning')
+        return redirect(retour)
+    try:
+        date_note = en_date(request.form.get('date')) or date.today()
+    except ValueError:
+        flash('Format de date invalide.', 'danger')
+        return redirect(retour)
+    
+    try:
+        colonnes, lignes = lire_tableur(fichier)
+    except Exception as e:
+        flash(f'Fichier illisible: {str(e)}', 'danger')
+        return redirect(retour)
+    if 'matricule' not in colonnes:
+        flash('La colonne "matricule" est obligatoire.', 'danger')
+        return redirect(retour)
+    
+    evaluations = {}
+    for colonne in colonnes:
+        m = COLONNE_EVALUATION.match(colonne)
+        if m:
+            if m.group(1) in evaluations.values():
+                flash(f'L\'évaluation "{m.group(1)}" apparaît dans plusieurs colonnes.', 'danger')
+                return redirect(retour)
+            evaluations[colonne] = m.group(1)
+    if not evaluations:
+        flash('Aucune colonne d\'évaluation trouvée (devoir, examen, projet, participation, ex. "examen /20").', 'danger')
+        return redirect(retour)
+    baremes = {col: (COLONNE_EVALUATION.match(col).group(2) or '20').replace(',', '.') for col in evaluations}
+    
+    # Students of the class, by matricule (one query)
+    par_matricule = {matricule: eleve_id for eleve_id, matricule in
+                     db.session.query(Eleve.id, Eleve.matricule).filter(Eleve.classe_id == classe_id)}
+    
+    saisies, erreurs = [], []
+    for numero, ligne in lignes:
+        matricule = str(ligne.get('matricule') or '').strip()
+        eleve_id = par_matricule.get(matricule)
+        if eleve_id is None:
+            erreurs.append(f"Ligne {numero}: matricule inconnu dans cette classe ({matricule or 'vide'}).")
+            continue
+        for colonne, type_note in evaluations.items():
+            if ligne.get(colonne) is None:
+                continue  # empty cell: no grade for this evaluation
+            saisies.append({'eleve_id': eleve_id, 'type': type_note, 'valeur': ligne[colonne],
+                            'sur': baremes[colonne], 'commentaire': None, 'ligne': numero})
+    
+    if not erreurs:
+        erreurs, inserees, modifiees = enregistrer_notes(cours_id, trimestre, date_note, saisies)
+    if erreurs:
+        for erreur in erreurs[:10]:
+            flash(erreur, 'danger')
+        if len(erreurs) > 10:
+            flash(f'... et {len(erreurs) - 10} autre(s) erreur(s). Aucune note n\'a été enregistrée.', 'danger')
+        return redirect(retour)
+    
+    flash(f'Import terminé: {inserees} note(s) ajoutée(s), {modifiees} note(s) modifiée(s).', 'success')
+    return redirect(retour)
+
 @notes_blueprint.route('/bulletin')
 @login_required
 def bulletin():
@@ -100,8 +265,7 @@ def bulletin():
     
     if not eleve_id or not trimestre:
         # Show form to select student and trimester
-        from models import Classe
-        classes = Classe.query.order_by(Classe.niveau, Classe.nom).all()
+        classes = reference_data.classes()
         return render_template('notes/bulletin_form.html', classes=classes)
     
     from models import Eleve, Classe, Cours, Note, User
@@ -211,13 +375,15 @@ def toutes_les_notes():
     cours_id = request.args.get('cours_id')
     
     # Get all classes for the filter dropdown
-    from models import Classe, Cours
-    classes = Classe.query.order_by(Classe.niveau, Classe.nom).all()
-    cours_list = Cours.query.order_by(Cours.nom).all()
+    classes = reference_data.classes()
+    cours_list = reference_data.cours()
     
     # Build the query
     from models import Note, Eleve
-    query = Note.query.join(Eleve, Note.eleve_id == Eleve.id).join(Cours, Note.cours_id == Cours.id)
+    query = (Note.query
+             .join(Eleve, Note.eleve_id == Eleve.id)
+             .join(Cours, Note.cours_id == Cours.id)
+             .options(*eager(Note, 'eleve.classe', 'cours')))
     
     # Apply filters
     if classe_id:
@@ -0,0 +1,201 @@
+"""
+Page and fragment cache for the public website
+
+- cached_page(): caches the rendered body of a public page for anonymous
+  visitors and sets Cache-Control. Logged-in users, pending flash messages,
+  non-GET requests and responses that modify the session always bypass it.
+- fragment(): caches a computed value (e.g. the announcement ticker of
+  base.html) for every visitor, logged in or not.
+
+Both are invalidated by tags. A tag is a VersionCounter (see modules/cache.py):
+commits writing a model listed in TAGS_BY_MODEL bump its tags, and every
+entry stored under an older version is recomputed on the next request, in
+every worker. Each entry also expires after its TTL, which covers
+date-dependent content such as "upcoming events".
+
+Usage:
+    @app.route('/evenements')
+    @cached_page(tags=('evenements',))
+    def evenements():
+        ...
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request, session, make_response
+
+from models import Evenement, Article, Annonce, Eleve
+from modules.cache import VersionCounter, on_commit
+
+logger = logging.getLogger('page_cache')
+
+# Tag shared by every cached page: base.html renders the announcement ticker
+LAYOUT_TAG = 'annonces'
+
+# Tags bumped when a commit writes one of these models
+TAGS_BY_MODEL = {
+    Evenement: ('accueil',),
+    Eleve: ('accueil',),
+    Article: ('evenements',),
+    Annonce: (LAYOUT_TAG, 'accueil'),
+}
+
+_counters = {}
+_counters_lock = threading.Lock()
+
+
+def _counter(tag):
+    counter = _counters.get(tag)
+    if counter is None:
+        with _counters_lock:
+            counter = _counters.setdefault(tag, VersionCounter(f'page-{tag}'))
+    return counter
+
+
+def purge(*tags):
+    """Invalidate every page and fragment stored under one of the tags, in all workers"""
+    for tag in tags:
+        _counter(tag).bump()
+
+
+@on_commit(*TAGS_BY_MODEL)
+def _purge_on_commit(changes):
+    tags = set()
+    for model in changes:
+        for mapped, model_tags in TAGS_BY_MODEL.items():
+            if issubclass(model, mapped):
+                tags.update(model_tags)
+    purge(*sorted(tags))
+
+
+class _Store:
+    """Bounded LRU of (versions, stored_at, value) entries"""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, versions, ttl):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        entry_versions, stored_at, value = entry
+        if entry_versions != versions or time.monotonic() - stored_at >= ttl:
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, versions, value, max_entries):
+        with self._lock:
+            self._entries[key] = (versions, time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_pages = _Store()
+_fragments = _Store()
+
+
+def _versions(tags):
+    return tuple(_counter(tag).current() for tag in tags)
+
+
+def _bypass():
+    """True when the current request must not be served from (or stored in) the page cache"""
+    if not current_app.config.get('PAGE_CACHE_ENABLED', True):
+        return True
+    if request.method not in ('GET', 'HEAD'):
+        return True
+    # Both Flask-Login's key and the application's own session keys
+    if session.get('_user_id') or session.get('user_id') or session.get('_flashes'):
+        return True
+    return False
+
+
+def _public_headers(response, ttl):
+    browser_ttl = min(ttl, current_app.config.get('PAGE_CACHE_BROWSER_TTL', 60))
+    response.headers['Cache-Control'] = f'public, max-age={browser_ttl}, s-maxage={ttl}'
+    response.vary.add('Cookie')
+    return response
+
+
+def cached_page(ttl=None, tags=()):
+    """
+    Decorator caching a public view for anonymous visitors
+
+    Args:
+        ttl (int, optional): Lifetime in seconds (default PAGE_CACHE_TTL)
+        tags (tuple): Invalidation tags, in addition to the layout tag
+    """
+    all_tags = (LAYOUT_TAG,) + tuple(t for t in tags if t != LAYOUT_TAG)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if _bypass():
+                response = make_response(view(*args, **kwargs))
+                response.headers.setdefault('Cache-Control', 'private, no-cache')
+                return response
+
+            lifetime = ttl or current_app.config.get('PAGE_CACHE_TTL', 300)
+            key = (request.path, request.query_string)
+            # Read the versions before rendering: a write during the render leaves the entry stale
+            versions = _versions(all_tags)
+            cached = _pages.get(key, versions, lifetime)
+            if cached is not None:
+                body, status, mimetype = cached
+                response = current_app.response_class(body, status=status, mimetype=mimetype)
+                response.headers['X-Page-Cache'] = 'HIT'
+                return _public_headers(response, lifetime)
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.direct_passthrough or \
+                    session.modified or 'Set-Cookie' in response.headers:
+                response.headers.setdefault('Cache-Control', 'private, no-cache')
+                return response
+
+            _pages.set(key, versions, (response.get_data(), response.status_code, response.mimetype),
+                       current_app.config.get('PAGE_CACHE_MAX_ENTRIES', 500))
+            response.headers['X-Page-Cache'] = 'MISS'
+            return _public_headers(response, lifetime)
+        return wrapper
+    return decorator
+
+
+def fragment(name, compute, tags=(), ttl=None):
+    """
+    Cached value shared by all visitors
+
+    The value must not hold ORM instances (they would outlive their
+    session): return tuples/namedtuples or rendered strings.
+
+    Args:
+        name (str): Fragment key
+        compute (callable): Builds the value on a miss
+        tags (tuple): Invalidation tags
+        ttl (int, optional): Lifetime in seconds (default PAGE_CACHE_TTL)
+    """
+    lifetime = ttl or current_app.config.get('PAGE_CACHE_TTL', 300)
+    versions = _versions(tags)
+    value = _fragments.get(name, versions, lifetime)
+    if value is None:
+        value = compute()
+        _fragments.set(name, versions, value, current_app.config.get('PAGE_CACHE_MAX_ENTRIES', 500))
+    return value
+
+
+def clear():
+    """Drop every entry of this process (tests, `flask shell`)"""
+    _pages.clear()
+    _fragments.clear()
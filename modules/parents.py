@@ -0,0 +1,171 @@
+"""
+Parent dashboard
+
+One page (and its JSON twin) summarising every child of a parent: the
+averages of the current trimester, the attendance rate of the school year
+and the outstanding fees. Whatever the number of children, a summary is
+built with five queries (children, grade averages, attendance counts,
+applicable fees, payments), each batched with eleve_id IN (...).
+
+Summaries are cached per parent. Any commit writing Note, Presence,
+Paiement, Eleve or Frais bumps the 'tableau_parents' version, so every
+worker recomputes on the next visit; grade entry goes through bulk
+statements that do not say which students they touched, which is why the
+version is shared rather than per parent.
+"""
+
+from collections import namedtuple
+from datetime import datetime
+
+from flask import Blueprint, render_template, request, session, jsonify, abort
+from flask_login import login_required, current_user
+from sqlalchemy import func, or_
+
+from config import Config
+from models import db, Eleve, Note, Presence, Paiement, Frais, Classe, User
+from modules import reference_data
+from modules.archivage_annuel import debut_annee_scolaire
+from modules.cache import VersionCounter, VersionedCache, on_commit
+
+parents_blueprint = Blueprint('parents', __name__, url_prefix='/parents')
+
+ResumeEnfant = namedtuple('ResumeEnfant', [
+    'id', 'matricule', 'nom', 'prenom', 'classe',
+    'trimestre',          # current trimester (latest one with grades this school year), or None
+    'moyennes',           # tuple of (cours, moyenne /20), ordered by course name
+    'moyenne_generale',   # coefficient-weighted, /20, or None
+    'presences',          # number of attendance records this school year
+    'absences',
+    'retards',
+    'taux_presence',      # percentage (present + late) / records, or None
+    'total_du',
+    'total_paye',
+    'solde',
+])
+
+tableau_version = VersionCounter('tableau_parents')
+_cache = VersionedCache(tableau_version, ttl=Config.PARENT_DASHBOARD_TTL)
+
+
+@on_commit(Note, Presence, Paiement, Eleve, Frais)
+def _invalidate(changes):
+    tableau_version.bump()
+
+
+def _calculer(parent_id):
+    enfants = db.session.query(
+        Eleve.id, Eleve.matricule, Eleve.nom, Eleve.prenom, Eleve.classe_id, Classe.nom
+    ).outerjoin(Classe, Classe.id == Eleve.classe_id).filter(
+        Eleve.parent_id == parent_id, Eleve.actif != False
+    ).order_by(Eleve.prenom, Eleve.nom).all()
+    if not enfants:
+        return ()
+    ids = [e[0] for e in enfants]
+    debut = debut_annee_scolaire()
+
+    # Averages per (student, trimester, course); the current trimester is picked per student
+    moyennes = {}
+    for eleve_id, trimestre, cours_id, moyenne in db.session.query(
+        Note.eleve_id, Note.trimestre, Note.cours_id, func.avg(Note.valeur * 20.0 / Note.sur)
+    ).filter(Note.eleve_id.in_(ids), Note.date >= debut, Note.sur > 0).group_by(
+        Note.eleve_id, Note.trimestre, Note.cours_id
+    ):
+        moyennes.setdefault(eleve_id, {}).setdefault(trimestre, {})[cours_id] = moyenne
+
+    presences = {}
+    for eleve_id, statut, nombre in db.session.query(
+        Presence.eleve_id, Presence.statut, func.count(Presence.id)
+    ).filter(Presence.eleve_id.in_(ids), Presence.date >= debut).group_by(Presence.eleve_id, Presence.statut):
+        presences.setdefault(eleve_id, {})[statut] = nombre
+
+    # Same rule as finances.situation: fees of the current year, for the class or for everyone
+    classes = {e[4] for e in enfants}
+    frais = db.session.query(Frais.id, Frais.montant, Frais.classe_id).filter(
+        Frais.annee_scolaire == str(datetime.now().year),
+        or_(Frais.classe_id.is_(None), Frais.classe_id.in_(classes))
+    ).all()
+    payes = {}
+    for eleve_id, frais_id, montant in db.session.query(
+        Paiement.eleve_id, Paiement.frais_id, func.sum(Paiement.montant)
+    ).filter(Paiement.eleve_id.in_(ids), Paiement.frais_id.in_([f[0] for f in frais] or [0])).group_by(
+        Paiement.eleve_id, Paiement.frais_id
+    ):
+        payes[(eleve_id, frais_id)] = montant or 0
+
+    cours_par_id = reference_data.snapshot().cours_par_id
+    resumes = []
+    for eleve_id, matricule, nom, prenom, classe_id, classe_nom in enfants:
+        par_trimestre = moyennes.get(eleve_id, {})
+        trimestre = max(par_trimestre) if par_trimestre else None
+        lignes, points, coefficients = [], 0.0, 0.0
+        for cours_id, moyenne in (par_trimestre.get(trimestre) or {}).items():
+            cours = cours_par_id.get(cours_id)
+            coefficient = (cours.coefficient if cours else 1) or 1
+            lignes.append((cours.nom if cours else f'Cours {cours_id}', round(moyenne, 2)))
+            points += moyenne * coefficient
+            coefficients += coefficient
+        lignes.sort()
+
+        statuts = presences.get(eleve_id, {})
+        total_presences = sum(statuts.values())
+        presents = statuts.get('present', 0) + statuts.get('retard', 0)
+
+        applicables = [(f_id, montant) for f_id, montant, f_classe in frais if f_classe in (None, classe_id)]
+        total_du = sum(montant for _, montant in applicables)
+        total_paye = sum(payes.get((eleve_id, f_id), 0) for f_id, _ in applicables)
+
+        resumes.append(ResumeEnfant(
+            eleve_id, matricule, nom, prenom, classe_nom,
+            trimestre, tuple(lignes), round(points / coefficients, 2) if coefficients else None,
+            total_presences, statuts.get('absent', 0), statuts.get('retard', 0),
+            round(100.0 * presents / total_presences, 1) if total_presences else None,
+            total_du, total_paye, total_du - total_paye,
+        ))
+    return tuple(resumes)
+
+
+def resume_parent(parent_id):
+    """
+    Summary of every active child of a parent (cached)
+
+    Args:
+        parent_id (int): User id of the parent
+
+    Returns:
+        tuple: ResumeEnfant per child, ordered by first name
+    """
+    return _cache.get(int(parent_id), lambda: _calculer(parent_id))
+
+
+def _parent_demande():
+    """Parent whose dashboard is requested: oneself, or ?parent_id= for the administration"""
+    if session.get('user_role') in ['admin', 'directeur'] and request.args.get('parent_id'):
+        parent = db.session.get(User, request.args.get('parent_id', type=int))
+        if parent is None or parent.role != 'parent':
+            abort(404)
+        return parent.id
+    if session.get('user_role') != 'parent':
+        abort(403)
+    return current_user.id
+
+
+@parents_blueprint.route('/tableau-de-bord')
+@login_required
+def tableau_de_bord():
+    """Résumé des notes, présences et paiements de tous les enfants"""
+    parent_id = _parent_demande()
+    return render_template('parents/tableau_de_bord.html', enfants=resume_parent(parent_id),
+                           debut_annee=debut_annee_scolaire())
+
+
+@parents_blueprint.route('/tableau-de-bord.json')
+@login_required
+def tableau_de_bord_json():
+    """Même résumé en JSON"""
+    parent_id = _parent_demande()
+    enfants = []
+    for resume in resume_parent(parent_id):
+        data = resume._asdict()
+        data['moyennes'] = [{'cours': cours, 'moyenne': moyenne} for cours, moyenne in resume.moyennes]
+        enfants.append(data)
+    return jsonify({'parent_id': parent_id, 'debut_annee': debut_annee_scolaire().isoformat(), 'enfants': enfants})
@@ -5,6 +5,10 @@ from models import db
 from datetime import datetime, date, timedelta
 from sqlalchemy import func
 from modules.auth import admin_required
+from modules.loaders import eager
+from modules import reference_data
+from modules.jobs import job_handler, enqueue
+from modules.emploi_du_temps import cours_actuel
 
 presence_blueprint = Blueprint('presence', __name__, url_prefix='/presence')
 
@@ -13,7 +17,7 @@ presence_blueprint = Blueprint('presence', __name__, url_prefix='/presence')
 @admin_required
 def index():
     today = date.today().strftime('%Y-%m-%d')
-    classes = Classe.query.order_by(Classe.niveau, Classe.nom).all()
+    classes = reference_data.classes()
     
     # Get recent attendance records for quick access
     recent_records = (
@@ -70,6 +74,12 @@ def saisie():
                 # Delete existing records for this date and course
                 Presence.query.filter_by(date=date_presence, cours_id=cours_id).delete()
                 
+                # Validate all submitted students with a single query
+                eleves_valides = {
+                    eleve_id for (eleve_id,) in
+                    db.session.query(Eleve.id).filter(Eleve.id.in_([int(e) for e in eleves_data if str(e).isdigit()]))
+                }
+                
                 # Insert new attendance records
                 for i in range(len(eleves_data)):
                     eleve_id = eleves_data[i]
@@ -77,8 +87,7 @@ def saisie():
                     note = notes[i] if i < len(notes) else None
                     
                     # Validate student exists
-                    eleve = Eleve.query.get(eleve_id)
-                    if not eleve:
+                    if not str(eleve_id).isdigit() or int(eleve_id) not in eleves_valides:
                         continue  # Skip invalid student IDs
                         
                     # Create presence record
@@ -113,6 +122,9 @@ def saisie():
     date_presence = request.args.get('date', date.today().strftime('%Y-%m-%d'))
     classe_id = request.args.get('classe_id')
     cours_id = request.args.get('cours_id')
+    if classe_id and not cours_id and date_presence == date.today().strftime('%Y-%m-%d'):
+        # Course of the class right now, from the timetable (only meaningful for today)
+        cours_id = cours_actuel(classe_id)
 
     if not classe_id or not cours_id:
         flash('Veuillez sélectionner une classe et un cours.', 'warning')
@@ -154,12 +166,14 @@ def get_cours_by_classe():
             return jsonify([]), 400
             
         # Validate classe exists
-        classe = Classe.query.get(classe_id)
+        classe = reference_data.classe(classe_id)
         if not classe:
             return jsonify({'error': 'Classe non trouvée'}), 404
             
-        cours = db.session.query(Cours).join(Enseignement).filter(Enseignement.classe_id == classe_id).order_by(Cours.nom).all()
-        result = [{'id': c.id, 'nom': c.nom} for c in cours]
+        cours = reference_data.cours_de_classe(classe.id)
+        jour = request.args.get('date')
+        actuel = cours_actuel(classe.id) if not jour or jour == date.today().strftime('%Y-%m-%d') else None
+        result = [{'id': c.id, 'nom': c.nom, 'actuel': c.id == actuel} for c in cours]
         return jsonify(result)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -218,21 +232,30 @@ def delete_batch_presence():
             flash('Cours non trouvé.', 'danger')
             return redirect(request.referrer or url_for('presence.index'))
         
-        # Count records to be deleted
-        count = Presence.query.filter_by(date=date_obj, cours_id=cours_id).count()
-        
-        # Delete records
-        Presence.query.filter_by(date=date_obj, cours_id=cours_id).delete()
-        db.session.commit()
-        
-        flash(f'{count} présences supprimées avec succès pour le cours {cours.nom} du {date_obj.strftime("%d/%m/%Y")}.', 'success')
-        return redirect(request.referrer or url_for('presence.index'))
+        # Deletion runs as a background job (see supprimer_lot_job)
+        job = enqueue('presence.supprimer_lot', {'date_str': date_obj.isoformat(), 'cours_id': cours.id})
+        flash(f'Suppression des présences du cours {cours.nom} du {date_obj.strftime("%d/%m/%Y")} lancée.', 'info')
+        return redirect(url_for('jobs.statut', job_id=job.id, retour=url_for('presence.index')))
         
     except Exception as e:
         db.session.rollback()
         flash(f'Erreur lors de la suppression des présences: {str(e)}', 'danger')
         return redirect(request.referrer or url_for('presence.index'))
 
+@job_handler('presence.supprimer_lot')
+def supprimer_lot_job(ctx, date_str, cours_id):
+    """Tâche de fond: supprime les présences d'un cours à une date, par lots de 500"""
+    date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
+    ids = [presence_id for (presence_id,) in db.session.query(Presence.id).filter_by(date=date_obj, cours_id=cours_id)]
+    
+    # Short transactions keep the SQLite write lock free for the saisie pages
+    for start in range(0, len(ids), 500):
+        Presence.query.filter(Presence.id.in_(ids[start:start + 500])).delete(synchronize_session=False)
+        db.session.commit()
+        ctx.progress(100 * min(start + 500, len(ids)) / len(ids), f'{min(start + 500, len(ids))}/{len(ids)} présences supprimées')
+    
+    return {'supprimees': len(ids)}
+
 @presence_blueprint.route('/rapport')
 @login_required
 @admin_required
@@ -259,8 +282,8 @@ def rapport():
             # Calculate month start (first day of current month)
             month_start = date.today().replace(day=1).strftime('%Y-%m-%d')
             
-            classes = Classe.query.order_by(Classe.niveau, Classe.nom).all()
-            cours = Cours.query.order_by(Cours.nom).all()
+            classes = reference_data.classes()
+            cours = reference_data.cours()
             eleves = Eleve.query.filter_by(actif=True).order_by(Eleve.nom, Eleve.prenom).all()
             
             # Get attendance statuses for dropdown
@@ -284,7 +307,8 @@ def rapport():
         query = Presence.query\
                 .join(Eleve, Presence.eleve_id == Eleve.id)\
                 .join(Cours, Presence.cours_id == Cours.id)\
-                .join(Classe, Cours.classe_id == Classe.id)
+                .join(Classe, Eleve.classe_id == Classe.id)\
+                .options(*eager(Presence, 'eleve', 'cours'))
                 
         if eleve_id:
             query = query.filter(Presence.eleve_id == eleve_id)
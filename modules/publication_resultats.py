@@ -0,0 +1,276 @@
+"""
+Bulk publication of admission results
+
+Loads the results of a national exam (9AF, Bac) from a CSV/XLSX list, one
+row per candidate, and applies them to the ResultatAdmission requests:
+
+    rapport = publier_resultats(fichier, type_examen='Examen 9AF', publier=True)
+    rapport.mis_a_jour     # requests updated
+    rapport.non_trouves    # rows matching no request, for the reconciliation
+
+Rows are matched on cle_recherche (folded name + birth date, see
+models.cle_recherche_admission) with one IN query per TAILLE_LOT rows, and
+every matched request gets its statut (and publie) in one executemany
+UPDATE. Rows matching several requests (same person for two exams, no
+type_examen given) are reported as ambiguous and left untouched.
+
+Candidates can then be told by WhatsApp or email (their `contact` field)
+through the 'resultats_admission.notifier' background job.
+"""
+
+import logging
+from collections import namedtuple
+from email.message import EmailMessage
+from email.utils import make_msgid, formatdate
+
+from flask import current_app
+from sqlalchemy import update
+
+from models import db, ResultatAdmission, cle_recherche_admission
+from modules.import_tableur import lire_tableur, normaliser_colonne, en_date
+from modules.jobs import job_handler
+
+logger = logging.getLogger('publication_resultats')
+
+TAILLE_LOT = 500
+
+# Normalised column name -> field
+COLONNES = {
+    'nom complet': 'nom_complet',
+    'nom_complet': 'nom_complet',
+    'nom': 'nom_complet',
+    'date de naissance': 'date_naissance',
+    'date_naissance': 'date_naissance',
+    'naissance': 'date_naissance',
+    'statut': 'statut',
+    'resultat': 'statut',
+    'decision': 'statut',
+    'type examen': 'type_examen',
+    'type_examen': 'type_examen',
+    'examen': 'type_examen',
+}
+# Spreadsheet wording -> ResultatAdmission.statut
+STATUTS = {
+    'admis': 'approuve', 'admise': 'approuve', 'approuve': 'approuve', 'reussi': 'approuve', 'oui': 'approuve',
+    'non admis': 'rejete', 'non_admis': 'rejete', 'rejete': 'rejete', 'echoue': 'rejete',
+    'ajourne': 'rejete', 'non': 'rejete',
+    'en attente': 'en_attente', 'en_attente': 'en_attente',
+}
+LIBELLES_STATUT = {'approuve': 'ADMIS(E)', 'rejete': 'NON ADMIS(E)', 'en_attente': 'EN ATTENTE'}
+
+RapportPublication = namedtuple('RapportPublication', 'lignes mis_a_jour ids non_trouves ambigus erreurs')
+
+
+def _statut(valeur):
+    if valeur is None:
+        return None
+    return STATUTS.get(normaliser_colonne(valeur).replace('-', ' '))
+
+
+def lire_resultats(lignes, statut_defaut=None):
+    """
+    Validate the rows of a results list
+
+    Args:
+        lignes: (numero, {column: value}) as yielded by lire_tableur
+        statut_defaut (str, optional): Statut of the rows without a statut value
+
+    Returns:
+        tuple: (resultats, erreurs) - resultats maps cle_recherche to
+               {'ligne', 'nom_complet', 'date_naissance', 'statut', 'type_examen'}
+    """
+    resultats, erreurs = {}, []
+    for numero, ligne in lignes:
+        valeurs = {}
+        for colonne, valeur in ligne.items():
+            champ = COLONNES.get(colonne)
+            if champ and valeur is not None and champ not in valeurs:
+                valeurs[champ] = valeur
+
+        nom = str(valeurs.get('nom_complet') or '').strip()
+        if not nom:
+            erreurs.append(f"Ligne {numero}: nom complet manquant.")
+            continue
+        try:
+            date_naissance = en_date(valeurs.get('date_naissance'))
+        except ValueError as e:
+            erreurs.append(f"Ligne {numero}: {e}.")
+            continue
+        if date_naissance is None:
+            erreurs.append(f"Ligne {numero}: date de naissance manquante ({nom}).")
+            continue
+        statut = _statut(valeurs.get('statut')) if valeurs.get('statut') is not None else statut_defaut
+        if statut is None:
+            erreurs.append(f"Ligne {numero}: statut invalide ({valeurs.get('statut') or 'vide'}): admis, non admis ou en attente.")
+            continue
+
+        cle = cle_recherche_admission(nom, date_naissance)
+        if cle in resultats:
+            erreurs.append(f"Ligne {numero}: {nom} figure déjà ligne {resultats[cle]['ligne']}.")
+            continue
+        resultats[cle] = {
+            'ligne': numero, 'nom_complet': nom, 'date_naissance': date_naissance, 'statut': statut,
+            'type_examen': str(valeurs['type_examen']).strip() if valeurs.get('type_examen') else None,
+        }
+    return resultats, erreurs
+
+
+def _demandes(cles, type_examen=None):
+    """cle_recherche -> [(id, type_examen)] of the requests with these keys"""
+    demandes = {}
+    cles = list(cles)
+    for debut in range(0, len(cles), TAILLE_LOT):
+        requete = db.session.query(
+            ResultatAdmission.cle_recherche, ResultatAdmission.id, ResultatAdmission.type_examen
+        ).filter(ResultatAdmission.cle_recherche.in_(cles[debut:debut + TAILLE_LOT]))
+        if type_examen:
+            requete = requete.filter(ResultatAdmission.type_examen == type_examen)
+        for cle, demande_id, type_demande in requete:
+            demandes.setdefault(cle, []).append((demande_id, type_demande))
+    return demandes
+
+
+def publier_resultats(fichier, type_examen=None, statut_defaut=None, publier=True):
+    """
+    Apply a results list to the matching admission requests
+
+    Args:
+        fichier: CSV/XLSX upload (see lire_tableur)
+        type_examen (str, optional): Only match the requests of this exam
+        statut_defaut (str, optional): Statut of the rows without one
+        publier (bool): Also make the updated results visible on the public page
+
+    Returns:
+        RapportPublication: non_trouves and ambigus hold the row dicts of
+        lire_resultats; nothing is written when the file cannot be read
+    """
+    try:
+        colonnes, lignes = lire_tableur(fichier)
+    except Exception as e:
+        return RapportPublication(0, 0, [], [], [], [f'Fichier illisible: {str(e)}'])
+    champs = {COLONNES.get(c) for c in colonnes}
+    manquantes = [nom for nom, champ in (('nom complet', 'nom_complet'), ('date de naissance', 'date_naissance'))
+                  if champ not in champs]
+    if manquantes:
+        return RapportPublication(0, 0, [], [], [], [f"Colonne(s) obligatoire(s) absente(s): {', '.join(manquantes)}."])
+
+    resultats, erreurs = lire_resultats(lignes, statut_defaut)
+    demandes = _demandes(resultats, type_examen)
+
+    mises_a_jour, non_trouves, ambigus = [], [], []
+    for cle, resultat in resultats.items():
+        candidates = demandes.get(cle, [])
+        if resultat['type_examen']:
+            candidates = [c for c in candidates
+                          if normaliser_colonne(c[1]) == normaliser_colonne(resultat['type_examen'])]
+        if not candidates:
+            non_trouves.append(resultat)
+        elif len(candidates) > 1:
+            ambigus.append(resultat)
+        else:
+            ligne = {'id': candidates[0][0], 'statut': resultat['statut']}
+            if publier:
+                ligne['publie'] = True
+            mises_a_jour.append(ligne)
+
+    if mises_a_jour:
+        try:
+            # Bulk UPDATE by primary key: one executemany for every matched request
+            db.session.execute(update(ResultatAdmission), mises_a_jour)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return RapportPublication(len(resultats) + len(erreurs), 0, [], non_trouves, ambigus,
+                                      erreurs + [f"Erreur lors de l'enregistrement: {str(e)}"])
+
+    return RapportPublication(len(resultats) + len(erreurs), len(mises_a_jour), [l['id'] for l in mises_a_jour],
+                              non_trouves, ambigus, erreurs)
+
+
+# ==================== NOTIFICATIONS ====================
+
+def _message(resultat, site_url):
+    return (f"École Presbytérale St-Joseph - {resultat.type_examen}\n\n"
+            f"{resultat.nom_complet}: {LIBELLES_STATUT.get(resultat.statut, resultat.statut)}\n\n"
+            f"Résultat consultable sur {site_url}/admission/")
+
+
+def _envoyer_emails(destinataires, site_url, compteurs, erreurs):
+    from modules.newsletter import PoolSMTP, smtp_factory_depuis_config
+
+    config = current_app.config
+    expediteur = config.get('MAIL_DEFAULT_SENDER')
+    # Built here: construire() runs in the pool's threads, outside the app context and the session
+    messages = {r.id: (r.contact.strip(), f"Résultat {r.type_examen} - {r.nom_complet}", _message(r, site_url))
+                for r in destinataires}
+
+    def construire(resultat_id, email):
+        _, sujet, texte = messages[resultat_id]
+        msg = EmailMessage()
+        msg['Subject'] = sujet
+        msg['From'] = expediteur
+        msg['To'] = email
+        msg['Date'] = formatdate(localtime=True)
+        msg['Message-ID'] = make_msgid()
+        msg.set_content(texte)
+        return msg
+
+    def rapporter(resultats):
+        for resultat_id, statut, erreur in resultats:
+            if statut == 'envoye':
+                compteurs['emails'] += 1
+            else:
+                compteurs['echecs'] += 1
+                erreurs[messages[resultat_id][0]] = erreur
+
+    pool = PoolSMTP(
+        smtp_factory_depuis_config(config),
+        connexions=config.get('NEWSLETTER_SMTP_CONNEXIONS', 3),
+        debit=config.get('NEWSLETTER_DEBIT', 10),
+        messages_par_connexion=config.get('NEWSLETTER_MESSAGES_PAR_CONNEXION', 100),
+    )
+    pool.envoyer(((resultat_id, email) for resultat_id, (email, _, _) in messages.items()), construire, rapporter)
+
+
+def notifier_resultats(ids, ctx=None):
+    """
+    Send each candidate its result on its contact (email if it contains '@', WhatsApp otherwise)
+
+    Returns:
+        dict: Counters (emails, whatsapp, echecs, non_configure) and per-contact errors
+    """
+    from modules.whatsapp_notifications import whatsapp_notifier
+
+    site_url = (current_app.config.get('SITE_URL') or '').rstrip('/')
+    resultats = ResultatAdmission.query.filter(ResultatAdmission.id.in_(ids)).all() if ids else []
+    emails = [r for r in resultats if r.contact and '@' in r.contact]
+    telephones = [r for r in resultats if r.contact and '@' not in r.contact]
+    compteurs = {'emails': 0, 'whatsapp': 0, 'echecs': 0, 'non_configure': 0}
+    erreurs = {}
+
+    if emails:
+        _envoyer_emails(emails, site_url, compteurs, erreurs)
+    if ctx is not None:
+        ctx.progress(50, f"{compteurs['emails']} email(s) envoyé(s)")
+
+    if telephones and not whatsapp_notifier.is_configured():
+        compteurs['non_configure'] = len(telephones)
+        telephones = []
+    for i, resultat in enumerate(telephones, 1):
+        envoi = whatsapp_notifier.send_message(resultat.contact, _message(resultat, site_url))
+        if envoi.get('success'):
+            compteurs['whatsapp'] += 1
+        else:
+            compteurs['echecs'] += 1
+            erreurs[resultat.contact] = envoi.get('error')
+        if ctx is not None and i % 20 == 0:
+            ctx.progress(50 + 50 * i / len(telephones), f"{i}/{len(telephones)} message(s) WhatsApp")
+
+    logger.info(f"Notification de {len(resultats)} résultat(s): {compteurs}")
+    return dict(compteurs, erreurs=erreurs)
+
+
+@job_handler('resultats_admission.notifier', max_tentatives=1)
+def notifier_resultats_job(ctx, ids):
+    """Tâche de fond: envoie leur résultat aux candidats (une seule tentative: pas de double envoi)"""
+    return notifier_resultats(ids, ctx=ctx)
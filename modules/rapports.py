@@ -3,6 +3,15 @@ from flask_login import login_required
 from models import *
 from models import db
 from datetime import datetime, date, timedelta
+import os
+import shutil
+import tempfile
+import zipfile
+from modules import reference_data
+from modules.jobs import job_handler, enqueue
+from modules.archivage_annuel import bornes, annee_scolaire_de
+from modules import export_analytique
+from openpyxl import Workbook
 
 
 rapports_blueprint = Blueprint('rapports', __name__, url_prefix='/rapports')
@@ -18,7 +27,8 @@ def index():
         flash('Accès non autorisé.', 'danger')
         return redirect(url_for('accueil'))
     
-    return render_template('rapports/index.html')
+    return render_template('rapports/index.html', annee_courante=annee_scolaire_de(),
+                           formats=export_analytique.formats_disponibles(), format_defaut=export_analytique.format_par_defaut())
 
 @rapports_blueprint.route('/statistiques')
 @login_required
@@ -180,14 +190,7 @@ def presence():
     date_fin = request.args.get('date_fin', date.today().strftime('%Y-%m-%d'))
     
     if not classe_id:
-        conn = get_db_connection()
-        try:
-            with conn.cursor() as cursor:
-                # Get all classes
-                cursor.execute("SELECT id, nom FROM classes ORDER BY niveau, nom")
-                classes = cursor.fetchall()
-        finally:
-            conn.close()
+        classes = reference_data.classes()
         
         return render_template('rapports/presence_form.html',
                               classes=classes,
@@ -342,3 +345,111 @@ def financier():
                           resume_par_classe=resume_par_classe,
                           resume_par_mois=resume_par_mois,
                           total=total)
+
+@rapports_blueprint.route('/financier/export')
+@login_required
+def financier_export():
+    if not is_admin_or_directeur():
+        flash('Accès non autorisé.', 'danger')
+        return redirect(url_for('accueil'))
+    
+    date_debut = request.args.get('date_debut', (date.today().replace(month=1, day=1)).strftime('%Y-%m-%d'))
+    date_fin = request.args.get('date_fin', date.today().strftime('%Y-%m-%d'))
+    try:
+        datetime.strptime(date_debut, '%Y-%m-%d')
+        datetime.strptime(date_fin, '%Y-%m-%d')
+    except ValueError:
+        flash('Format de date invalide.', 'danger')
+        return redirect(url_for('rapports.index'))
+    
+    job = enqueue('rapports.financier_excel', {
+        'date_debut': date_debut,
+        'date_fin': date_fin,
+        'type_frais': request.args.get('type_frais') or None,
+    })
+    return redirect(url_for('jobs.statut', job_id=job.id, retour=url_for('rapports.index')))
+
+@job_handler('rapports.financier_excel')
+def financier_excel_job(ctx, date_debut, date_fin, type_frais=None):
+    """Tâche de fond: rapport financier (détail des paiements et résumés) au format Excel"""
+    debut = datetime.strptime(date_debut, '%Y-%m-%d').date()
+    fin = datetime.strptime(date_fin, '%Y-%m-%d').date()
+    
+    query = db.session.query(
+        Paiement.date, Eleve.matricule, Eleve.nom, Eleve.prenom, Classe.nom,
+        Frais.type, Paiement.montant, Paiement.methode, Paiement.reference
+    ).join(Eleve, Paiement.eleve_id == Eleve.id) \
+     .join(Frais, Paiement.frais_id == Frais.id) \
+     .outerjoin(Classe, Eleve.classe_id == Classe.id) \
+     .filter(Paiement.date.between(debut, fin))
+    if type_frais:
+        query = query.filter(Frais.type == type_frais)
+    total_lignes = query.count()
+    
+    # write_only keeps memory flat whatever the number of payments
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Paiements')
+    ws.append(['Date', 'Matricule', 'Nom', 'Prénom', 'Classe', 'Type de frais', 'Montant', 'Méthode', 'Référence'])
+    
+    par_type, par_classe, par_mois = {}, {}, {}
+    total = 0
+    for i, (jour, matricule, nom, prenom, classe_nom, frais_type, montant, methode, reference) in \
+            enumerate(query.order_by(Paiement.date, Paiement.id).yield_per(1000), 1):
+        ws.append([jour, matricule, nom, prenom, classe_nom, frais_type, montant, methode, reference])
+        total += montant
+        par_type[frais_type] = par_type.get(frais_type, 0) + montant
+        par_classe[classe_nom or 'Sans classe'] = par_classe.get(classe_nom or 'Sans classe', 0) + montant
+        mois = jour.strftime('%Y-%m')
+        par_mois[mois] = par_mois.get(mois, 0) + montant
+        if i % 1000 == 0:
+            ctx.progress(90 * i / total_lignes, f'{i}/{total_lignes} paiements')
+    
+    resume = wb.create_sheet('Résumé')
+    resume.append(['Période', f'{debut.strftime("%d/%m/%Y")} - {fin.strftime("%d/%m/%Y")}'])
+    resume.append(['Total', total])
+    for titre, valeurs in (('Par type de frais', par_type), ('Par classe', par_classe), ('Par mois', par_mois)):
+        resume.append([])
+        resume.append([titre])
+        for cle in sorted(valeurs):
+            resume.append([cle, valeurs[cle]])
+    
+    ctx.progress(95, 'Enregistrement du fichier')
+    wb.save(ctx.artifact_path(f'rapport_financier_{date_debut}_{date_fin}.xlsx'))
+    return {'paiements': total_lignes, 'total': total}
+
+@rapports_blueprint.route('/annee/export')
+@login_required
+def annee_export():
+    if not is_admin_or_directeur():
+        flash('Accès non autorisé.', 'danger')
+        return redirect(url_for('accueil'))
+    
+    annee = request.args.get('annee', '').strip()
+    format_ = request.args.get('format') or export_analytique.format_par_defaut()
+    try:
+        bornes(annee)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('rapports.index'))
+    if format_ not in export_analytique.formats_disponibles():
+        flash('Format non disponible.', 'danger')
+        return redirect(url_for('rapports.index'))
+    
+    job = enqueue('rapports.export_annee', {'annee': annee, 'format': format_})
+    return redirect(url_for('jobs.statut', job_id=job.id, retour=url_for('rapports.index')))
+
+@job_handler('rapports.export_annee')
+def export_annee_job(ctx, annee, format=None):
+    """Tâche de fond: export analytique d'une année scolaire (fichiers compressés + manifeste) dans un ZIP"""
+    dossier = tempfile.mkdtemp(prefix='export-')
+    try:
+        manifest = export_analytique.exporter_annee(
+            annee, dossier, format, progress=lambda p, message: ctx.progress(0.95 * p, message)
+        )
+        # The files are already compressed: stored as is
+        with zipfile.ZipFile(ctx.artifact_path(f'export_{annee}.zip'), 'w', zipfile.ZIP_STORED) as archive:
+            for nom in [f['fichier'] for f in manifest['fichiers']] + [export_analytique.MANIFEST_NAME]:
+                archive.write(os.path.join(dossier, nom), nom)
+    finally:
+        shutil.rmtree(dossier, ignore_errors=True)
+    return {f['table']: f['lignes'] for f in manifest['fichiers']}
@@ -0,0 +1,314 @@
+"""
+Rate limiting of the public forms
+
+Each POST to a limited endpoint takes one token from two buckets: one for
+the client IP on that endpoint, one for the endpoint as a whole (protects
+the database writer and static/uploads against a distributed burst). The
+check runs in before_request, before the request body is read or parsed;
+an empty bucket answers 429 with a Retry-After header.
+
+Buckets and counters live either in process memory ('memory') or in a
+small SQLite file in CACHE_DIR shared by every worker of the host
+('shared', the default). The shared store is a separate file from the
+application database, so it never competes with its writer.
+
+Limits are configured per endpoint in RATE_LIMITS:
+
+    RATE_LIMITS = {'contact': ('5/hour', '120/hour'), ...}
+                                 per IP    all clients
+
+Counters (accepted / rejected requests per endpoint) are available with
+`flask ratelimit stats` and as JSON at /admin/monitoring/rate-limit.
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+import click
+from flask import current_app, request, jsonify, render_template
+from flask.cli import AppGroup
+
+from modules.cache import cache_dir
+
+logger = logging.getLogger('rate_limit')
+
+UNITES = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+STORE_FILE = 'rate_limit.sqlite'
+# Stale buckets are dropped every PURGE_EVERY requests (shared) / above that many keys (memory)
+PURGE_EVERY = 1000
+# Endpoints answered in JSON (called from JavaScript)
+JSON_ENDPOINTS = ('newsletter_subscribe',)
+
+
+def parse_limit(limite):
+    """
+    '5/hour' -> (5, 3600.0); '20/10 minutes' -> (20, 600.0); '10/90' -> (10, 90.0); None -> None
+
+    Raises:
+        ValueError: Malformed limit
+    """
+    if limite is None:
+        return None
+    if isinstance(limite, (tuple, list)):
+        return int(limite[0]), float(limite[1])
+    nombre, _, periode = str(limite).partition('/')
+    parties = periode.lower().split() or ['second']
+    if len(parties) == 1 and parties[0].rstrip('s') not in UNITES:
+        secondes = float(parties[0])
+    else:
+        multiple = float(parties[0]) if len(parties) == 2 else 1
+        unite = parties[-1].rstrip('s')
+        if unite not in UNITES or len(parties) > 2:
+            raise ValueError(f"Invalid rate limit: {limite}")
+        secondes = multiple * UNITES[unite]
+    if int(nombre) <= 0 or secondes <= 0:
+        raise ValueError(f"Invalid rate limit: {limite}")
+    return int(nombre), float(secondes)
+
+
+def _refill(tokens, updated, capacite, periode, now):
+    return min(float(capacite), tokens + (now - updated) * capacite / periode)
+
+
+# ==================== STORES ====================
+
+class MemoryStore:
+    """Buckets in process memory (each worker enforces the limits on its own)"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._compteurs = {}
+        self._lock = threading.Lock()
+
+    def take(self, endpoint, buckets, now):
+        """
+        Take one token from every bucket, or none if one of them is empty
+
+        Args:
+            endpoint (str): Counted endpoint
+            buckets (list): (key, capacite, periode) tuples
+            now (float): time.time()
+
+        Returns:
+            float: 0 if allowed, else the seconds before a token is available
+        """
+        with self._lock:
+            etats = []
+            attente = 0.0
+            for key, capacite, periode in buckets:
+                tokens, updated = self._buckets.get(key, (float(capacite), now))
+                tokens = _refill(tokens, updated, capacite, periode, now)
+                etats.append((key, tokens))
+                if tokens < 1:
+                    attente = max(attente, (1 - tokens) * periode / capacite)
+            if not attente:
+                for key, tokens in etats:
+                    self._buckets[key] = (tokens - 1, now)
+            compteur = self._compteurs.setdefault(endpoint, [0, 0])
+            compteur[1 if attente else 0] += 1
+            if len(self._buckets) > PURGE_EVERY:
+                # Buckets untouched for a day are full again: forgetting them changes nothing
+                self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < 86400}
+            return attente
+
+    def stats(self):
+        with self._lock:
+            return {endpoint: {'acceptes': a, 'refuses': r} for endpoint, (a, r) in self._compteurs.items()}
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+            self._compteurs.clear()
+
+
+class SharedStore:
+    """
+    Buckets in a SQLite file shared by the worker processes of the host
+
+    Args:
+        path (str): Database file
+    """
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._appels = 0
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('CREATE TABLE IF NOT EXISTS buckets '
+                         '(cle TEXT PRIMARY KEY, tokens REAL NOT NULL, maj REAL NOT NULL, plein REAL NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS compteurs '
+                         '(endpoint TEXT PRIMARY KEY, acceptes INTEGER NOT NULL, refuses INTEGER NOT NULL)')
+            self._local.conn = conn
+        return conn
+
+    def take(self, endpoint, buckets, now):
+        """See MemoryStore.take"""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            etats = []
+            attente = 0.0
+            for key, capacite, periode in buckets:
+                row = conn.execute('SELECT tokens, maj FROM buckets WHERE cle = ?', (key,)).fetchone()
+                tokens = _refill(row[0], row[1], capacite, periode, now) if row else float(capacite)
+                etats.append((key, tokens, capacite, periode))
+                if tokens < 1:
+                    attente = max(attente, (1 - tokens) * periode / capacite)
+            if not attente:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO buckets (cle, tokens, maj, plein) VALUES (?, ?, ?, ?)',
+                    [(key, tokens - 1, now, now + (capacite - tokens + 1) * periode / capacite)
+                     for key, tokens, capacite, periode in etats])
+            acceptes, refuses = (0, 1) if attente else (1, 0)
+            conn.execute('INSERT INTO compteurs (endpoint, acceptes, refuses) VALUES (?, ?, ?) '
+                         'ON CONFLICT(endpoint) DO UPDATE SET acceptes = acceptes + excluded.acceptes, '
+                         'refuses = refuses + excluded.refuses', (endpoint, acceptes, refuses))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._appels += 1
+        if self._appels % PURGE_EVERY == 0:
+            self.purge(now)
+        return attente
+
+    def purge(self, now=None):
+        """Delete buckets that are full again (same as absent)"""
+        conn = self._conn()
+        return conn.execute('DELETE FROM buckets WHERE plein <= ?', (now or time.time(),)).rowcount
+
+    def stats(self):
+        rows = self._conn().execute('SELECT endpoint, acceptes, refuses FROM compteurs ORDER BY endpoint')
+        return {endpoint: {'acceptes': a, 'refuses': r} for endpoint, a, r in rows}
+
+    def reset(self):
+        conn = self._conn()
+        conn.execute('DELETE FROM buckets')
+        conn.execute('DELETE FROM compteurs')
+
+
+# ==================== LIMITER ====================
+
+class RateLimiter:
+    """
+    Token buckets for the endpoints listed in RATE_LIMITS
+
+    Args:
+        app (Flask): The application
+    """
+    def __init__(self, app):
+        config = app.config
+        self.enabled = config.get('RATE_LIMIT_ENABLED', True)
+        self.limits = {}
+        for endpoint, (par_ip, total) in (config.get('RATE_LIMITS') or {}).items():
+            self.limits[endpoint] = (parse_limit(par_ip), parse_limit(total))
+        self._store = None
+        self._storage = config.get('RATE_LIMIT_STORAGE', 'shared')
+        self._app = app
+
+    @property
+    def store(self):
+        if self._store is None:
+            if self._storage == 'memory':
+                self._store = MemoryStore()
+            else:
+                with self._app.app_context():
+                    self._store = SharedStore(os.path.join(cache_dir(), STORE_FILE))
+        return self._store
+
+    def check(self, endpoint, client):
+        """
+        Take a token for one request
+
+        Returns:
+            float: 0 if the request may proceed, else the Retry-After delay in seconds
+        """
+        par_ip, total = self.limits[endpoint]
+        buckets = []
+        if par_ip:
+            buckets.append((f'{endpoint}|{client}', *par_ip))
+        if total:
+            buckets.append((endpoint, *total))
+        try:
+            return self.store.take(endpoint, buckets, time.time())
+        except sqlite3.Error as e:
+            # A locked or broken store must not take the public forms down
+            logger.warning(f"Rate limit store unavailable, request allowed: {str(e)}")
+            return 0
+
+
+def _client_ip():
+    # Behind a reverse proxy, wrap app.wsgi_app in werkzeug's ProxyFix so this is the client address
+    return request.remote_addr or 'inconnu'
+
+
+def _trop_de_requetes(attente):
+    retry_after = max(1, int(attente + 0.999))
+    message = 'Trop de demandes envoyées. Veuillez réessayer dans quelques minutes.'
+    if request.endpoint in JSON_ENDPOINTS or request.accept_mimetypes.best == 'application/json':
+        response = jsonify({'success': False, 'message': message})
+    else:
+        response = current_app.make_response(render_template('erreurs/429.html', message=message))
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def init_rate_limit(app):
+    """
+    Install the rate limiting hook and the `flask ratelimit` commands
+
+    Args:
+        app (Flask): The application
+    """
+    limiter = RateLimiter(app)
+    app.extensions['rate_limit'] = limiter
+
+    @app.before_request
+    def limiter_requetes():
+        # Only the public writes are limited; request.form is not touched here
+        if not limiter.enabled or request.method != 'POST' or request.endpoint not in limiter.limits:
+            return None
+        attente = limiter.check(request.endpoint, _client_ip())
+        if attente:
+            logger.info(f"429 {request.endpoint} {_client_ip()} (retry in {attente:.0f}s)")
+            return _trop_de_requetes(attente)
+        return None
+
+    app.cli.add_command(ratelimit_cli)
+    return limiter
+
+
+def stats():
+    """Accepted / rejected requests per limited endpoint since the last reset"""
+    return current_app.extensions['rate_limit'].store.stats()
+
+
+# ==================== CLI ====================
+
+ratelimit_cli = AppGroup('ratelimit', help='Limitation du débit des formulaires publics')
+
+
+@ratelimit_cli.command('stats')
+def stats_command():
+    """Affiche les requêtes acceptées et refusées par formulaire"""
+    limiter = current_app.extensions['rate_limit']
+    compteurs = limiter.store.stats()
+    for endpoint in sorted(limiter.limits):
+        c = compteurs.get(endpoint, {'acceptes': 0, 'refuses': 0})
+        click.echo(f"{endpoint:35} {c['acceptes']:>8} acceptée(s) {c['refuses']:>8} refusée(s)")
+
+
+@ratelimit_cli.command('reset')
+def reset_command():
+    """Vide les compteurs et les buckets"""
+    current_app.extensions['rate_limit'].store.reset()
+    click.echo('Compteurs remis à zéro')
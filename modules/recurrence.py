@@ -0,0 +1,125 @@
+"""
+Recurring events
+
+An Evenement with a `recurrence` ('hebdomadaire' or 'mensuelle') is a rule,
+in the spirit of an iCalendar RRULE: every `intervalle` weeks or months
+from `date`, until `recurrence_jusqu_au` or for `recurrence_nombre`
+occurrences, minus the dates listed in `recurrence_exceptions`. A rule with
+neither bound stops at the end of its school year (August 31st).
+
+Occurrences are never stored: date_fin (last possible occurrence, equal to
+`date` for a single event) is computed on save, so the calendar selects the
+rules overlapping the visible window with the (date_fin, date) index and
+expands them for that window only:
+
+    for jour in dates_occurrences(evenement, debut, fin):
+        ...
+
+Monthly rules keep the day of the month; months without that day (the 31st
+in April) are skipped, as RRULE does.
+"""
+
+from datetime import date, timedelta
+
+FREQUENCES = {'hebdomadaire': 'Toutes les semaines', 'mensuelle': 'Tous les mois'}
+# Upper bound of a rule given as a number of occurrences
+MAX_OCCURRENCES = 500
+# Bounds of a rule entered in the calendar form
+MAX_INTERVALLE = 52
+MAX_DUREE = timedelta(days=2 * 366)
+
+
+def lire_exceptions(texte):
+    """'2025-12-25,2026-01-01' -> {date, date} (invalid items are ignored)"""
+    exceptions = set()
+    for element in (texte or '').replace(';', ',').split(','):
+        try:
+            exceptions.add(date.fromisoformat(element.strip()))
+        except ValueError:
+            continue
+    return exceptions
+
+
+def ecrire_exceptions(dates):
+    return ','.join(sorted(d.isoformat() for d in dates)) or None
+
+
+def fin_annee_scolaire(jour):
+    """August 31st closing the school year of jour"""
+    return date(jour.year + 1 if jour.month >= 9 else jour.year, 8, 31)
+
+
+def _ajouter_mois(jour, mois):
+    """jour + mois months, or None when that month has no such day"""
+    total = jour.month - 1 + mois
+    try:
+        return jour.replace(year=jour.year + total // 12, month=total % 12 + 1)
+    except ValueError:
+        return None
+
+
+def _nieme(debut, frequence, intervalle, k):
+    if frequence == 'hebdomadaire':
+        return debut + timedelta(weeks=k * intervalle)
+    return _ajouter_mois(debut, k * intervalle)
+
+
+def derniere_occurrence(debut, frequence=None, intervalle=1, jusqu_au=None, nombre=None):
+    """
+    Last date a rule can produce (debut for a single event)
+
+    Exceptions are not taken into account: as in RRULE, they remove
+    occurrences without extending the series.
+    """
+    if not frequence or debut is None:
+        return debut
+    intervalle = max(1, intervalle or 1)
+    if nombre:
+        derniere, trouvees, k = debut, 0, 0
+        while trouvees < min(nombre, MAX_OCCURRENCES):
+            jour = _nieme(debut, frequence, intervalle, k)
+            k += 1
+            if jour is None:
+                continue
+            if jusqu_au and jour > jusqu_au:
+                break
+            derniere, trouvees = jour, trouvees + 1
+        return derniere
+    return jusqu_au or fin_annee_scolaire(debut)
+
+
+def dates_occurrences(evenement, debut, fin):
+    """
+    Dates of an event between debut and fin (inclusive)
+
+    Only the occurrences of the window are computed, whatever the length
+    of the series.
+    """
+    premier = evenement.date
+    dernier = evenement.date_fin or derniere_occurrence(
+        premier, evenement.recurrence, evenement.intervalle,
+        evenement.recurrence_jusqu_au, evenement.recurrence_nombre)
+    if premier is None or premier > fin or dernier < debut:
+        return []
+    if not evenement.recurrence:
+        return [premier]
+
+    intervalle = max(1, evenement.intervalle or 1)
+    limite = min(fin, dernier)
+    exceptions = lire_exceptions(evenement.recurrence_exceptions)
+    # First index that can fall in the window
+    if evenement.recurrence == 'hebdomadaire':
+        k = max(0, -(-(debut - premier).days // (7 * intervalle)))
+    else:
+        k = max(0, ((debut.year - premier.year) * 12 + debut.month - premier.month) // intervalle)
+
+    dates = []
+    while True:
+        jour = _nieme(premier, evenement.recurrence, intervalle, k)
+        k += 1
+        if jour is None:
+            continue
+        if jour > limite:
+            return dates
+        if jour >= debut and jour not in exceptions:
+            dates.append(jour)
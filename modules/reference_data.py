@@ -0,0 +1,136 @@
+"""
+Reference data cache
+
+Classes, courses, teaching assignments, teachers and fee types are read by
+almost every form but change a few times a year. They are loaded here as
+immutable snapshots (tuples of namedtuples) and shared by all requests of a
+worker. Any commit touching Classe, Cours, Enseignement, User or Frais bumps
+the 'reference' version so every worker reloads on its next access.
+
+Usage:
+    from modules import reference_data
+    classes = reference_data.classes()
+"""
+
+from collections import namedtuple
+from types import MappingProxyType
+
+from models import db, Classe, Cours, Enseignement, User, Frais
+from modules.cache import VersionCounter, VersionedCache, on_commit
+
+ClasseRef = namedtuple('ClasseRef', 'id nom niveau annee_scolaire capacite salle')
+CoursRef = namedtuple('CoursRef', 'id code nom coefficient')
+EnseignementRef = namedtuple('EnseignementRef', 'id cours_id classe_id professeur_id annee_scolaire')
+ProfesseurRef = namedtuple('ProfesseurRef', 'id nom prenom email')
+
+Snapshot = namedtuple('Snapshot', [
+    'classes',            # tuple of ClasseRef ordered by niveau, nom
+    'classes_par_id',     # {id: ClasseRef}
+    'cours',              # tuple of CoursRef ordered by nom
+    'cours_par_id',       # {id: CoursRef}
+    'cours_par_classe',   # {classe_id: tuple of CoursRef ordered by nom}
+    'enseignements',      # tuple of EnseignementRef
+    'professeurs',        # tuple of ProfesseurRef ordered by nom, prenom
+    'types_frais',        # tuple of distinct Frais.type, sorted
+])
+
+reference_version = VersionCounter('reference')
+_cache = VersionedCache(reference_version)
+
+
+@on_commit(Classe, Cours, Enseignement, User, Frais)
+def _invalidate(changes):
+    reference_version.bump()
+
+
+def _load():
+    classes = tuple(
+        ClasseRef(*row) for row in db.session.query(
+            Classe.id, Classe.nom, Classe.niveau, Classe.annee_scolaire, Classe.capacite, Classe.salle
+        ).order_by(Classe.niveau, Classe.nom)
+    )
+    cours = tuple(
+        CoursRef(*row) for row in db.session.query(
+            Cours.id, Cours.code, Cours.nom, Cours.coefficient
+        ).order_by(Cours.nom)
+    )
+    enseignements = tuple(
+        EnseignementRef(*row) for row in db.session.query(
+            Enseignement.id, Enseignement.cours_id, Enseignement.classe_id,
+            Enseignement.professeur_id, Enseignement.annee_scolaire
+        )
+    )
+    professeurs = tuple(
+        ProfesseurRef(*row) for row in db.session.query(
+            User.id, User.nom, User.prenom, User.email
+        ).filter(User.role == 'professeur').order_by(User.nom, User.prenom)
+    )
+    types_frais = tuple(
+        t for (t,) in db.session.query(Frais.type).distinct().order_by(Frais.type) if t
+    )
+
+    cours_par_id = {c.id: c for c in cours}
+    cours_ids_par_classe = {}
+    for ens in enseignements:
+        cours_ids_par_classe.setdefault(ens.classe_id, set()).add(ens.cours_id)
+    cours_par_classe = {
+        classe_id: tuple(sorted((cours_par_id[i] for i in ids if i in cours_par_id), key=lambda c: c.nom))
+        for classe_id, ids in cours_ids_par_classe.items()
+    }
+
+    return Snapshot(
+        classes=classes,
+        classes_par_id=MappingProxyType({c.id: c for c in classes}),
+        cours=cours,
+        cours_par_id=MappingProxyType(cours_par_id),
+        cours_par_classe=MappingProxyType(cours_par_classe),
+        enseignements=enseignements,
+        professeurs=professeurs,
+        types_frais=types_frais,
+    )
+
+
+def snapshot():
+    """Return the current Snapshot, reloading it if the version moved"""
+    return _cache.get('snapshot', _load)
+
+
+def classes():
+    """All classes ordered by niveau, nom"""
+    return snapshot().classes
+
+
+def classe(classe_id):
+    """ClasseRef for an id (int or str), or None"""
+    try:
+        return snapshot().classes_par_id.get(int(classe_id))
+    except (TypeError, ValueError):
+        return None
+
+
+def cours():
+    """All courses ordered by nom"""
+    return snapshot().cours
+
+
+def cours_de_classe(classe_id):
+    """Courses taught in a class (via Enseignement), ordered by nom"""
+    try:
+        return snapshot().cours_par_classe.get(int(classe_id), ())
+    except (TypeError, ValueError):
+        return ()
+
+
+def enseignements():
+    """All Enseignement mappings"""
+    return snapshot().enseignements
+
+
+def professeurs():
+    """Users with role 'professeur' ordered by nom, prenom"""
+    return snapshot().professeurs
+
+
+def types_frais():
+    """Distinct fee types, sorted"""
+    return snapshot().types_frais
@@ -0,0 +1,166 @@
+"""
+Rendering of Article and Annonce content
+
+Contents are written as plain text, Markdown or limited HTML. They are
+rendered once, when the row is saved (listeners in models.py), into:
+
+- contenu_html: sanitised HTML, shown as is by the pages
+- extrait: plain-text excerpt for the list pages
+- temps_lecture: reading time in minutes
+- contenu_hash: SHA-256 of the source, so saves that do not change the
+  text (view counters, flags) do not render it again
+
+    rendu = rendre_contenu(texte)
+    rendu.html, rendu.extrait, rendu.temps_lecture, rendu.empreinte
+
+Markdown is converted when the `markdown` package is installed; otherwise
+blank lines separate paragraphs and newlines become <br>, as the nl2br
+filter did. Either way the result goes through an allow-list sanitiser:
+unknown tags are dropped (script and style with their content), only a
+few attributes are kept and links must be http(s), mailto, tel or
+site-relative.
+"""
+
+import re
+import hashlib
+from collections import namedtuple
+from html import escape
+from html.parser import HTMLParser
+
+try:
+    import markdown
+except ImportError:  # optional: paragraphs and line breaks only
+    markdown = None
+
+LONGUEUR_EXTRAIT = 200
+MOTS_PAR_MINUTE = 200
+
+BALISES = {
+    'p', 'br', 'strong', 'b', 'em', 'i', 'u', 's', 'a', 'ul', 'ol', 'li', 'h2', 'h3', 'h4', 'h5',
+    'blockquote', 'code', 'pre', 'hr', 'img', 'table', 'thead', 'tbody', 'tr', 'th', 'td', 'span',
+}
+BALISES_VIDES = {'br', 'hr', 'img'}
+# Dropped together with their content
+BALISES_EXCLUES = {'script', 'style', 'iframe', 'object', 'embed', 'template', 'noscript'}
+ATTRIBUTS = {'a': {'href', 'title'}, 'img': {'src', 'alt', 'title', 'width', 'height'},
+             'th': {'colspan', 'rowspan'}, 'td': {'colspan', 'rowspan'}}
+ATTRIBUTS_URL = {'href', 'src'}
+SCHEMAS_URL = re.compile(r'^(https?:|mailto:|tel:|/(?!/)|#)', re.IGNORECASE)
+FERMETURE_IMPLICITE = {'p', 'li', 'tr', 'td', 'th'}
+BLOCS = {'p', 'ul', 'ol', 'li', 'h2', 'h3', 'h4', 'h5', 'blockquote', 'pre', 'hr', 'table', 'tr', 'br'}
+DEBUT_BLOC = re.compile(r'^\s*<(p|ul|ol|h[1-6]|blockquote|pre|table|div|hr)\b', re.IGNORECASE)
+
+RenduContenu = namedtuple('RenduContenu', 'html extrait temps_lecture empreinte')
+
+
+def empreinte_contenu(texte):
+    return hashlib.sha256((texte or '').encode('utf-8')).hexdigest()
+
+
+class _Assainisseur(HTMLParser):
+    """Allow-list sanitiser; also collects the plain text for the excerpt"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.sortie = []
+        self.texte = []
+        self.ouvertes = []
+        self.exclusion = 0
+
+    def handle_starttag(self, balise, attributs):
+        if balise in BALISES_EXCLUES:
+            self.exclusion += 1
+            return
+        if self.exclusion or balise not in BALISES:
+            return
+        if balise in BLOCS:
+            self.texte.append(' ')
+        if balise in FERMETURE_IMPLICITE and self.ouvertes and self.ouvertes[-1] == balise:
+            self.handle_endtag(balise)  # <li>a<li>b: the first item ends where the second starts
+        gardes = []
+        for nom, valeur in attributs:
+            if nom not in ATTRIBUTS.get(balise, ()) or valeur is None:
+                continue
+            if nom in ATTRIBUTS_URL and not SCHEMAS_URL.match(valeur.strip()):
+                continue
+            gardes.append(f' {nom}="{escape(valeur.strip(), quote=True)}"')
+        if balise == 'a':
+            gardes.append(' rel="nofollow noopener"')
+        self.sortie.append(f"<{balise}{''.join(gardes)}>")
+        if balise not in BALISES_VIDES:
+            self.ouvertes.append(balise)
+
+    def handle_startendtag(self, balise, attributs):
+        self.handle_starttag(balise, attributs)
+        if balise not in BALISES_VIDES and self.ouvertes and self.ouvertes[-1] == balise:
+            self.handle_endtag(balise)
+
+    def handle_endtag(self, balise):
+        if balise in BALISES_EXCLUES:
+            self.exclusion = max(0, self.exclusion - 1)
+            return
+        if self.exclusion or balise not in self.ouvertes:
+            return
+        # Close what was left open inside, so the output stays well nested
+        while self.ouvertes:
+            ouverte = self.ouvertes.pop()
+            self.sortie.append(f'</{ouverte}>')
+            if ouverte == balise:
+                break
+        if balise in BLOCS:
+            self.texte.append(' ')
+
+    def handle_data(self, donnees):
+        if not self.exclusion:
+            self.sortie.append(escape(donnees, quote=False))
+            self.texte.append(donnees)
+
+    def resultat(self):
+        self.close()
+        while self.ouvertes:
+            self.sortie.append(f'</{self.ouvertes.pop()}>')
+        return ''.join(self.sortie), ' '.join(''.join(self.texte).split())
+
+
+def assainir(html):
+    """(sanitised HTML, plain text) of an HTML fragment"""
+    assainisseur = _Assainisseur()
+    assainisseur.feed(html or '')
+    return assainisseur.resultat()
+
+
+def _paragraphes(texte):
+    """Blank lines -> paragraphs, newlines -> <br>; blocks already in HTML are kept as they are"""
+    blocs = []
+    for bloc in re.split(r'\n\s*\n', texte.replace('\r\n', '\n').strip()):
+        if DEBUT_BLOC.match(bloc):
+            blocs.append(bloc)
+        elif bloc.strip():
+            blocs.append('<p>' + bloc.strip().replace('\n', '<br>\n') + '</p>')
+    return '\n'.join(blocs)
+
+
+def extrait_de(texte, longueur=LONGUEUR_EXTRAIT):
+    """First `longueur` characters of a plain text, cut on a word"""
+    if len(texte) <= longueur:
+        return texte
+    coupe = texte[:longueur].rsplit(' ', 1)[0].rstrip(' ,;:.!?')
+    return coupe + '…'
+
+
+def rendre_contenu(texte):
+    """
+    Render a content once
+
+    Returns:
+        RenduContenu: html (sanitised), extrait (plain text), temps_lecture
+                      (minutes, at least 1) and empreinte (hash of texte)
+    """
+    texte = texte or ''
+    if markdown is not None:
+        source = markdown.markdown(texte, extensions=['nl2br', 'sane_lists'])
+    else:
+        source = _paragraphes(texte)
+    html, brut = assainir(source)
+    mots = len(brut.split())
+    return RenduContenu(html, extrait_de(brut), max(1, round(mots / MOTS_PAR_MINUTE)), empreinte_contenu(texte))
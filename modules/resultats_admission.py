@@ -1,9 +1,59 @@
+"""
+Admission results
+
+Published results are looked up by the public page through an in-process
+map {cle_recherche: result}, loaded with one query and shared by all
+requests of a worker. Every commit writing ResultatAdmission bumps the
+'resultats_admission' version, so each worker reloads the map on its next
+lookup: when results are published, the rush of visitors reads memory
+only, and spelling variations in accents, case, hyphens or spaces still
+find the result (see models.cle_recherche_admission).
+"""
+
+from collections import namedtuple
+from types import MappingProxyType
+
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
-from models import db, ResultatAdmission
+from models import db, ResultatAdmission, cle_recherche_admission
+from modules.cache import VersionCounter, VersionedCache, on_commit
+from modules.jobs import enqueue
+from modules.publication_resultats import publier_resultats
 from datetime import datetime
 
 resultats_admission_bp = Blueprint('resultats_admission', __name__, url_prefix='/admission')
 
+ResultatPublie = namedtuple('ResultatPublie', 'id type_examen nom_complet date_naissance statut')
+
+resultats_version = VersionCounter('resultats_admission')
+_cache = VersionedCache(resultats_version)
+
+
+@on_commit(ResultatAdmission)
+def _invalidate(changes):
+    resultats_version.bump()
+
+
+def _charger_publies():
+    publies = {}
+    # Oldest first: the latest result of a person wins
+    for cle, *valeurs in db.session.query(
+        ResultatAdmission.cle_recherche, ResultatAdmission.id, ResultatAdmission.type_examen,
+        ResultatAdmission.nom_complet, ResultatAdmission.date_naissance, ResultatAdmission.statut
+    ).filter(ResultatAdmission.publie == True).order_by(ResultatAdmission.date_soumission, ResultatAdmission.id):
+        publies[cle] = ResultatPublie(*valeurs)
+    return MappingProxyType(publies)
+
+
+def resultats_publies():
+    """Read-only map {cle_recherche: ResultatPublie} of the published results"""
+    return _cache.get('publies', _charger_publies)
+
+
+def chercher_resultat(nom_complet, date_naissance):
+    """Published result of a person, or None (no query while the results do not change)"""
+    return resultats_publies().get(cle_recherche_admission(nom_complet, date_naissance))
+
+
 # Route publique pour consulter les résultats d'admission
 @resultats_admission_bp.route('/', methods=['GET', 'POST'])
 def consulter():
@@ -15,12 +65,10 @@ def consulter():
         date_naissance = request.form.get('date_naissance', '').strip()
         
         if nom_complet and date_naissance:
-            # Rechercher le résultat (insensible à la casse)
-            resultat = ResultatAdmission.query.filter(
-                db.func.lower(ResultatAdmission.nom_complet) == nom_complet.lower(),
-                ResultatAdmission.date_naissance == datetime.strptime(date_naissance, '%Y-%m-%d').date(),
-                ResultatAdmission.publie == True
-            ).first()
+            try:
+                resultat = chercher_resultat(nom_complet, datetime.strptime(date_naissance, '%Y-%m-%d').date())
+            except ValueError:
+                flash('Format de date invalide.', 'error')
     
     return render_template('admission/consulter.html', resultat=resultat)
 
@@ -54,6 +102,41 @@ def admin_liste():
                          type_examen_actif=type_examen,
                          statut_actif=statut)
 
+@resultats_admission_bp.route('/admin/importer', methods=['GET', 'POST'])
+def admin_importer():
+    """Publication en masse des résultats d'un examen à partir d'un fichier CSV/XLSX"""
+    if 'user_id' not in session or session.get('user_role') not in ['admin', 'directeur']:
+        flash('Accès non autorisé', 'error')
+        return redirect(url_for('auth.login'))
+    
+    types_examen = [t for (t,) in db.session.query(ResultatAdmission.type_examen).distinct() if t]
+    rapport, job = None, None
+    
+    if request.method == 'POST':
+        fichier = request.files.get('fichier')
+        if not fichier or not fichier.filename:
+            flash('Veuillez choisir un fichier CSV ou XLSX.', 'error')
+            return redirect(url_for('resultats_admission.admin_importer'))
+        
+        rapport = publier_resultats(
+            fichier,
+            type_examen=request.form.get('type_examen') or None,
+            statut_defaut=request.form.get('statut') or None,
+            publier=bool(request.form.get('publie'))
+        )
+        if rapport.mis_a_jour:
+            flash(f'{rapport.mis_a_jour} résultat(s) mis à jour sur {rapport.lignes} ligne(s).', 'success')
+            if request.form.get('notifier'):
+                # Sent by a worker: the page does not wait for WhatsApp / SMTP
+                job = enqueue('resultats_admission.notifier', {'ids': rapport.ids}, cree_par=session.get('user_id'))
+        else:
+            flash('Aucun résultat mis à jour.', 'error')
+    
+    return render_template('admin/resultats_admission/importer.html',
+                         types_examen=types_examen,
+                         rapport=rapport,
+                         job=job)
+
 @resultats_admission_bp.route('/admin/<int:demande_id>')
 def admin_view(demande_id):
     """Voir les détails d'une demande d'admission"""
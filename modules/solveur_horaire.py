@@ -0,0 +1,219 @@
+"""
+Timetable solver
+
+Places the weekly hours of each teaching assignment on a grid of slots so
+that no class, teacher or room has two lessons at the same time and no
+teacher gets a slot they marked unavailable:
+
+    besoins = [Besoin(id=12, classe=3, professeur=7, salle='B2', heures=4), ...]
+    creneaux = [(jour, numero) for jour in range(5) for numero in range(8)]
+    solution = resoudre(besoins, creneaux, indisponibles={7: {(0, 0), (0, 1)}})
+    solution.placement   # {(12, 0): (1, 3), (12, 1): (3, 0), ...} lesson -> slot
+    solution.non_places  # lessons left out when no conflict-free placement was found
+
+A lesson is (assignment id, n) for n < heures. The engine has two phases:
+
+1. Construction with forward checking: every assignment keeps the set of
+   slots where its class, teacher and room are all still free. Placing a
+   lesson removes that slot from the sets of the assignments sharing one of
+   its resources, and the next assignment served is always the most
+   constrained one (fewest free slots for the hours it still needs). Among
+   its free slots, the one chosen spreads the course over the week and
+   takes as few free slots as possible from the other assignments.
+2. Min-conflicts repair, when an assignment has no free slot left: its
+   lesson goes to the slot of its domain with the fewest conflicting
+   lessons, which are taken out and served again; a short tabu keeps an
+   assignment from going straight back to the slot it was evicted from.
+
+Re-solving after a change starts from the previous placement (precedent):
+the lessons that are still valid keep their slot and only the others go
+through the two phases, so one change costs a handful of moves.
+
+This module only deals with ids and slots; loading the assignments and
+storing the result is done by modules/emploi_du_temps.py.
+"""
+
+import time
+import random
+from collections import namedtuple
+
+Besoin = namedtuple('Besoin', 'id classe professeur salle heures')
+Solution = namedtuple('Solution', 'placement non_places conserves iterations duree')
+
+# Penalty of a second lesson of the same course on the same day
+POIDS_MEME_JOUR = 50
+# Iterations during which an evicted assignment may not take back its slot
+DUREE_TABOU = 10
+
+
+def _ressources(besoin):
+    ressources = [('classe', besoin.classe), ('professeur', besoin.professeur)]
+    if besoin.salle:
+        ressources.append(('salle', besoin.salle))
+    return ressources
+
+
+class _Etat:
+    """Placement in progress, with the free slots of every assignment kept up to date"""
+
+    def __init__(self, besoins, creneaux, indisponibles):
+        self.besoins = {b.id: b for b in besoins}
+        self.ressources = {b.id: _ressources(b) for b in besoins}
+        self.domaines = {}
+        for besoin in besoins:
+            exclus = indisponibles.get(besoin.professeur, ())
+            self.domaines[besoin.id] = [c for c in creneaux if c not in exclus]
+        self.domaines_ens = {i: set(d) for i, d in self.domaines.items()}
+        self.libres = {i: set(d) for i, d in self.domaines.items()}
+
+        par_ressource = {}
+        for i, ressources in self.ressources.items():
+            for ressource in ressources:
+                par_ressource.setdefault(ressource, []).append(i)
+        self.voisins = {i: {v for r in ressources for v in par_ressource[r]}
+                        for i, ressources in self.ressources.items()}
+        self.occupe = {r: {} for r in par_ressource}
+        self.placement = {}
+        self.par_jour = {}
+
+    def conflits(self, besoin_id, creneau):
+        occupe = self.occupe
+        return {occupe[r][creneau] for r in self.ressources[besoin_id] if creneau in occupe[r]}
+
+    def placer(self, lecon, creneau):
+        besoin_id = lecon[0]
+        self.placement[lecon] = creneau
+        for ressource in self.ressources[besoin_id]:
+            self.occupe[ressource][creneau] = lecon
+        for voisin in self.voisins[besoin_id]:
+            self.libres[voisin].discard(creneau)
+        cle = (besoin_id, creneau[0])
+        self.par_jour[cle] = self.par_jour.get(cle, 0) + 1
+
+    def retirer(self, lecon):
+        besoin_id = lecon[0]
+        creneau = self.placement.pop(lecon)
+        for ressource in self.ressources[besoin_id]:
+            del self.occupe[ressource][creneau]
+        self.par_jour[(besoin_id, creneau[0])] -= 1
+        occupe = self.occupe
+        for voisin in self.voisins[besoin_id]:
+            if creneau in self.domaines_ens[voisin] and not any(creneau in occupe[r] for r in self.ressources[voisin]):
+                self.libres[voisin].add(creneau)
+        return creneau
+
+
+def resoudre(besoins, creneaux, indisponibles=None, precedent=None, max_iterations=None, graine=0):
+    """
+    Build a conflict-free weekly timetable
+
+    Args:
+        besoins (list): Besoin(id, classe, professeur, salle, heures) per teaching assignment
+        creneaux (list): Available slots, e.g. (jour, numero) tuples, in preference order
+        indisponibles (dict, optional): professeur -> set of slots they cannot teach
+        precedent (dict, optional): Previous placement, lesson -> slot, kept where still valid
+        max_iterations (int, optional): Bound on placements (default: 50 per lesson + 1000)
+        graine (int): Seed of the repair phase's tie-breaks (results are reproducible)
+
+    Returns:
+        Solution: placement (lesson -> slot), non_places (lessons without a slot),
+                  conserves (lessons kept from precedent), iterations, duree (seconds)
+    """
+    debut = time.monotonic()
+    besoins = [b for b in besoins if b.heures and b.heures > 0]
+    etat = _Etat(besoins, list(creneaux), indisponibles or {})
+    aleatoire = random.Random(graine)
+
+    # Lessons that can never be placed: more hours than slots in the domain
+    restant, impossibles = {}, []
+    for besoin in besoins:
+        possibles = min(besoin.heures, len(etat.domaines[besoin.id]))
+        restant[besoin.id] = [(besoin.id, n) for n in range(possibles)]
+        impossibles.extend((besoin.id, n) for n in range(possibles, besoin.heures))
+    lecons = [l for lecons_besoin in restant.values() for l in lecons_besoin]
+
+    conserves = 0
+    for lecon, creneau in sorted((precedent or {}).items()):
+        besoin_id = lecon[0]
+        if lecon not in restant.get(besoin_id, ()) or creneau not in etat.domaines_ens[besoin_id]:
+            continue
+        if etat.conflits(besoin_id, creneau):
+            continue
+        etat.placer(lecon, creneau)
+        restant[besoin_id].remove(lecon)
+        conserves += 1
+
+    en_attente = {i for i, lecons in restant.items() if lecons}
+    a_placer = sum(len(l) for l in restant.values())
+    if max_iterations is None:
+        max_iterations = 50 * a_placer + 1000
+    stagnation = max(1000, 2 * a_placer)
+    # Best placement seen: copied only before an eviction undoes it
+    meilleur, iteration_meilleure, a_sauver, sauvegarde = a_placer, 0, False, None
+    tabou = {}
+    iterations = 0
+    while en_attente and iterations < max_iterations and iterations - iteration_meilleure < stagnation:
+        iterations += 1
+        # Repairs wait until nothing else can be placed without conflict
+        besoin_id = min(en_attente, key=lambda i: (not etat.libres[i], len(etat.libres[i]) - len(restant[i]),
+                                                   -len(etat.voisins[i]), i))
+        lecon = restant[besoin_id].pop()
+        if not restant[besoin_id]:
+            en_attente.discard(besoin_id)
+
+        libres = etat.libres[besoin_id]
+        if libres:
+            voisins = [v for v in etat.voisins[besoin_id] if v != besoin_id and restant[v]]
+            creneau = min(libres, key=lambda c: (
+                etat.par_jour.get((besoin_id, c[0]), 0) * POIDS_MEME_JOUR
+                + sum(1 for v in voisins if c in etat.libres[v]),
+                c,
+            ))
+        else:
+            def cout(c):
+                penalite = len(etat.conflits(besoin_id, c))
+                if tabou.get((besoin_id, c), 0) > iterations:
+                    penalite += len(etat.domaines[besoin_id])
+                return (penalite, etat.par_jour.get((besoin_id, c[0]), 0), aleatoire.random())
+            creneau = min(etat.domaines[besoin_id], key=cout)
+            evincees = etat.conflits(besoin_id, creneau)
+            if evincees and a_sauver:
+                sauvegarde, a_sauver = dict(etat.placement), False
+            for evincee in evincees:
+                etat.retirer(evincee)
+                tabou[(evincee[0], creneau)] = iterations + DUREE_TABOU
+                restant[evincee[0]].append(evincee)
+                en_attente.add(evincee[0])
+            a_placer += len(evincees)
+        etat.placer(lecon, creneau)
+        a_placer -= 1
+        if a_placer < meilleur:
+            meilleur, iteration_meilleure, a_sauver = a_placer, iterations, True
+
+    placement = etat.placement
+    if a_placer > meilleur and sauvegarde is not None:
+        placement = sauvegarde
+    non_places = sorted(impossibles + [l for l in lecons if l not in placement])
+    return Solution(placement, non_places, conserves, iterations, time.monotonic() - debut)
+
+
+def verifier(besoins, placement, indisponibles=None):
+    """
+    Hard-constraint violations of a placement
+
+    Returns:
+        list: (lesson, lesson or None, reason) - empty for a valid timetable
+    """
+    par_id = {b.id: b for b in besoins}
+    indisponibles = indisponibles or {}
+    vus, violations = {}, []
+    for lecon, creneau in sorted(placement.items()):
+        besoin = par_id[lecon[0]]
+        if creneau in indisponibles.get(besoin.professeur, ()):
+            violations.append((lecon, None, 'professeur indisponible'))
+        for ressource in _ressources(besoin):
+            autre = vus.get((ressource, creneau))
+            if autre is not None:
+                violations.append((lecon, autre, f'{ressource[0]} déjà occupé(e)'))
+            vus[(ressource, creneau)] = lecon
+    return violations
@@ -0,0 +1,395 @@
+"""
+Sitemap and RSS/Atom feeds
+
+sitemap.xml and the articles / announcements feeds (RSS 2.0 and Atom) are
+static files in CACHE_DIR/syndication, served with ETag and Last-Modified:
+crawlers and feed readers get a file read (or a 304) instead of the list
+pages and their queries.
+
+They are kept up to date incrementally. Each source (articles, annonces)
+has a JSON index of its published entries; after a commit writing Article
+or Annonce, only the rows that changed are read back (one IN query) to
+update the index, then the files of that source and the sitemap are
+rewritten from the index. Bulk statements (unknown rows) and a missing
+index trigger a full rebuild, as does
+
+    flask flux regenerer
+
+Announcements expire: files generated on an earlier day are rendered
+again from the index (no query) on their first read of the day.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from datetime import date, datetime
+from email.utils import format_datetime
+from xml.sax.saxutils import escape, quoteattr
+
+import click
+from flask import Blueprint, Response, current_app, request, url_for, abort
+from flask.cli import AppGroup
+from sqlalchemy import select
+
+from models import db, Article, Annonce
+from modules.cache import VersionCounter, cache_dir, on_commit
+
+try:
+    import fcntl
+except ImportError:  # optional: no lock between processes (Windows)
+    fcntl = None
+
+logger = logging.getLogger('syndication')
+
+# Entries per feed (the sitemap lists every published row)
+TAILLE_FLUX = 50
+NOM_SITE = "École Presbytérale Saint Joseph de L'Asile"
+# Public pages listed in the sitemap besides articles and announcements
+PAGES = ('accueil', 'a_propos', 'programmes', 'equipe', 'evenements', 'admission', 'gallery',
+         'temoignages', 'contact', 'articles.liste', 'communication.annonces', 'resultats_admission.consulter')
+FICHIERS = {
+    'sitemap.xml': 'application/xml',
+    'articles.rss': 'application/rss+xml',
+    'articles.atom': 'application/atom+xml',
+    'annonces.rss': 'application/rss+xml',
+    'annonces.atom': 'application/atom+xml',
+}
+
+syndication_version = VersionCounter('syndication')
+# nom -> (version, body, etag) of the files last read by this worker
+_lus = {}
+_lock = threading.Lock()
+
+
+def _dossier():
+    path = os.path.join(cache_dir(), 'syndication')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class _Verrou:
+    """Exclusive lock between the processes updating the files"""
+
+    def __enter__(self):
+        self.f = open(os.path.join(_dossier(), '.verrou'), 'w')
+        if fcntl is not None:
+            fcntl.flock(self.f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.f, fcntl.LOCK_UN)
+        self.f.close()
+
+
+def _ecrire(nom, contenu):
+    """Atomic write; False (file untouched) when the content did not change"""
+    path = os.path.join(_dossier(), nom)
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == contenu:
+                return False
+    except FileNotFoundError:
+        pass
+    fd, tmp_path = tempfile.mkstemp(dir=_dossier(), prefix=f'.{nom}-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(contenu)
+    os.replace(tmp_path, path)  # readers never see a partial file
+    return True
+
+
+# ==================== ENTRIES ====================
+
+def _iso(valeur):
+    return valeur.isoformat() if valeur is not None else None
+
+
+def _entree_article(ligne):
+    return {
+        'titre': ligne.titre,
+        'lien': url_for('articles.details', slug=ligne.slug, _external=True),
+        'resume': ligne.description_courte or ligne.extrait or '',
+        'categorie': ligne.categorie,
+        'publie': _iso(ligne.date_creation),
+        'maj': _iso(ligne.date_modification or ligne.date_creation),
+    }
+
+
+def _entree_annonce(ligne):
+    return {
+        'titre': ligne.titre,
+        'lien': url_for('communication.details_annonce', annonce_id=ligne.id, _external=True),
+        'resume': ligne.extrait or (ligne.contenu or '')[:200],
+        'categorie': 'Important' if ligne.important else None,
+        'publie': _iso(ligne.date_creation),
+        'maj': _iso(ligne.date_creation),
+        'expire': _iso(ligne.date_expiration),
+    }
+
+
+# Source -> (table, published rows, entry builder, list page)
+SOURCES = {
+    'articles': (Article.__table__, lambda t: t.c.actif == True, _entree_article, 'articles.liste'),
+    'annonces': (Annonce.__table__, lambda t: t.c.public == True, _entree_annonce, 'communication.annonces'),
+}
+SOURCE_PAR_MODELE = {Article: 'articles', Annonce: 'annonces'}
+
+
+def _chemin_index(source):
+    return os.path.join(_dossier(), f'{source}.json')
+
+
+def _lire_index(source):
+    try:
+        with open(_chemin_index(source), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _mettre_a_jour_index(conn, source, ids=None):
+    """Read the rows of ids (all rows when None) into the source's index"""
+    table, publie, entree, _ = SOURCES[source]
+    index = _lire_index(source) if ids is not None else None
+    requete = select(table).where(publie(table))
+    if index is None:
+        index = {}
+    else:
+        ids = [i for i in ids if i is not None]
+        requete = requete.where(table.c.id.in_(ids))
+        for i in ids:
+            index.pop(str(i), None)  # deleted or unpublished rows stay out
+    for ligne in conn.execute(requete):
+        index[str(ligne.id)] = entree(ligne)
+    _ecrire(os.path.basename(_chemin_index(source)),
+            json.dumps(index, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+    return index
+
+
+def _visibles(index, jour):
+    entrees = [e for e in index.values() if not e.get('expire') or e['expire'] >= jour.isoformat()]
+    return sorted(entrees, key=lambda e: (e['publie'] or '', e['lien']), reverse=True)
+
+
+# ==================== RENDERING ====================
+
+def _date_rfc822(valeur):
+    return format_datetime(datetime.fromisoformat(valeur).astimezone())
+
+
+def _date_rfc3339(valeur):
+    return datetime.fromisoformat(valeur).astimezone().isoformat(timespec='seconds')
+
+
+def _rss(titre, lien, lien_flux, entrees):
+    items = []
+    for e in entrees[:TAILLE_FLUX]:
+        items.append(
+            f"<item><title>{escape(e['titre'])}</title><link>{escape(e['lien'])}</link>"
+            f"<guid isPermaLink=\"true\">{escape(e['lien'])}</guid>"
+            f"<description>{escape(e['resume'])}</description>"
+            + (f"<category>{escape(e['categorie'])}</category>" if e.get('categorie') else '')
+            + (f"<pubDate>{_date_rfc822(e['publie'])}</pubDate>" if e['publie'] else '')
+            + "</item>"
+        )
+    derniere = max((e['maj'] for e in entrees if e['maj']), default=None)
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom"><channel>'
+        f"<title>{escape(titre)}</title><link>{escape(lien)}</link>"
+        f"<description>{escape(titre)}</description><language>fr</language>"
+        f"<atom:link href={quoteattr(lien_flux)} rel=\"self\" type=\"application/rss+xml\"/>"
+        + (f"<lastBuildDate>{_date_rfc822(derniere)}</lastBuildDate>" if derniere else '')
+        + ''.join(items) + '</channel></rss>\n'
+    ).encode('utf-8')
+
+
+def _atom(titre, lien, lien_flux, entrees):
+    items = []
+    for e in entrees[:TAILLE_FLUX]:
+        items.append(
+            f"<entry><title>{escape(e['titre'])}</title><link href={quoteattr(e['lien'])}/>"
+            f"<id>{escape(e['lien'])}</id>"
+            f"<updated>{_date_rfc3339(e['maj'] or e['publie'])}</updated>"
+            + (f"<published>{_date_rfc3339(e['publie'])}</published>" if e['publie'] else '')
+            + f"<summary>{escape(e['resume'])}</summary>"
+            + (f"<category term={quoteattr(e['categorie'])}/>" if e.get('categorie') else '')
+            + "</entry>"
+        )
+    derniere = max((e['maj'] for e in entrees if e['maj']), default=None)
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<feed xmlns="http://www.w3.org/2005/Atom" xml:lang="fr">'
+        f"<title>{escape(titre)}</title><id>{escape(lien_flux)}</id>"
+        f"<link href={quoteattr(lien)}/><link href={quoteattr(lien_flux)} rel=\"self\"/>"
+        f"<author><name>{escape(NOM_SITE)}</name></author>"
+        f"<updated>{_date_rfc3339(derniere) if derniere else datetime.now().astimezone().isoformat(timespec='seconds')}</updated>"
+        + ''.join(items) + '</feed>\n'
+    ).encode('utf-8')
+
+
+def _sitemap(index_par_source, jour):
+    urls = [f"<url><loc>{escape(url_for(page, _external=True))}</loc></url>" for page in PAGES]
+    for index in index_par_source.values():
+        for e in _visibles(index, jour):
+            lastmod = f"<lastmod>{e['maj'][:10]}</lastmod>" if e['maj'] else ''
+            urls.append(f"<url><loc>{escape(e['lien'])}</loc>{lastmod}</url>")
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        + ''.join(urls) + '</urlset>\n'
+    ).encode('utf-8')
+
+
+TITRES = {'articles': 'Articles', 'annonces': 'Annonces'}
+
+
+def _rendre(sources, index_par_source):
+    """Write the feeds of sources and the sitemap; returns the names of the files that changed"""
+    jour = date.today()
+    ecrits = []
+    for source in sources:
+        entrees = _visibles(index_par_source[source], jour)
+        lien = url_for(SOURCES[source][3], _external=True)
+        titre = f"{TITRES[source]} - {NOM_SITE}"
+        for extension, rendu in (('rss', _rss), ('atom', _atom)):
+            nom = f'{source}.{extension}'
+            if _ecrire(nom, rendu(titre, lien, url_for('syndication.flux', nom=nom, _external=True), entrees)):
+                ecrits.append(nom)
+    if _ecrire('sitemap.xml', _sitemap(index_par_source, jour)):
+        ecrits.append('sitemap.xml')
+    return ecrits
+
+
+def _contexte():
+    # Absolute links use SITE_URL, whatever the request (or worker) that triggers the update
+    return current_app.test_request_context(base_url=current_app.config.get('SITE_URL') or 'http://localhost')
+
+
+def regenerer(changements=None):
+    """
+    Update the indexes and files
+
+    Args:
+        changements (dict, optional): {'articles': ids or None, 'annonces': ...};
+                                      None rebuilds everything from the database
+
+    Returns:
+        list: Names of the files rewritten
+    """
+    changements = changements if changements is not None else {source: None for source in SOURCES}
+    with _Verrou(), _contexte(), db.engine.connect() as conn:
+        index_par_source = {}
+        for source in SOURCES:
+            if source in changements:
+                ids = changements[source]
+                index_par_source[source] = _mettre_a_jour_index(conn, source, None if ids is None or None in ids else ids)
+            else:
+                index_par_source[source] = _lire_index(source)
+                if index_par_source[source] is None:
+                    changements[source] = None
+                    index_par_source[source] = _mettre_a_jour_index(conn, source)
+        ecrits = _rendre(list(changements), index_par_source)
+    if ecrits:
+        syndication_version.bump()
+        logger.info(f"Fichiers de syndication mis à jour: {', '.join(ecrits)}")
+    return ecrits
+
+
+def _rendre_du_jour():
+    """Render again from the indexes (no query), for the announcements that expired"""
+    with _Verrou(), _contexte():
+        index_par_source = {source: _lire_index(source) for source in SOURCES}
+        if any(index is None for index in index_par_source.values()):
+            return None
+        ecrits = _rendre(list(SOURCES), index_par_source)
+        for nom in FICHIERS:
+            os.utime(os.path.join(_dossier(), nom))  # generated today, changed or not
+    if ecrits:
+        syndication_version.bump()
+    return ecrits
+
+
+@on_commit(Article, Annonce)
+def _regenerer_on_commit(changes):
+    # The session cannot query inside after_commit: regenerer() uses its own connection
+    changements = {}
+    for model, ids in changes.items():
+        for mapped, source in SOURCE_PAR_MODELE.items():
+            if issubclass(model, mapped):
+                changements.setdefault(source, set()).update(ids)
+    regenerer(changements)
+
+
+# ==================== SERVING ====================
+
+def lire(nom):
+    """
+    A syndication file
+
+    Returns:
+        tuple: (body as bytes, etag, last_modified datetime)
+    """
+    path = os.path.join(_dossier(), nom)
+    version = syndication_version.current()
+    lu = _lus.get(nom)
+    try:
+        modifie = datetime.fromtimestamp(os.stat(path).st_mtime)
+    except FileNotFoundError:
+        regenerer()
+        return lire(nom)
+    if modifie.date() < date.today():
+        if _rendre_du_jour() is None:
+            regenerer()
+        version = syndication_version.current()
+        modifie = datetime.fromtimestamp(os.stat(path).st_mtime)
+    if lu is not None and lu[0] == version:
+        return lu[1], lu[2], modifie
+    with open(path, 'rb') as f:
+        body = f.read()
+    etag = hashlib.sha1(body).hexdigest()[:16]
+    with _lock:
+        _lus[nom] = (version, body, etag)
+    return body, etag, modifie
+
+
+syndication_bp = Blueprint('syndication', __name__)
+
+
+def _servir(nom):
+    body, etag, modifie = lire(nom)
+    response = Response(body, mimetype=FICHIERS[nom])
+    response.set_etag(etag)
+    response.last_modified = modifie
+    response.cache_control.public = True
+    response.cache_control.max_age = 300
+    return response.make_conditional(request)
+
+
+@syndication_bp.route('/sitemap.xml')
+def sitemap():
+    """Plan du site (fichier pré-calculé)"""
+    return _servir('sitemap.xml')
+
+
+@syndication_bp.route('/flux/<nom>')
+def flux(nom):
+    """Flux RSS/Atom des articles et des annonces (fichiers pré-calculés)"""
+    if nom not in FICHIERS or nom == 'sitemap.xml':
+        abort(404)
+    return _servir(nom)
+
+
+# ==================== CLI ====================
+
+flux_cli = AppGroup('flux', help='Plan du site et flux RSS/Atom')
+
+
+@flux_cli.command('regenerer')
+def regenerer_command():
+    """Reconstruit le plan du site et les flux depuis la base"""
+    ecrits = regenerer()
+    click.echo(f"{len(ecrits)} fichier(s) mis à jour dans {_dossier()}")
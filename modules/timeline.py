@@ -0,0 +1,266 @@
+"""
+Student activity timeline
+
+Merges a student's presences, grades, payments, documents and complaints
+into one stream, most recent first, paginated with an opaque cursor:
+
+    page = timeline.page(eleve, limite=30)
+    page.activites         # list of Activite
+    page.curseur_suivant   # None on the last page
+
+Each source is read with a keyset query (WHERE (date, id) < cursor ORDER BY
+date DESC, id DESC LIMIT n) served by an (eleve_id, date, id) index, and
+the sorted results are combined with heapq.merge. A page therefore costs
+one short index range scan per source, however far back the reader
+has scrolled.
+
+Doléances carry no student id (they are submitted from the public form):
+they are matched on the student's full name and only shown to staff.
+
+Closed school years are opt-in: page(eleve, annee='2023-2024') reads the
+presences, grades and payments of that year from its archive file
+(modules/archivage_annuel.py), with the same keyset pagination.
+"""
+
+import json
+import heapq
+import base64
+from collections import namedtuple
+from datetime import datetime, time
+
+from sqlalchemy import and_, or_, func, select
+
+from models import db, Presence, Note, Paiement, Document, Doleance, Cours, Frais
+from modules import reference_data
+from modules.archivage_annuel import session_archive, table_archive
+
+Activite = namedtuple('Activite', 'type id moment titre details')
+Page = namedtuple('Page', 'activites curseur_suivant')
+
+LIMITE_MAX = 100
+
+
+def _moment(valeur):
+    """Common sort key: dates sort at the start of their day"""
+    if isinstance(valeur, datetime):
+        return valeur
+    return datetime.combine(valeur, time.min)
+
+
+def _avant(colonne, colonne_id, type_, curseur, jour_seulement):
+    """
+    Keyset condition: rows of this source that sort strictly after the cursor
+    (descending order on moment, type, id)
+    """
+    if curseur is None:
+        return None
+    moment, type_curseur, id_curseur = curseur
+    if jour_seulement:
+        if moment.time() != time.min:
+            # Every row of that day sorts at midnight, before the cursor
+            return colonne <= moment.date()
+        borne = moment.date()
+    else:
+        borne = moment
+    if type_ < type_curseur:
+        return colonne <= borne
+    if type_ > type_curseur:
+        return colonne < borne
+    return or_(colonne < borne, and_(colonne == borne, colonne_id < id_curseur))
+
+
+# ==================== SOURCES ====================
+# Each source returns at most `limite` Activite sorted by (moment, id) descending
+
+def _archive(annee, model, type_, eleve, curseur, limite, *colonnes):
+    """Rows of a closed year, read from its archive file with the same keyset query"""
+    table = table_archive(model)
+    requete = select(*[table.c[c] for c in colonnes]).where(table.c.eleve_id == eleve.id)
+    condition = _avant(table.c.date, table.c.id, type_, curseur, True)
+    if condition is not None:
+        requete = requete.where(condition)
+    with session_archive(annee) as archive:
+        return archive.execute(requete.order_by(table.c.date.desc(), table.c.id.desc()).limit(limite)).all()
+
+
+def _nom_cours(cours_id):
+    cours = reference_data.snapshot().cours_par_id.get(cours_id)
+    return cours.nom if cours else 'Cours supprimé'
+
+
+def _presences(eleve, curseur, limite, annee=None):
+    if annee:
+        lignes = [(id_, jour, statut, notes, _nom_cours(cours_id)) for id_, jour, statut, notes, cours_id in
+                  _archive(annee, Presence, 'presence', eleve, curseur, limite, 'id', 'date', 'statut', 'notes', 'cours_id')]
+    else:
+        condition = _avant(Presence.date, Presence.id, 'presence', curseur, True)
+        query = db.session.query(Presence.id, Presence.date, Presence.statut, Presence.notes, Cours.nom).join(
+            Cours, Cours.id == Presence.cours_id
+        ).filter(Presence.eleve_id == eleve.id)
+        if condition is not None:
+            query = query.filter(condition)
+        lignes = query.order_by(Presence.date.desc(), Presence.id.desc()).limit(limite)
+    for id_, jour, statut, notes, cours in lignes:
+        yield Activite('presence', id_, _moment(jour), cours,
+                       {'date': jour.isoformat(), 'cours': cours, 'statut': statut, 'notes': notes})
+
+
+def _notes(eleve, curseur, limite, annee=None):
+    if annee:
+        lignes = [(id_, jour, valeur, sur, type_, trimestre, commentaire, _nom_cours(cours_id))
+                  for id_, jour, valeur, sur, type_, trimestre, commentaire, cours_id in
+                  _archive(annee, Note, 'note', eleve, curseur, limite,
+                           'id', 'date', 'valeur', 'sur', 'type', 'trimestre', 'commentaire', 'cours_id')]
+    else:
+        condition = _avant(Note.date, Note.id, 'note', curseur, True)
+        query = db.session.query(
+            Note.id, Note.date, Note.valeur, Note.sur, Note.type, Note.trimestre, Note.commentaire, Cours.nom
+        ).join(Cours, Cours.id == Note.cours_id).filter(Note.eleve_id == eleve.id)
+        if condition is not None:
+            query = query.filter(condition)
+        lignes = query.order_by(Note.date.desc(), Note.id.desc()).limit(limite)
+    for id_, jour, valeur, sur, type_, trimestre, commentaire, cours in lignes:
+        yield Activite('note', id_, _moment(jour), cours,
+                       {'date': jour.isoformat(), 'cours': cours, 'valeur': valeur, 'sur': sur,
+                        'type': type_, 'trimestre': trimestre, 'commentaire': commentaire})
+
+
+def _paiements(eleve, curseur, limite, annee=None):
+    if annee:
+        # Fees are not archived: their names are read from the main database
+        archivees = _archive(annee, Paiement, 'paiement', eleve, curseur, limite,
+                             'id', 'date', 'montant', 'methode', 'reference', 'frais_id')
+        frais = dict(db.session.query(Frais.id, Frais.type).filter(
+            Frais.id.in_({ligne.frais_id for ligne in archivees}))) if archivees else {}
+        lignes = [(id_, jour, montant, methode, reference, frais.get(frais_id))
+                  for id_, jour, montant, methode, reference, frais_id in archivees]
+    else:
+        condition = _avant(Paiement.date, Paiement.id, 'paiement', curseur, True)
+        query = db.session.query(
+            Paiement.id, Paiement.date, Paiement.montant, Paiement.methode, Paiement.reference, Frais.type
+        ).outerjoin(Frais, Frais.id == Paiement.frais_id).filter(Paiement.eleve_id == eleve.id)
+        if condition is not None:
+            query = query.filter(condition)
+        lignes = query.order_by(Paiement.date.desc(), Paiement.id.desc()).limit(limite)
+    for id_, jour, montant, methode, reference, frais in lignes:
+        yield Activite('paiement', id_, _moment(jour), frais or 'Paiement',
+                       {'date': jour.isoformat(), 'montant': montant, 'methode': methode,
+                        'reference': reference, 'frais': frais})
+
+
+def _documents(eleve, curseur, limite):
+    condition = _avant(Document.date_creation, Document.id, 'document', curseur, False)
+    query = db.session.query(
+        Document.id, Document.date_creation, Document.titre, Document.type, Document.fichier
+    ).filter(Document.eleve_id == eleve.id, Document.date_creation.isnot(None))
+    if condition is not None:
+        query = query.filter(condition)
+    for id_, moment, titre, type_, fichier in query.order_by(
+            Document.date_creation.desc(), Document.id.desc()).limit(limite):
+        yield Activite('document', id_, moment, titre,
+                       {'date': moment.isoformat(), 'type': type_, 'fichier': fichier})
+
+
+def _doleances(eleve, curseur, limite):
+    noms = {f'{eleve.prenom} {eleve.nom}'.lower(), f'{eleve.nom} {eleve.prenom}'.lower()}
+    condition = _avant(Doleance.date_soumission, Doleance.id, 'doleance', curseur, False)
+    query = db.session.query(
+        Doleance.id, Doleance.date_soumission, Doleance.statut, Doleance.description
+    ).filter(func.lower(Doleance.nom_complet_eleve).in_(noms), Doleance.date_soumission.isnot(None))
+    if condition is not None:
+        query = query.filter(condition)
+    for id_, moment, statut, description in query.order_by(
+            Doleance.date_soumission.desc(), Doleance.id.desc()).limit(limite):
+        yield Activite('doleance', id_, moment, 'Doléance',
+                       {'date': moment.isoformat(), 'statut': statut, 'description': description})
+
+
+SOURCES = {
+    'presence': _presences,
+    'note': _notes,
+    'paiement': _paiements,
+    'document': _documents,
+    'doleance': _doleances,
+}
+# Visible to parents (their own children only) and to teachers; everything to admin/directeur
+SOURCES_PARENT = ('presence', 'note', 'paiement', 'document')
+SOURCES_PROFESSEUR = ('presence', 'note')
+# Sources moved to the yearly archive files when a year is closed
+SOURCES_ARCHIVEES = ('presence', 'note', 'paiement')
+
+
+# ==================== CURSOR ====================
+
+def encoder_curseur(activite):
+    """Opaque cursor pointing after an activity"""
+    brut = json.dumps([activite.moment.isoformat(), activite.type, activite.id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(brut.encode()).decode().rstrip('=')
+
+
+def decoder_curseur(curseur):
+    """
+    Decode a cursor from encoder_curseur()
+
+    Raises:
+        ValueError: Malformed cursor
+    """
+    try:
+        brut = base64.urlsafe_b64decode(curseur + '=' * (-len(curseur) % 4))
+        moment, type_, id_ = json.loads(brut)
+        return datetime.fromisoformat(moment), str(type_), int(id_)
+    except Exception:
+        raise ValueError('Curseur invalide')
+
+
+# ==================== PAGE ====================
+
+def page(eleve, curseur=None, limite=30, types=None, annee=None):
+    """
+    One page of a student's timeline
+
+    Args:
+        eleve (Eleve): The student
+        curseur (str, optional): curseur_suivant of the previous page
+        limite (int): Activities per page (capped at LIMITE_MAX)
+        types (iterable, optional): Sources to include (default: all)
+        annee (str, optional): Closed school year to read from its archive
+                               (only the archived sources are shown)
+
+    Returns:
+        Page: activites and curseur_suivant (None when there is nothing older)
+
+    Raises:
+        ValueError: Malformed cursor or year
+        LookupError: The year was never archived
+    """
+    limite = max(1, min(int(limite), LIMITE_MAX))
+    position = decoder_curseur(curseur) if curseur else None
+    if annee:
+        flux = [SOURCES[t](eleve, position, limite + 1, annee=annee)
+                for t in (types or SOURCES) if t in SOURCES_ARCHIVEES]
+    else:
+        flux = [SOURCES[t](eleve, position, limite + 1) for t in (types or SOURCES) if t in SOURCES]
+
+    cle = lambda a: (a.moment, a.type, a.id)
+    activites = []
+    for activite in heapq.merge(*flux, key=cle, reverse=True):
+        activites.append(activite)
+        if len(activites) > limite:
+            break
+
+    suivant = None
+    if len(activites) > limite:
+        activites = activites[:limite]
+        suivant = encoder_curseur(activites[-1])
+    return Page(activites, suivant)
+
+
+def to_dict(activite):
+    """JSON-serialisable form of an Activite"""
+    return {
+        'type': activite.type,
+        'id': activite.id,
+        'date': activite.moment.isoformat(),
+        'titre': activite.titre,
+        'details': activite.details,
+    }
@@ -0,0 +1,110 @@
+"""
+User identity cache
+
+Flask-Login calls load_user() at the start of every authenticated request.
+Instead of loading a full User instance each time, the identity fields are
+kept here as a small slotted CachedUser, per worker, for USER_CACHE_TTL
+seconds. Any commit writing the users table (role, actif, password, ...)
+bumps the 'users' version so every worker reloads on the next request; the
+TTL bounds staleness for writes made outside the ORM (scripts, sqlite3 shell).
+
+Usage:
+    @login_manager.user_loader
+    def load_user(user_id):
+        return user_cache.load_user(user_id)
+"""
+
+from config import Config
+from models import db, User
+from modules.cache import VersionCounter, VersionedCache, on_commit
+
+
+class CachedUser:
+    """
+    Read-only snapshot of a User row, usable as Flask-Login's current_user
+
+    Routes that need to modify the account load the ORM instance with
+    User.query.get(current_user.id).
+    """
+    __slots__ = ('id', 'username', 'email', 'nom', 'prenom', 'role', 'actif')
+
+    def __init__(self, id, username, email, nom, prenom, role, actif):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.nom = nom
+        self.prenom = prenom
+        self.role = role
+        self.actif = actif
+
+    @property
+    def is_active(self):
+        # NULL (older rows) counts as active, like the column default
+        return self.actif is not False
+
+    @property
+    def is_authenticated(self):
+        return True
+
+    @property
+    def is_anonymous(self):
+        return False
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        if isinstance(other, (CachedUser, User)):
+            return self.id == other.id
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f'<CachedUser {self.username}>'
+
+
+users_version = VersionCounter('users')
+_cache = VersionedCache(users_version, ttl=Config.USER_CACHE_TTL)
+
+
+@on_commit(User)
+def _invalidate(changes):
+    users_version.bump()
+
+
+def _fetch(user_id):
+    row = db.session.query(
+        User.id, User.username, User.email, User.nom, User.prenom, User.role, User.actif
+    ).filter(User.id == user_id).first()
+    return CachedUser(*row) if row else None
+
+
+def get_user(user_id):
+    """
+    Return the CachedUser for an id, or None if the user does not exist
+
+    Args:
+        user_id (int|str): User id as stored in the session
+    """
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    return _cache.get(user_id, lambda: _fetch(user_id))
+
+
+def load_user(user_id):
+    """Flask-Login user loader: the cached identity, or None if unknown or deactivated"""
+    user = get_user(user_id)
+    if user is None or not user.is_active:
+        return None
+    return user
+
+
+def invalidate(user_id=None):
+    """Force a reload of one user (or all users) in every worker"""
+    if user_id is not None:
+        _cache.invalidate(int(user_id))
+    users_version.bump()
@@ -13,6 +13,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger('whatsapp_notifications')
 
+# Seconds before giving up on the API (connect and read)
+API_TIMEOUT = 15
+
 class WhatsAppNotifier:
     """
     Class to handle sending WhatsApp notifications via Wasender API
@@ -83,55 +86,71 @@ class WhatsAppNotifier:
         
         # Send to each recipient
         for phone in recipients:
-            try:
-                # Format the phone number if needed (ensure it has country code)
-                formatted_phone = self._format_phone_number(phone)
-                
-                # Prepare the request
-                headers = {
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                }
-                
-                payload = {
-                    "to": formatted_phone,
-                    "text": message
-                }
-                
-                # Send the message
-                response = requests.post(
-                    self.api_url,
-                    headers=headers,
-                    json=payload
-                )
-                
-                response.raise_for_status()  # Raise exception for HTTP errors
-                response_data = response.json()
-                
-                # Log and store the result
-                message_id = response_data.get('id', 'unknown')
-                logger.info(f"Message sent to {formatted_phone}, ID: {message_id}")
-                results[phone] = {
-                    "success": True,
-                    "message_id": message_id,
-                    "response": response_data
-                }
-                
-            except requests.exceptions.RequestException as e:
-                logger.error(f"API Error sending to {phone}: {str(e)}")
-                results[phone] = {
-                    "success": False,
-                    "error": str(e)
-                }
-            except Exception as e:
-                logger.error(f"Error sending to {phone}: {str(e)}")
-                results[phone] = {
-                    "success": False,
-                    "error": str(e)
-                }
+            results[phone] = self.send_message(phone, message)
         
         return results
     
+    def send_message(self, phone, message):
+        """
+        Send a text message to one phone number
+        
+        Args:
+            phone (str): Phone number, with or without country code
+            message (str): Text of the message
+        
+        Returns:
+            dict: {"success": True, "message_id": ..., "response": ...} or {"success": False, "error": ...}
+        """
+        if not self.is_configured():
+            return {"success": False, "error": "WhatsApp notifier not configured"}
+        try:
+            # Format the phone number if needed (ensure it has country code)
+            formatted_phone = self._format_phone_number(phone)
+            
+            # Prepare the request
+            headers = {
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            }
+            
+            payload = {
+                "to": formatted_phone,
+                "text": message
+            }
+            
+            # Send the message
+            response = requests.post(
+                self.api_url,
+                headers=headers,
+                json=payload,
+                timeout=API_TIMEOUT
+            )
+            
+            response.raise_for_status()  # Raise exception for HTTP errors
+            response_data = response.json()
+            
+            # Log and return the result
+            message_id = response_data.get('id', 'unknown')
+            logger.info(f"Message sent to {formatted_phone}, ID: {message_id}")
+            return {
+                "success": True,
+                "message_id": message_id,
+                "response": response_data
+            }
+            
+        except requests.exceptions.RequestException as e:
+            logger.error(f"API Error sending to {phone}: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+        except Exception as e:
+            logger.error(f"Error sending to {phone}: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
     def _format_announcement_message(self, announcement):
         """Format the announcement into a WhatsApp message"""
         # Create a nicely formatted message with the announcement details
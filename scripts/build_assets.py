@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Build the fingerprinted, pre-compressed copy of static/ (see modules/assets.py).
+
+Run at each deploy, before restarting the workers:
+    python scripts/build_assets.py
+"""
+
+import sys
+import os
+
+# Add the parent directory to sys.path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.assets import build, brotli, DIST_DIR, MANIFEST_NAME
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+
+
+def main():
+    manifest = build(STATIC_FOLDER)
+    compressed = sum(1 for entry in manifest.values() if entry['encodings'])
+    print(f"{len(manifest)} fichier(s) publiés dans static/{DIST_DIR}, {compressed} pré-compressé(s)")
+    if brotli is None:
+        print("Module 'brotli' absent: variantes gzip uniquement")
+    print(f"Manifeste: static/{DIST_DIR}/{MANIFEST_NAME}")
+
+
+if __name__ == '__main__':
+    main()
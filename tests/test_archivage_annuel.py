@@ -0,0 +1,55 @@
+import os
+import tempfile
+from datetime import date, timedelta
+
+import pytest
+
+_tmp = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp, 'archivage.db')
+os.environ['CACHE_DIR'] = os.path.join(_tmp, 'cache')
+
+from app import app  # noqa: E402
+from models import db, User, Classe, Eleve, Frais, Paiement  # noqa: E402
+from modules.archivage_annuel import bornes, cloturer, debut_annee_scolaire, session_archive  # noqa: E402
+
+DEBUT_ANNEE = debut_annee_scolaire().year
+ANNEE_CLOSE = f'{DEBUT_ANNEE - 1}-{DEBUT_ANNEE}'
+
+
+@pytest.fixture
+def eleve():
+    app.config.update(TESTING=True, AUDIT_DELAI=0, ARCHIVES_ANNUELLES_DIR=os.path.join(_tmp, 'archives'))
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        caissier = User(username='caisse', email='caisse@example.com', password_hash='x', nom='Caisse', prenom='C',
+                        role='admin')
+        classe = Classe(nom='6eA', niveau='6e', annee_scolaire=ANNEE_CLOSE)
+        db.session.add_all([caissier, classe])
+        db.session.flush()
+        eleve = Eleve(matricule='E001', nom='Joseph', prenom='Anne', date_naissance=date(2012, 1, 1),
+                      lieu_naissance='Jacmel', sexe='F', adresse='Rue 1', classe_id=classe.id)
+        db.session.add(eleve)
+        db.session.commit()
+        yield eleve.id, caissier.id
+
+
+def test_paiements_archives_selon_l_annee_des_frais(eleve):
+    eleve_id, caissier_id = eleve
+    _, fin = bornes(ANNEE_CLOSE)
+    anciens = Frais(type='Scolarité', montant=100, annee_scolaire=str(DEBUT_ANNEE - 1))
+    courants = Frais(type='Scolarité', montant=120, annee_scolaire=str(date.today().year))
+    db.session.add_all([anciens, courants])
+    db.session.flush()
+    # Both paid before the end of the closed year; only the old fee's payment leaves
+    for frais, reference in ((anciens, 'ANCIEN'), (courants, 'AVANCE')):
+        db.session.add(Paiement(eleve_id=eleve_id, montant=frais.montant, frais_id=frais.id, methode='espèces',
+                                reference=reference, date=fin - timedelta(days=30), recu_par=caissier_id))
+    db.session.commit()
+
+    resultat = cloturer(ANNEE_CLOSE)
+
+    assert resultat['paiements'] == 1
+    assert [p.reference for p in Paiement.query.all()] == ['AVANCE']
+    with session_archive(ANNEE_CLOSE) as s:
+        assert [p.reference for p in s.query(Paiement)] == ['ANCIEN']
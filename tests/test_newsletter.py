@@ -0,0 +1,120 @@
+import os
+import smtplib
+import tempfile
+import threading
+
+import pytest
+
+_tmp = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp, 'newsletter.db')
+os.environ['CACHE_DIR'] = os.path.join(_tmp, 'cache')
+
+from app import app  # noqa: E402
+from models import db, Newsletter, CampagneNewsletter  # noqa: E402
+from modules.newsletter import ServeurIndisponible, envoyer_campagne, lire_jeton  # noqa: E402
+
+
+class FakeSMTP:
+    """Local SMTP stand-in: records messages, rejects addresses listed in `refus`"""
+    lock = threading.Lock()
+    envoyes = []
+    connexions = 0
+    refus = {}
+
+    def __init__(self):
+        with FakeSMTP.lock:
+            FakeSMTP.connexions += 1
+
+    def send_message(self, msg, to_addrs):
+        email = to_addrs[0]
+        if email in self.refus:
+            code = self.refus[email]
+            raise smtplib.SMTPRecipientsRefused({email: (code, b'refused')})
+        with FakeSMTP.lock:
+            FakeSMTP.envoyes.append(msg)
+
+    def rset(self):
+        pass
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture
+def abonnes():
+    app.config.update(TESTING=True, NEWSLETTER_DEBIT=0, NEWSLETTER_SMTP_CONNEXIONS=2,
+                      NEWSLETTER_MESSAGES_PAR_CONNEXION=10, SITE_URL='https://ecole.example')
+    FakeSMTP.envoyes, FakeSMTP.connexions, FakeSMTP.refus = [], 0, {}
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add_all([Newsletter(email=f'abonne{i}@example.com') for i in range(25)])
+        db.session.add(Newsletter(email='ancien@example.com', actif=False))
+        campagne = CampagneNewsletter(sujet='Rentrée', contenu='Bonne rentrée à tous')
+        db.session.add(campagne)
+        db.session.commit()
+        yield campagne.id
+
+
+def test_campagne_envoyee_aux_abonnes_actifs(abonnes):
+    compteurs = envoyer_campagne(abonnes, smtp_factory=FakeSMTP)
+
+    assert compteurs == {'envoyes': 25, 'rebonds': 0, 'echecs': 0}
+    assert FakeSMTP.connexions <= 4  # 2 connections, recycled every 10 messages
+    assert 'ancien@example.com' not in {m['To'] for m in FakeSMTP.envoyes}
+
+    msg = FakeSMTP.envoyes[0]
+    lien = msg['List-Unsubscribe'].strip('<>')
+    assert lien.startswith('https://ecole.example/newsletter/desabonnement/')
+    abonne = Newsletter.query.filter_by(email=msg['To']).one()
+    assert lire_jeton(lien.rsplit('/', 1)[1]) == abonne.id
+    assert lien in msg.get_body(('html',)).get_content()
+    assert Newsletter.query.filter_by(derniere_campagne_id=abonnes).count() == 25
+
+
+def test_rebonds_et_echecs_temporaires(abonnes):
+    FakeSMTP.refus = {'abonne1@example.com': 550, 'abonne2@example.com': 451}
+
+    compteurs = envoyer_campagne(abonnes, smtp_factory=FakeSMTP)
+    assert compteurs == {'envoyes': 23, 'rebonds': 1, 'echecs': 1}
+
+    rejete = Newsletter.query.filter_by(email='abonne1@example.com').one()
+    assert not rejete.actif and rejete.motif_desactivation == 'rebond'
+    temporaire = Newsletter.query.filter_by(email='abonne2@example.com').one()
+    assert temporaire.actif and temporaire.nombre_echecs == 1
+
+    # A second pass only retries the temporary failure
+    FakeSMTP.refus, FakeSMTP.envoyes = {}, []
+    assert envoyer_campagne(abonnes, smtp_factory=FakeSMTP) == {'envoyes': 1, 'rebonds': 0, 'echecs': 0}
+    assert [m['To'] for m in FakeSMTP.envoyes] == ['abonne2@example.com']
+
+
+def test_serveur_indisponible_ne_desactive_personne(abonnes):
+    tentatives = []
+
+    def hors_service():
+        tentatives.append(1)
+        raise smtplib.SMTPAuthenticationError(535, b'authentication failed')
+
+    for _ in range(4):
+        with pytest.raises(ServeurIndisponible):
+            envoyer_campagne(abonnes, smtp_factory=hors_service)
+
+    assert len(tentatives) <= 4 * 2  # at most one attempt per connection and pass
+    assert Newsletter.query.filter_by(actif=True).count() == 25
+    assert Newsletter.query.filter(Newsletter.nombre_echecs > 0).count() == 0
+
+    # Once the server is back, everybody gets the campaign
+    assert envoyer_campagne(abonnes, smtp_factory=FakeSMTP) == {'envoyes': 25, 'rebonds': 0, 'echecs': 0}
+
+
+def test_desabonnement_en_un_clic(abonnes):
+    envoyer_campagne(abonnes, smtp_factory=FakeSMTP)
+    msg = FakeSMTP.envoyes[0]
+    chemin = msg['List-Unsubscribe'].strip('<>').replace('https://ecole.example', '')
+
+    reponse = app.test_client().post(chemin, data={'List-Unsubscribe': 'One-Click'})
+    assert reponse.status_code == 204
+    abonne = Newsletter.query.filter_by(email=msg['To']).one()
+    assert not abonne.actif and abonne.motif_desactivation == 'desabonnement'
+    assert app.test_client().get('/newsletter/desabonnement/invalide').status_code == 404
@@ -0,0 +1,58 @@
+from modules.solveur_horaire import Besoin, resoudre, verifier
+
+CRENEAUX = [(jour, numero) for numero in range(8) for jour in range(5)]
+
+
+def ecole(classes=6, professeurs=8, heures=(4, 4, 3, 3, 3, 2, 2, 2, 2, 2, 2, 2)):
+    """`classes` classes with one room each, subjects spread over the teachers"""
+    besoins = []
+    for classe in range(classes):
+        for matiere, nombre in enumerate(heures):
+            besoins.append(Besoin(id=len(besoins) + 1, classe=classe, professeur=(classe + matiere) % professeurs,
+                                  salle=f'S{classe}', heures=nombre))
+    return besoins
+
+
+def test_places_every_lesson_without_conflict():
+    besoins = ecole()
+    solution = resoudre(besoins, CRENEAUX)
+
+    assert solution.non_places == []
+    assert len(solution.placement) == sum(b.heures for b in besoins)
+    assert verifier(besoins, solution.placement) == []
+
+
+def test_respects_teacher_unavailability():
+    besoins = ecole()
+    indisponibles = {0: {(0, n) for n in range(8)}, 3: {(j, 0) for j in range(5)}}
+    solution = resoudre(besoins, CRENEAUX, indisponibles)
+
+    assert solution.non_places == []
+    assert verifier(besoins, solution.placement, indisponibles) == []
+
+
+def test_resolving_after_a_change_keeps_most_lessons():
+    besoins = ecole()
+    premiere = resoudre(besoins, CRENEAUX)
+    lecon, creneau = next(iter(premiere.placement.items()))
+    professeur = besoins[lecon[0] - 1].professeur
+    indisponibles = {professeur: {creneau}}
+
+    seconde = resoudre(besoins, CRENEAUX, indisponibles, precedent=premiere.placement)
+
+    assert seconde.non_places == []
+    assert verifier(besoins, seconde.placement, indisponibles) == []
+    deplacees = sum(1 for l, c in seconde.placement.items() if premiere.placement.get(l) != c)
+    assert seconde.conserves >= len(premiere.placement) - 1
+    assert deplacees <= 10
+
+
+def test_reports_lessons_that_cannot_be_placed():
+    # One teacher, two classes, 6 + 6 hours on a 10-slot week
+    besoins = [Besoin(1, 'A', 'P', None, 6), Besoin(2, 'B', 'P', None, 6)]
+    creneaux = [(jour, numero) for numero in range(2) for jour in range(5)]
+    solution = resoudre(besoins, creneaux)
+
+    assert len(solution.placement) == 10
+    assert len(solution.non_places) == 2
+    assert verifier(besoins, solution.placement) == []